@@ -0,0 +1,114 @@
+import math
+from datetime import timedelta
+import numpy as np
+from instance_ana import InstanceData
+
+
+def _average_groups(values: list[float], factor: int) -> list[float]:
+    """
+    :return: Mean of each group of factor consecutive values (the last group may be shorter)
+    """
+    return [float(np.mean(values[k:k + factor])) for k in range(0, len(values), factor)]
+
+
+def _pad(values: list[float], length: int) -> list[float]:
+    """
+    :return: The values, extended with the last one up to the given length
+    """
+    return values + values[-1:] * (length - len(values))
+
+
+def _coarse_lags(lags: list[int], factor: int) -> list[int]:
+    """
+    :return: Lags expressed in coarse time steps, rounded up and without repetitions, in the original order
+    """
+    coarse = []
+    for lag in lags:
+        lag = math.ceil(lag / factor)
+        if lag not in coarse:
+            coarse.append(lag)
+    return coarse
+
+
+def _coarse_verification_lags(lags: list[int], factor: int) -> list[int]:
+    """
+    With the flows constant within each coarse time step, the original time step j of a coarse time step receives
+    the flow that left the dam upstream lag original time steps before, that is, ceil((lag - j) / factor) coarse
+    time steps before. Each lag becomes the factor lags of its time steps j, so that their mean (the turbined flow)
+    weighs each coarse time step by the fraction of the flow that arrives with that delay (0: the same time step).
+
+    :return: Verification lags of the aggregated instance, with repetitions
+    """
+    return [math.ceil((lag - j) / factor) for lag in lags for j in range(factor)]
+
+
+def aggregate_instance(instance: InstanceData, factor: int) -> InstanceData:
+
+    """
+    Aggregates the instance to time steps factor times longer: prices, incoming flows and unregulated flows are
+    averaged over each group of factor time steps, the lags are rescaled to the new time step (see
+    _coarse_verification_lags) and the initial lags are averaged in the same way. Volumes and flow limits
+    do not depend on the time step and are kept.
+
+    :param instance: Instance of the problem
+    :param factor: Number of time steps of the instance in each time step of the aggregated instance
+    :return: Aggregated instance
+    """
+
+    if factor < 2:
+        raise ValueError(f"The aggregation factor must be at least 2, not {factor}")
+    data = dict(instance.data)
+    minutos = data["time_step_minutes"] * factor
+    data["time_step_minutes"] = minutos
+    num_decisiones = math.ceil(instance.get_decision_horizon() / factor)
+    inicio = instance.get_start_decisions_datetime()
+    data["datetime"] = dict(
+        data["datetime"],
+        end_decisions=(inicio + timedelta(minutes=minutos * (num_decisiones - 1))).strftime("%Y-%m-%d %H:%M"),
+    )
+    data["energy_prices"] = _average_groups(instance.get_all_prices(), factor)
+    data["incoming_flows"] = _average_groups(instance.get_all_incoming_flows(), factor)
+
+    dams = {}
+    for dam_id in instance.get_ids_of_dams():
+        dam = dict(data["dams"][dam_id])
+        dam["relevant_lags"] = _coarse_lags(instance.get_relevant_lags_of_dam(dam_id), factor)
+        dam["verification_lags"] = _coarse_verification_lags(instance.get_verification_lags_of_dam(dam_id), factor)
+        # Lag j de la instancia agregada: media de los lags (j - 1) * factor + 1, ..., j * factor
+        num_lags = max(dam["relevant_lags"] + dam["verification_lags"])
+        dam["initial_lags"] = _pad(_average_groups(instance.get_initial_lags_of_channel(dam_id), factor), num_lags)
+        dam["unregulated_flows"] = _average_groups(instance.get_all_unregulated_flows_of_dam(dam_id), factor)
+        dams[dam_id] = dam
+    data["dams"] = dams
+
+    # Las series deben cubrir el horizonte de impacto de la instancia agregada
+    agregada = type(instance)(data=data)
+    num_franjas = agregada.get_largest_impact_horizon()
+    data["energy_prices"] = _pad(data["energy_prices"], num_franjas)
+    data["incoming_flows"] = _pad(data["incoming_flows"], num_franjas)
+    for dam in dams.values():
+        dam["unregulated_flows"] = _pad(dam["unregulated_flows"], num_franjas)
+    return agregada
+
+
+def disaggregate_volumes(volumes: np.ndarray, initial_volumes: np.ndarray, factor: int,
+                         num_time_steps: int) -> np.ndarray:
+
+    """
+    Interpolates linearly the volumes at the end of each time step of an aggregated instance to the time steps
+    of the original one (the volume at the end of the coarse time step s is the one at the end of the original
+    time step (s + 1) * factor - 1, and the initial volume the one at its beginning).
+
+    :param volumes: Volumes of each dam at the end of each coarse time step, shape (num_dams, num_coarse_time_steps)
+    :param initial_volumes: Initial volume of each dam
+    :param factor: Number of original time steps in each coarse time step
+    :param num_time_steps: Number of time steps of the original instance
+    :return: Volumes of each dam at the end of each original time step, shape (num_dams, num_time_steps)
+    """
+
+    fin_gruesas = factor * np.arange(volumes.shape[1] + 1)
+    fin_finas = np.arange(1, num_time_steps + 1)
+    return np.array([
+        np.interp(fin_finas, fin_gruesas, np.concatenate(([v0], vols)))
+        for v0, vols in zip(initial_volumes, volumes)
+    ])
@@ -0,0 +1,84 @@
+import contextlib
+import glob
+import io
+import os
+import time
+from dataclasses import replace
+from instance_ana import InstanceData
+from lp_ana import LPConfiguration, LPModel
+
+# Benchmark de la resolución en dos etapas (coarse_to_fine) frente al MILP completo con el mismo tiempo total:
+# el modelo horario tiene COARSE_TIME_LIMIT segundos y el de 15 minutos el resto de TIME_LIMIT
+
+NUM_DAMS = [2, 4]
+PERCENTILES = ["00", "20", "50", "80"]
+TIME_LIMIT = 120
+COARSE_TIME_LIMIT = 20
+TRUST_REGIONS = [0.03, 0.1]
+INSTANCES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "percentiles")
+
+config = LPConfiguration(
+    volume_shortage_penalty=3,
+    volume_exceedance_bonus=0,
+    startups_penalty=50,
+    limit_zones_penalty=1000,
+    volume_objectives={
+        "dam1": 59627.42324,
+        "dam2": 31010.43613642857,
+        "dam3": 31010.43613642857,
+        "dam4": 31010.43613642857,
+        "dam5": 59627.42324,
+        "dam6": 59627.42324,
+        "dam7": 31010.43613642857,
+        "dam8": 59627.42324,
+        "dam9": 59627.42324,
+        "dam10": 31010.43613642857,
+        "dam11": 59627.42324,
+        "dam12": 31010.43613642857,
+    },
+    MIPGap=0.01,
+    time_limit_seconds=TIME_LIMIT,
+    flow_smoothing=2,
+    solver="highs",
+)
+
+
+def solve_quietly(model: LPModel) -> tuple[float | None, float]:
+    """
+    :return: Objective value of the solution of the model (None if there is none) and solve time (s)
+    """
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()) as log:
+        model.solve()
+    elapsed = time.perf_counter() - start
+    valores = [line.split(":")[-1] for line in log.getvalue().splitlines() if "objetivo (€)" in line]
+    # Con coarse_to_fine el último valor es el del modelo completo
+    objective = float(valores[-1]) if valores and valores[-1].strip() != "None" else None
+    return objective, elapsed
+
+
+def format_result(objective: float | None, elapsed: float, width: int) -> str:
+    valor = "-" if objective is None else f"{objective:.2f}"
+    return f"{valor:>{width}} {elapsed:>8.1f}"
+
+
+print(f"{'dams':>4} {'perc':>4} | {'full obj':>10} {'time (s)':>8} | " + " | ".join(
+    f"{f'region {region}':>12} {'time (s)':>8}" for region in TRUST_REGIONS
+))
+for num_dams in NUM_DAMS:
+    for percentile in PERCENTILES:
+        instance = InstanceData.from_json(
+            glob.glob(os.path.join(INSTANCES_PATH, percentile, f"instance_{num_dams}dams_*.json"))[0]
+        )
+        resultados = [solve_quietly(LPModel(config=config, instance=instance))]
+        for region in TRUST_REGIONS:
+            run_config = replace(
+                config,
+                coarse_to_fine=True,
+                coarse_time_limit_seconds=COARSE_TIME_LIMIT,
+                time_limit_seconds=TIME_LIMIT - COARSE_TIME_LIMIT,
+                volume_trust_region=region,
+            )
+            resultados.append(solve_quietly(LPModel(config=run_config, instance=instance)))
+        print(f"{num_dams:>4} {percentile:>4} | {format_result(*resultados[0], 10)} | "
+              + " | ".join(format_result(*resultado, 12) for resultado in resultados[1:]), flush=True)
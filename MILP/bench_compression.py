@@ -0,0 +1,80 @@
+import contextlib
+import glob
+import io
+import os
+import time
+from dataclasses import replace
+from instance_ana import InstanceData
+from lp_ana import LPConfiguration, LPModel
+
+# Benchmark de la compresión temporal (compress_time_steps): número de periodos del modelo comprimido según
+# la tolerancia de los caudales, objetivo del modelo comprimido y de su programa evaluado en el modelo completo,
+# frente al MILP completo
+
+NUM_DAMS = [2, 4]
+PERCENTILES = ["00", "20", "50", "80", "100"]
+TOLERANCES = [0.0, 0.1, 0.5]
+TIME_LIMIT = 60
+INSTANCES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "percentiles")
+
+config = LPConfiguration(
+    volume_shortage_penalty=3,
+    volume_exceedance_bonus=0,
+    startups_penalty=50,
+    limit_zones_penalty=1000,
+    volume_objectives={
+        "dam1": 59627.42324,
+        "dam2": 31010.43613642857,
+        "dam3": 31010.43613642857,
+        "dam4": 31010.43613642857,
+        "dam5": 59627.42324,
+        "dam6": 59627.42324,
+        "dam7": 31010.43613642857,
+        "dam8": 59627.42324,
+        "dam9": 59627.42324,
+        "dam10": 31010.43613642857,
+        "dam11": 59627.42324,
+        "dam12": 31010.43613642857,
+    },
+    MIPGap=0.01,
+    time_limit_seconds=TIME_LIMIT,
+    flow_smoothing=2,
+    solver="highs",
+)
+
+
+def solve_quietly(model: LPModel) -> tuple[float | None, float]:
+    """
+    :return: Objective value of the solution of the model (None if there is none) and solve time (s)
+    """
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()) as log:
+        model.solve()
+    elapsed = time.perf_counter() - start
+    valores = [line.split(":")[-1] for line in log.getvalue().splitlines() if "objetivo (€)" in line]
+    objective = float(valores[-1]) if valores and valores[-1].strip() != "None" else None
+    return objective, elapsed
+
+
+def format_objective(objective: float | None, width: int) -> str:
+    return f"{'-' if objective is None else f'{objective:.2f}':>{width}}"
+
+
+print(f"{'dams':>4} {'perc':>4} {'tol':>5} | {'steps':>5} {'periods':>7} | {'compressed':>10} {'expanded':>10} "
+      f"{'time (s)':>8} | {'full obj':>10} {'time (s)':>8}")
+for num_dams in NUM_DAMS:
+    for percentile in PERCENTILES:
+        instance = InstanceData.from_json(
+            glob.glob(os.path.join(INSTANCES_PATH, percentile, f"instance_{num_dams}dams_*.json"))[0]
+        )
+        completo, tiempo_completo = solve_quietly(LPModel(config=config, instance=instance))
+        for tolerance in TOLERANCES:
+            model = LPModel(
+                config=replace(config, compress_time_steps=True, compression_tolerance=tolerance), instance=instance
+            )
+            _, elapsed = solve_quietly(model)
+            report = model.compression_report
+            print(f"{num_dams:>4} {percentile:>4} {tolerance:>5} | {report['time_steps']:>5} {report['periods']:>7} | "
+                  f"{format_objective(report['compressed_objective'], 10)} "
+                  f"{format_objective(report['expanded_objective'], 10)} {elapsed:>8.1f} | "
+                  f"{format_objective(completo, 10)} {tiempo_completo:>8.1f}", flush=True)
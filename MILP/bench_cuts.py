@@ -0,0 +1,88 @@
+import glob
+import os
+import time
+from dataclasses import replace
+import pulp as lp
+from instance_ana import InstanceData
+from lp_ana import LPConfiguration, LPModel
+from solvers import solve_problem
+
+# Benchmark de las familias de desigualdades válidas (startup_cuts, volume_reachability_cuts y pq_segment_cuts),
+# por separado y juntas: filas añadidas, cota de la relajación lineal en la raíz y tiempo hasta alcanzar el gap
+
+NUM_DAMS = 2
+PERCENTILES = ["00", "10", "100"]
+FAMILIES = {
+    "none": {},
+    "startup": {"startup_cuts": True},
+    "volume": {"volume_reachability_cuts": True},
+    "pq_segment": {"pq_segment_cuts": True},
+    "all": {"startup_cuts": True, "volume_reachability_cuts": True, "pq_segment_cuts": True},
+}
+INSTANCES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "percentiles")
+
+config = LPConfiguration(
+    volume_shortage_penalty=3,
+    volume_exceedance_bonus=0,
+    startups_penalty=50,
+    limit_zones_penalty=1000,
+    volume_objectives={
+        "dam1": 59627.42324,
+        "dam2": 31010.43613642857,
+        "dam3": 31010.43613642857,
+        "dam4": 31010.43613642857,
+        "dam5": 59627.42324,
+        "dam6": 59627.42324,
+        "dam7": 31010.43613642857,
+        "dam8": 59627.42324,
+        "dam9": 59627.42324,
+        "dam10": 31010.43613642857,
+        "dam11": 59627.42324,
+        "dam12": 31010.43613642857,
+    },
+    MIPGap=0.01,
+    time_limit_seconds=3*60,
+    flow_smoothing=2,
+    solver="highs",
+    presolve=True,
+)
+
+
+def lp_bound(lpproblem: lp.LpProblem, config: LPConfiguration) -> float:
+    """
+    :return: Objective value of the linear relaxation (binaries in [0, 1])
+    """
+    integers = [var for var in lpproblem.variables() if var.cat == lp.LpInteger]
+    for var in integers:
+        var.cat = lp.LpContinuous
+    try:
+        solve_problem(lpproblem, config)
+        return lp.value(lpproblem.objective)
+    finally:
+        for var in integers:
+            var.cat = lp.LpInteger
+
+
+print(f"{'perc':>4} {'family':>10} | {'rows':>6} {'cuts':>6} | {'LP bound':>10} | "
+      f"{'MIP obj':>10} {'time (s)':>9} {'status':>18}")
+for percentile in PERCENTILES:
+    instance = InstanceData.from_json(
+        glob.glob(os.path.join(INSTANCES_PATH, percentile, f"instance_{NUM_DAMS}dams_*.json"))[0]
+    )
+    num_rows = None
+    for family, options in FAMILIES.items():
+        run_config = replace(config, **options)
+        lpproblem = LPModel(config=run_config, instance=instance).build_model()
+        if num_rows is None:
+            num_rows = len(lpproblem.constraints)
+        bound = lp_bound(lpproblem, run_config)
+
+        start = time.perf_counter()
+        solve_problem(lpproblem, run_config)
+        elapsed = time.perf_counter() - start
+        found = lpproblem.sol_status in (lp.LpSolutionOptimal, lp.LpSolutionIntegerFeasible)
+        objective = f"{lp.value(lpproblem.objective):>10.2f}" if found else f"{'-':>10}"
+        print(f"{percentile:>4} {family:>10} | {len(lpproblem.constraints):>6} "
+              f"{len(lpproblem.constraints) - num_rows:>6} | {bound:>10.2f} | "
+              f"{objective} {elapsed:>9.1f} {lp.LpSolution[lpproblem.sol_status]:>18}",
+              flush=True)
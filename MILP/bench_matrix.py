@@ -0,0 +1,63 @@
+import os
+import time
+import tracemalloc
+from instance_ana import InstanceData
+from lp_ana import LPConfiguration, LPModel
+from lp_matrix import build_matrix_model
+
+# Benchmark del tiempo de construcción y memoria pico del modelo:
+# camino PuLP (LPModel.build_model) frente al camino matricial (build_matrix_model)
+
+PERCENTILE = "00"
+DATE = 20200908
+MAX_DAMS = 12
+INSTANCES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "percentiles")
+
+config = LPConfiguration(
+    volume_shortage_penalty=3,
+    volume_exceedance_bonus=0,
+    startups_penalty=50,
+    limit_zones_penalty=1000,
+    volume_objectives={
+        "dam1": 59627.42324,
+        "dam2": 31010.43613642857,
+        "dam3": 31010.43613642857,
+        "dam4": 31010.43613642857,
+        "dam5": 59627.42324,
+        "dam6": 59627.42324,
+        "dam7": 31010.43613642857,
+        "dam8": 59627.42324,
+        "dam9": 59627.42324,
+        "dam10": 31010.43613642857,
+        "dam11": 59627.42324,
+        "dam12": 31010.43613642857,
+    },
+    MIPGap=0.0,
+    time_limit_seconds=15*60,
+    flow_smoothing=2
+)
+
+
+def measure(build):
+    """
+    :return: Result of build(), time spent (s) and peak of memory allocated (MB) while building
+    """
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = build()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1] / 2**20
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+print(f"{'dams':>4} | {'vars':>7} {'rows':>7} | {'PuLP (s)':>9} {'PuLP (MB)':>10} | "
+      f"{'matrix (s)':>10} {'matrix (MB)':>11} | {'speedup':>7}")
+for num_dams in range(1, MAX_DAMS + 1):
+    instance = InstanceData.from_json(
+        os.path.join(INSTANCES_PATH, PERCENTILE, f"instance_{num_dams}dams_{DATE}.json")
+    )
+    lpproblem, pulp_time, pulp_peak = measure(LPModel(config=config, instance=instance).build_model)
+    model, matrix_time, matrix_peak = measure(lambda: build_matrix_model(instance, config))
+    print(f"{num_dams:>4} | {model.num_cols:>7} {model.num_rows:>7} | {pulp_time:>9.2f} {pulp_peak:>10.1f} | "
+          f"{matrix_time:>10.3f} {matrix_peak:>11.1f} | {pulp_time / matrix_time:>6.0f}x", flush=True)
@@ -0,0 +1,80 @@
+import json
+import os
+import time
+from dataclasses import replace
+from instance_ana import InstanceData
+from lp_ana import LPConfiguration
+from lp_matrix import build_matrix_model
+from model_parameters import ModelParameters
+
+# Benchmark del tiempo de construcción del modelo matricial según el número de procesos (build_workers)
+# que construyen los bloques de los embalses, en la instancia de 12 embalses y en cascadas sintéticas
+# más largas que repiten sus embalses
+
+PERCENTILE = "00"
+DATE = 20200908
+REPETITIONS = [1, 2, 4, 8]
+WORKERS = sorted({1, 2, 4, os.cpu_count()})
+INSTANCES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "percentiles")
+VOLUME_OBJECTIVES = {
+    "dam1": 59627.42324,
+    "dam2": 31010.43613642857,
+    "dam3": 31010.43613642857,
+    "dam4": 31010.43613642857,
+    "dam5": 59627.42324,
+    "dam6": 59627.42324,
+    "dam7": 31010.43613642857,
+    "dam8": 59627.42324,
+    "dam9": 59627.42324,
+    "dam10": 31010.43613642857,
+    "dam11": 59627.42324,
+    "dam12": 31010.43613642857,
+}
+
+config = LPConfiguration(
+    volume_shortage_penalty=3,
+    volume_exceedance_bonus=0,
+    startups_penalty=50,
+    limit_zones_penalty=1000,
+    volume_objectives={},
+    MIPGap=0.01,
+    time_limit_seconds=2*60,
+    flow_smoothing=2,
+    model_builder="matrix",
+    presolve=True,
+)
+
+
+def repeated_cascade(data: dict, repetitions: int) -> tuple[InstanceData, dict]:
+    """
+    :param data: Data of an instance, as read from its JSON file
+    :param repetitions: Number of times the dams of the instance are repeated along the cascade
+    :return: Synthetic instance and its objective volumes (the ones of the repeated dams)
+    """
+    dams = []
+    volume_objectives = {}
+    for _ in range(repetitions):
+        for dam in data["dams"]:
+            volume_objectives[f"dam{len(dams) + 1}"] = VOLUME_OBJECTIVES[dam["id"]]
+            dams.append(dict(dam, id=f"dam{len(dams) + 1}", order=len(dams) + 1))
+    return InstanceData.from_dict(dict(data, dams=dams)), volume_objectives
+
+
+# Guarda necesaria para los procesos de build_workers en las plataformas que los crean con spawn
+if __name__ == "__main__":
+    with open(os.path.join(INSTANCES_PATH, PERCENTILE, f"instance_12dams_{DATE}.json"), encoding="utf-8") as f:
+        data = json.load(f)
+
+    print(f"{'dams':>4} {'rows':>8} | " + " | ".join(f"{f'{w} workers (s)':>15}" for w in WORKERS) + " | speedup")
+    for repetitions in REPETITIONS:
+        instance, volume_objectives = repeated_cascade(data, repetitions)
+        run_config = replace(config, volume_objectives=volume_objectives)
+        # Los parámetros se calculan antes de medir (quedan en caché para el camino secuencial)
+        ModelParameters.from_instance(instance, run_config)
+        times = []
+        for workers in WORKERS:
+            start = time.perf_counter()
+            model = build_matrix_model(instance, replace(run_config, build_workers=workers))
+            times.append(time.perf_counter() - start)
+        print(f"{len(instance.get_ids_of_dams()):>4} {model.num_rows:>8} | "
+              + " | ".join(f"{t:>15.3f}" for t in times) + f" | {times[0] / min(times):>6.1f}x", flush=True)
@@ -0,0 +1,87 @@
+import glob
+import os
+import time
+from dataclasses import replace
+import pulp as lp
+from instance_ana import InstanceData
+from lp_ana import LPConfiguration, LPModel
+from solvers import backend_available, solve_problem
+
+# Benchmark de las formulaciones de las curvas lineales a trozos ("winston", "sos2" y "log"):
+# tamaño del modelo, cota de la relajación lineal y tiempo hasta alcanzar el gap en cada percentil
+
+NUM_DAMS = 2
+FORMULATIONS = ["winston", "sos2", "log"]
+INSTANCES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "percentiles")
+PERCENTILES = sorted(os.listdir(INSTANCES_PATH), key=int)
+
+config = LPConfiguration(
+    volume_shortage_penalty=3,
+    volume_exceedance_bonus=0,
+    startups_penalty=50,
+    limit_zones_penalty=1000,
+    volume_objectives={
+        "dam1": 59627.42324,
+        "dam2": 31010.43613642857,
+        "dam3": 31010.43613642857,
+        "dam4": 31010.43613642857,
+        "dam5": 59627.42324,
+        "dam6": 59627.42324,
+        "dam7": 31010.43613642857,
+        "dam8": 59627.42324,
+        "dam9": 59627.42324,
+        "dam10": 31010.43613642857,
+        "dam11": 59627.42324,
+        "dam12": 31010.43613642857,
+    },
+    MIPGap=0.01,
+    time_limit_seconds=5*60,
+    flow_smoothing=2,
+    # Todas las formulaciones con el mismo backend, que ramifica sobre los conjuntos SOS2: Gurobi si hay licencia y,
+    # si no, CBC (sin preproceso ni strong branching, ver solve_problem)
+    solver="gurobi_cmd" if backend_available("gurobi_cmd") else "cbc",
+)
+
+
+def lp_bound(lpproblem: lp.LpProblem, config: LPConfiguration) -> float:
+    """
+    :return: Objective value of the linear relaxation (binaries in [0, 1] and no SOS constraints)
+    """
+    integers = [var for var in lpproblem.variables() if var.cat == lp.LpInteger]
+    sos2 = lpproblem.sos2
+    for var in integers:
+        var.cat = lp.LpContinuous
+    lpproblem.sos2 = {}
+    try:
+        solve_problem(lpproblem, config)
+        return lp.value(lpproblem.objective)
+    finally:
+        for var in integers:
+            var.cat = lp.LpInteger
+        lpproblem.sos2 = sos2
+
+
+print(f"Backend: {config.solver}")
+print(f"{'perc':>4} {'formulation':>11} | {'vars':>6} {'bins':>6} {'rows':>6} {'SOS2':>5} | "
+      f"{'LP bound':>10} | {'MIP obj':>10} {'time (s)':>9} {'status':>18}")
+for percentile in PERCENTILES:
+    # Cada percentil corresponde a un día distinto
+    instance = InstanceData.from_json(
+        glob.glob(os.path.join(INSTANCES_PATH, percentile, f"instance_{NUM_DAMS}dams_*.json"))[0]
+    )
+    for formulation in FORMULATIONS:
+        run_config = replace(config, pwl_formulation=formulation)
+        lpproblem = LPModel(config=run_config, instance=instance).build_model()
+        variables = lpproblem.variables()
+        num_binaries = sum(var.cat == lp.LpInteger for var in variables)
+        bound = lp_bound(lpproblem, run_config)
+
+        start = time.perf_counter()
+        solve_problem(lpproblem, run_config)
+        elapsed = time.perf_counter() - start
+        found = lpproblem.sol_status in (lp.LpSolutionOptimal, lp.LpSolutionIntegerFeasible)
+        objective = f"{lp.value(lpproblem.objective):>10.2f}" if found else f"{'-':>10}"
+        print(f"{percentile:>4} {formulation:>11} | {len(variables):>6} {num_binaries:>6} "
+              f"{len(lpproblem.constraints):>6} {len(lpproblem.sos2):>5} | {bound:>10.2f} | "
+              f"{objective} {elapsed:>9.1f} {lp.LpSolution[lpproblem.sol_status]:>18}",
+              flush=True)
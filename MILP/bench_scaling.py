@@ -0,0 +1,116 @@
+import glob
+import os
+import sys
+import tempfile
+import time
+from dataclasses import replace
+import numpy as np
+import pulp as lp
+from instance_ana import InstanceData
+from lp_ana import LPConfiguration, LPModel
+from solvers import solve_problem
+
+# Benchmark del escalado de unidades (scale_units) en el corpus de percentiles: rango de los coeficientes
+# y de los términos independientes del modelo, avisos numéricos del solver, máxima violación de las
+# restricciones en la solución y tiempo hasta alcanzar el gap
+
+NUM_DAMS = 2
+PERCENTILES = ["00", "10", "20", "25", "30", "40", "50", "60", "70", "75", "80", "90", "100"]
+INSTANCES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "percentiles")
+
+config = LPConfiguration(
+    volume_shortage_penalty=3,
+    volume_exceedance_bonus=0,
+    startups_penalty=50,
+    limit_zones_penalty=1000,
+    volume_objectives={
+        "dam1": 59627.42324,
+        "dam2": 31010.43613642857,
+        "dam3": 31010.43613642857,
+        "dam4": 31010.43613642857,
+        "dam5": 59627.42324,
+        "dam6": 59627.42324,
+        "dam7": 31010.43613642857,
+        "dam8": 59627.42324,
+        "dam9": 59627.42324,
+        "dam10": 31010.43613642857,
+        "dam11": 59627.42324,
+        "dam12": 31010.43613642857,
+    },
+    MIPGap=0.01,
+    time_limit_seconds=2*60,
+    flow_smoothing=2,
+    solver="highs",
+    presolve=True,
+)
+
+
+def magnitude_range(values) -> str:
+    """
+    :return: Smallest and largest absolute value of the non-zero values, as powers of 10
+    """
+    values = np.abs(np.asarray([v for v in values if v is not None], dtype=float))
+    values = values[np.isfinite(values) & (values > 1e-12)]
+    return f"[{np.log10(values.min()):+.1f}, {np.log10(values.max()):+.1f}]"
+
+
+def max_violation(lpproblem: lp.LpProblem) -> float:
+    """
+    :return: Largest violation of the constraints by the values of the variables (in the units of the model)
+    """
+    violation = 0.0
+    for constraint in lpproblem.constraints.values():
+        value = constraint.value()
+        if constraint.sense == lp.LpConstraintLE:
+            violation = max(violation, value)
+        elif constraint.sense == lp.LpConstraintGE:
+            violation = max(violation, -value)
+        else:
+            violation = max(violation, abs(value))
+    return violation
+
+
+def solve_logged(lpproblem: lp.LpProblem, config: LPConfiguration) -> tuple[float, int]:
+    """
+    Solves the problem capturing the log that the solver writes to the standard output.
+
+    :return: Solve time (s) and number of warnings in the log of the solver
+    """
+    with tempfile.TemporaryFile(mode="w+") as log:
+        sys.stdout.flush()
+        stdout = os.dup(1)
+        os.dup2(log.fileno(), 1)
+        try:
+            start = time.perf_counter()
+            solve_problem(lpproblem, config)
+            elapsed = time.perf_counter() - start
+        finally:
+            sys.stdout.flush()
+            os.dup2(stdout, 1)
+            os.close(stdout)
+        log.seek(0)
+        num_warnings = sum("warning" in line.lower() for line in log)
+    return elapsed, num_warnings
+
+
+print(f"{'perc':>4} {'scaled':>6} | {'matrix':>12} {'rhs':>12} {'bounds':>12} | "
+      f"{'warnings':>8} {'violation':>9} | {'MIP obj':>10} {'time (s)':>9} {'status':>18}")
+for percentile in PERCENTILES:
+    instance = InstanceData.from_json(
+        glob.glob(os.path.join(INSTANCES_PATH, percentile, f"instance_{NUM_DAMS}dams_*.json"))[0]
+    )
+    for scale_units in (False, True):
+        run_config = replace(config, scale_units=scale_units)
+        lpproblem = LPModel(config=run_config, instance=instance).build_model()
+        coefficients = [coef for constraint in lpproblem.constraints.values() for coef in constraint.values()]
+        rhs = [constraint.constant for constraint in lpproblem.constraints.values()]
+        bounds = [bound for var in lpproblem.variables() for bound in (var.lowBound, var.upBound)]
+
+        elapsed, num_warnings = solve_logged(lpproblem, run_config)
+        found = lpproblem.sol_status in (lp.LpSolutionOptimal, lp.LpSolutionIntegerFeasible)
+        objective = f"{lp.value(lpproblem.objective):>10.2f}" if found else f"{'-':>10}"
+        violation = f"{max_violation(lpproblem):>9.1e}" if found else f"{'-':>9}"
+        print(f"{percentile:>4} {str(scale_units):>6} | {magnitude_range(coefficients):>12} "
+              f"{magnitude_range(rhs):>12} {magnitude_range(bounds):>12} | {num_warnings:>8} {violation} | "
+              f"{objective} {elapsed:>9.1f} {lp.LpSolution[lpproblem.sol_status]:>18}",
+              flush=True)
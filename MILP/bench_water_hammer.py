@@ -0,0 +1,86 @@
+import glob
+import os
+import time
+from dataclasses import replace
+import pulp as lp
+from instance_ana import InstanceData
+from lp_ana import LPConfiguration, LPModel
+from solvers import solve_problem
+
+# Benchmark de las formulaciones de la restricción golpe de ariete ("pairwise", "aggregated" y "window_max")
+# para K = 1..8: filas del modelo, cota de la relajación lineal y tiempo hasta alcanzar el gap
+
+NUM_DAMS = 2
+PERCENTILE = "100"
+FLOW_SMOOTHING = range(1, 9)
+FORMULATIONS = ["pairwise", "aggregated", "window_max"]
+INSTANCES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "percentiles")
+
+config = LPConfiguration(
+    volume_shortage_penalty=3,
+    volume_exceedance_bonus=0,
+    startups_penalty=50,
+    limit_zones_penalty=1000,
+    volume_objectives={
+        "dam1": 59627.42324,
+        "dam2": 31010.43613642857,
+        "dam3": 31010.43613642857,
+        "dam4": 31010.43613642857,
+        "dam5": 59627.42324,
+        "dam6": 59627.42324,
+        "dam7": 31010.43613642857,
+        "dam8": 59627.42324,
+        "dam9": 59627.42324,
+        "dam10": 31010.43613642857,
+        "dam11": 59627.42324,
+        "dam12": 31010.43613642857,
+    },
+    MIPGap=0.01,
+    time_limit_seconds=5*60,
+    flow_smoothing=2,
+    solver="highs",
+    presolve=True,
+)
+
+
+
+def lp_bound(lpproblem: lp.LpProblem, config: LPConfiguration) -> float:
+    """
+    :return: Objective value of the linear relaxation (binaries in [0, 1])
+    """
+    integers = [var for var in lpproblem.variables() if var.cat == lp.LpInteger]
+    for var in integers:
+        var.cat = lp.LpContinuous
+    try:
+        solve_problem(lpproblem, config)
+        return lp.value(lpproblem.objective)
+    finally:
+        for var in integers:
+            var.cat = lp.LpInteger
+
+
+instance = InstanceData.from_json(
+    glob.glob(os.path.join(INSTANCES_PATH, PERCENTILE, f"instance_{NUM_DAMS}dams_*.json"))[0]
+)
+
+print(f"{'K':>2} {'formulation':>11} | {'vars':>6} {'rows':>6} {'WH rows':>7} | "
+      f"{'LP bound':>10} | {'MIP obj':>10} {'time (s)':>9} {'status':>18}")
+for K in FLOW_SMOOTHING:
+    for formulation in FORMULATIONS:
+        run_config = replace(config, flow_smoothing=K, water_hammer_formulation=formulation)
+        lpproblem = LPModel(config=run_config, instance=instance).build_model()
+        # Filas propias del golpe de ariete: diferencia con el modelo sin ellas (K = 0)
+        base = LPModel(
+            config=replace(run_config, flow_smoothing=0, water_hammer_formulation="pairwise"), instance=instance
+        ).build_model()
+        bound = lp_bound(lpproblem, run_config)
+
+        start = time.perf_counter()
+        solve_problem(lpproblem, run_config)
+        elapsed = time.perf_counter() - start
+        found = lpproblem.sol_status in (lp.LpSolutionOptimal, lp.LpSolutionIntegerFeasible)
+        objective = f"{lp.value(lpproblem.objective):>10.2f}" if found else f"{'-':>10}"
+        print(f"{K:>2} {formulation:>11} | {len(lpproblem.variables()):>6} {len(lpproblem.constraints):>6} "
+              f"{len(lpproblem.constraints) - len(base.constraints):>7} | {bound:>10.2f} | "
+              f"{objective} {elapsed:>9.1f} {lp.LpSolution[lpproblem.sol_status]:>18}",
+              flush=True)
@@ -0,0 +1,103 @@
+from dataclasses import replace
+from types import MappingProxyType
+import numpy as np
+from model_parameters import ModelParameters, _frozen
+
+
+def find_periods(p: ModelParameters, tolerance: float = 0.0) -> tuple[tuple[int, int], ...]:
+
+    """
+    Groups the consecutive time steps with the same price and with incoming and unregulated flows within
+    tolerance (m3/s) of those of the first time step of the group. The decision horizon always ends a group,
+    so that the final volume is the one at the end of a group.
+
+    :param p: Parameters of the model
+    :param tolerance: Largest difference of the flows of a time step with those of the first one of its group (m3/s)
+    :return: First time step and number of time steps of each group
+    """
+
+    T = p.num_time_steps
+    periodos = []
+    inicio = 0
+    for t in range(1, T + 1):
+        if (
+            t == T
+            or t == p.D_1
+            or p.Price[t] != p.Price[inicio]
+            or abs(p.Q0[t] - p.Q0[inicio]) > tolerance
+            or np.any(np.abs(p.Qnr[:, t] - p.Qnr[:, inicio]) > tolerance)
+        ):
+            periodos.append((inicio, t - inicio))
+            inicio = t
+    return tuple(periodos)
+
+
+def compress_parameters(p: ModelParameters, periodos: tuple[tuple[int, int], ...]) -> ModelParameters:
+
+    """
+    Parameters of the model whose time steps are the given groups of time steps of p (see find_periods).
+    Prices and flows are averaged over each group, and the turbined flow of each group is the mean, over its
+    time steps and the verification lags, of the exiting flow of the group (or the initial lag) that each lag
+    reaches, so that the water arrives downstream with the same delays as in p (see ModelParameters.PesosLags).
+    The incoming flows accumulated within each group are kept, so that the minimum volume can be checked
+    at each of its time steps (see ModelParameters.EntradasParciales).
+
+    :param p: Parameters of the model without compression
+    :param periodos: First time step and number of time steps of each group
+    :return: Parameters with one time step per group
+    """
+
+    inicios = np.array([inicio for inicio, _ in periodos])
+    duraciones = np.array([duracion for _, duracion in periodos])
+    periodo_de = np.repeat(np.arange(len(periodos)), duraciones)
+
+    def media(valores: np.ndarray) -> np.ndarray:
+        valores = valores[..., :p.num_time_steps]
+        return _frozen(np.add.reduceat(valores, inicios, axis=-1) / duraciones)
+
+    def turbinado(i, franjas, constante=0.0, coeficientes=None):
+        # Suma del caudal turbinado de i en las franjas: constante y pesos de los caudales de salida de los periodos
+        coeficientes = dict(coeficientes or {})
+        L = p.L[i]
+        for s in franjas:
+            for l in L:
+                if s - l < 0:
+                    constante += p.IniLags[i][l - 1 - s] / len(L)
+                else:
+                    periodo = int(periodo_de[s - l])
+                    coeficientes[periodo] = coeficientes.get(periodo, 0.0) + 1 / len(L)
+        return constante, coeficientes
+
+    def escalar(constante, coeficientes, factor):
+        return constante * factor, tuple((periodo, peso * factor) for periodo, peso in sorted(coeficientes.items()))
+
+    pesos = {}
+    parciales = {}
+    for d, i in enumerate(p.I):
+        pesos[i] = tuple(
+            escalar(*turbinado(i, range(inicio, inicio + duracion)), 1 / duracion) for inicio, duracion in periodos
+        )
+        # Entradas acumuladas franja a franja dentro de cada periodo (sin el de la última, que da el balance)
+        terminos = []
+        for inicio, duracion in periodos:
+            acumuladas = []
+            constante, coeficientes = 0.0, {}
+            for s in range(inicio, inicio + duracion - 1):
+                constante += p.Qnr[d, s] + (p.Q0[s] if d == 0 else 0.0)
+                if d > 0:
+                    constante, coeficientes = turbinado(p.I[d - 1], (s,), constante, coeficientes)
+                acumuladas.append(escalar(constante, coeficientes, 1.0))
+            terminos.append(tuple(acumuladas))
+        parciales[i] = tuple(terminos)
+
+    return replace(
+        p,
+        num_time_steps=len(periodos),
+        D_1=int(np.sum(inicios < p.D_1)),
+        Price=media(p.Price),
+        Q0=media(p.Q0),
+        Qnr=media(p.Qnr),
+        Periodos=tuple(periodos),
+        PesosLags=MappingProxyType(pesos),
+        EntradasParciales=MappingProxyType(parciales),
+    )
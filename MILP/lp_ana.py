@@ -1,7 +1,16 @@
+import math
+import time
+import numpy as np
 import pulp as lp
 import json
 from instance_ana import InstanceData
-from dataclasses import dataclass
+from aggregation import aggregate_instance, disaggregate_volumes
+from compression import compress_parameters, find_periods
+from model_parameters import ModelParameters, configuration_fields
+from presolve import PresolveBounds, TOLERANCE
+from lp_matrix import build_matrix_model, solve_matrix_model
+from solvers import SOS_BACKENDS, solve_problem
+from dataclasses import dataclass, replace
 
 @dataclass
 class LPConfiguration:
@@ -30,16 +39,158 @@ class LPConfiguration:
     # Number of periods during which the flow through the channel may not undergo more than one variation
     # step_min: int = None
 
+    # Model construction path: "pulp" (LpVariable/lpSum objects) or "matrix" (sparse NumPy arrays)
+    model_builder: str = "pulp"
+
+    # Number of worker processes that build the blocks of the dams of the "matrix" model in parallel
+    # (1: in this process). On platforms that spawn the processes, the calling script needs a __main__ guard
+    build_workers: int = 1
+
+    # Solver backend for the PuLP models: "gurobi_cmd", "highs" (in-process, no temporary files) or "cbc".
+    # If it is not available, the next one of this list is used
+    solver: str = "gurobi_cmd"
+
+    # Number of threads of the solver (None: default of the solver)
+    threads: int = None
+
+    # Directory for the temporary files of the command line solvers (None: system temporary directory)
+    workdir: str = None
+
+    # Formulation of the piecewise linear curves PQ and VQ: "winston" (one binary per segment),
+    # "sos2" (SOS2 sets, with binaries only for the regions of the PQ curve that
+    # ZonaLimitePQ and FranjasGrupos need) or "log" (PQ segments encoded with ceil(log2(segments))
+    # Gray code binaries; VQ as in "winston"). "sos2" requires a solver with SOS support (gurobi_cmd, cbc;
+    # ValueError with highs). With CBC it only finds solutions at 1-dam scale: from 2 dams on it reaches the time
+    # limit without an integer feasible solution, as its preprocess and strong branching must be disabled
+    pwl_formulation: str = "winston"
+
+    # Whether the PQ curves are simplified before building the model: breakpoints beyond the reachable
+    # turbined flow and breakpoints between collinear segments are removed (startup and shutdown
+    # breakpoints are kept)
+    simplify_pq_curves: bool = False
+
+    # Whether the bounds of volumes and flows are propagated before building the model (see presolve.py):
+    # they become bounds of the variables and the big-M of the flow change indicators, and the curve segments,
+    # flow change senses and power group startups that are unreachable at each time step are fixed to 0
+    presolve: bool = False
+
+    # Whether qe, qtb, qch and pot, each defined by an equality from other variables, are substituted
+    # by their expressions in the constraints that use them instead of being columns of the model
+    # (their values are recovered after the solve, see LPModel.recover_substituted_values)
+    substitute_defined_variables: bool = False
+
+    # Formulation of the water hammer constraints (no change of the sense of the flow's change within
+    # flow_smoothing periods): "pairwise" (one row per pair x_pos[t], x_neg[t-k], 2*flow_smoothing rows per
+    # time step), "aggregated" (the window of each indicator in a single big-M row, 2 rows per time step but
+    # a weaker linear relaxation) or "window_max" (maxima of x_pos and x_neg over windows of
+    # flow_smoothing + 1 periods built from prefix and suffix maxima of blocks; rows per time step independent
+    # of flow_smoothing and the same linear relaxation as "pairwise")
+    water_hammer_formulation: str = "pairwise"
+
+    # Formulation of the power group startups: "previous_group" (startup of the group above the one of the
+    # previous time step, two rows per group and time step) or "cumulative" (one row per group and time step
+    # linking the startup to the change of the state "in this group or a higher one", so that simultaneous
+    # startups of several groups are all counted)
+    startup_formulation: str = "previous_group"
+
+    # Whether the shape of the curves is checked per dam to drop the binaries where the linear relaxation
+    # is already exact: a concave Volume - Max flow curve is written as linear cuts (no w_vq, z_vq or q_max_vol)
+    # and, with the "winston" formulation, each concave run of PQ segments with the same power group and limit
+    # zone gets a single binary (see ModelParameters.PiezasPQ). Other curves keep their formulation
+    detect_concave_curves: bool = False
+
+    # Whether the volumes are expressed in the model in units of ModelParameters.EscalaVol m3 (about the volume
+    # released in one time step) instead of m3, so that the coefficients and right-hand sides of the volume rows
+    # are of the same order as those of the flow rows. The flows stay in m3/s, the time step only enters the
+    # balance as D / EscalaVol and the volume deviation benefit is in units of EscalaVol €. The solution
+    # is mapped back to m3 in LPSolution
+    scale_units: bool = False
+
+    # Whether the big-M of each flow change indicator row (qch <= M * x_pos, -qch <= M * x_neg) is the bound of
+    # the flow change propagated for that dam and time step (see presolve.py) instead of the channel maximum QMax.
+    # presolve already implies it; this option only tightens these rows, without the other bounds and fixings
+    tight_big_m: bool = False
+
+    # Optional families of valid inequalities that strengthen the linear relaxation (see bench_cuts.py).
+    # startup_cuts: the startups of a power group or a lower one at each time step are at least the change of the
+    # state "in this group or a higher one" (only with "previous_group"; the "cumulative" rows already have this form)
+    startup_cuts: bool = False
+    # volume_reachability_cuts: the volume of the previous time step lies in the chosen segment of the Volume - Max
+    # flow curve, and the segments at t + 1 are those reachable from the segment at t with the maximum inflow
+    # of the time step (curves with w_vq binaries, i.e. not with "sos2")
+    volume_reachability_cuts: bool = False
+    # pq_segment_cuts: the weight of the breakpoints of the Power - Turbined flow curve up to (from) each one is at
+    # most the sum of the w_pq of the segments up to (from) it ("winston" and "log" without concave pieces)
+    pq_segment_cuts: bool = False
+
+    # Whether the water hammer rows (only with "pairwise") and the power group startup rows are generated lazily:
+    # the model is solved without them, the solution is checked against them and only the violated rows are added
+    # before solving again, until none is violated or time_limit_seconds, shared by all the solves, runs out
+    # (see LPModel.solve_with_lazy_rows)
+    lazy_constraints: bool = False
+
+    # Whether the problem is first solved on the instance aggregated to time steps of coarse_time_step_minutes
+    # (see aggregation.py) and the volume trajectory of that solution, interpolated to the original time steps,
+    # then bounds the volumes of the full model within volume_trust_region * (VMax - VMin) of it; its flows are the
+    # initial solution of the full model (see LPModel.solve_coarse_to_fine). It is a heuristic: the bounds may cut
+    # off the optimum. The aggregated model is solved with coarse_time_limit_seconds (None: time_limit_seconds) and
+    # the full one with time_limit_seconds
+    coarse_to_fine: bool = False
+    coarse_time_step_minutes: int = 60
+    volume_trust_region: float = 0.1
+    coarse_time_limit_seconds: float = None
+
+    # Whether the consecutive time steps with the same price and with incoming and unregulated flows within
+    # compression_tolerance (m3/s) are merged into periods before solving (see compression.py). The schedule of the
+    # compressed model is expanded to the time steps of the instance and evaluated with the full model
+    # (see LPModel.solve_compressed). Presolve, tight_big_m, lazy_constraints, volume_reachability_cuts and the
+    # "window_max" water hammer formulation ("pairwise" instead) only apply to the full model
+    compress_time_steps: bool = False
+    compression_tolerance: float = 0.0
+
 class LPSolution:
-    def __init__(self, data):
-        self.data = data
+    def __init__(self, dam_ids: list[str], flows: np.ndarray, powers: np.ndarray, volumes: np.ndarray, price):
+        """
+        :param dam_ids: IDs of the dams, in the order of the rows of the arrays
+        :param flows: Exiting flow of each dam at each time step (m3/s), shape (num_dams, num_time_steps)
+        :param powers: Power generated by each dam at each time step (MWh), same shape
+        :param volumes: Volume of each dam at the end of each time step (m3), same shape
+        :param price: Price at each time step (€/MWh)
+        """
+        self.dam_ids = list(dam_ids)
+        self.dam_index = {dam_id: d for d, dam_id in enumerate(self.dam_ids)}
+        self.flows = np.asarray(flows, dtype=float)
+        self.powers = np.asarray(powers, dtype=float)
+        self.volumes = np.asarray(volumes, dtype=float)
+        self.price = np.asarray(price, dtype=float)
 
     @classmethod
     def from_dict(cls, data) -> "LPSolution":
-        """Convierte una lista de embalses en un diccionario indexado por ID y crea una instancia de LPSolution."""
-        data_p = dict(data)
-        data_p["dams"] = {el["id"]: el for el in data_p["dams"]}
-        return cls(data_p)
+        """Crea una instancia de LPSolution a partir de un diccionario con la lista de embalses."""
+        dams = data["dams"] if isinstance(data["dams"], list) else list(data["dams"].values())
+        return cls(
+            dam_ids=[el["id"] for el in dams],
+            flows=[el["flows"] for el in dams],
+            powers=[el["power"] for el in dams],
+            volumes=[el["volume"] for el in dams],
+            price=data["price"],
+        )
+
+    @property
+    def data(self) -> dict:
+        """Diccionario de la solución, con los embalses indexados por ID."""
+        return {
+            "dams": {
+                dam_id: {
+                    "flows": self.flows[d].tolist(),
+                    "id": dam_id,
+                    "power": self.powers[d].tolist(),
+                    "volume": self.volumes[d].tolist(),
+                }
+                for d, dam_id in enumerate(self.dam_ids)
+            },
+            "price": self.price.tolist(),
+        }
 
     def to_json(self, filepath=None) -> str:
         """Convierte la solución en un JSON. Si se proporciona un filepath, lo guarda en un archivo."""
@@ -49,26 +200,41 @@ class LPSolution:
                 f.write(solution_json)
         return solution_json
     
-    def get_exiting_flows_of_dam(self, idx: str) -> list[float]:
+    def get_exiting_flows_of_dam(self, idx: str) -> np.ndarray:
         """
         Get the assigned flows to the given dam.
 
         :param idx: ID of the dam in the river basin
-        :return: List indicating the assigned flow exiting the reservoir at each point in time (m3/s)
+        :return: Array indicating the assigned flow exiting the reservoir at each point in time (m3/s)
         """
 
-        return self.data["dams"][idx]["flows"]
+        return self.flows[self.dam_index[idx]]
     
-    def get_volumes_of_dam(self, idx: str) -> list[float] | None:
+    def get_volumes_of_dam(self, idx: str) -> np.ndarray:
 
         """
         Get the predicted volumes of the given dam.
 
         :param idx: ID of the dam in the river basin
-        :return: List indicating the volume of the reservoir at the end of every time step (m3)
+        :return: Array indicating the volume of the reservoir at the end of every time step (m3)
         """
 
-        return self.data["dams"][idx].get("volume")
+        return self.volumes[self.dam_index[idx]]
+
+
+def variable_values(variables: dict, dam_index: dict, num_time_steps: int) -> np.ndarray:
+    """
+    Collects the values of a family of variables indexed by (dam_id, t) in a single pass over its keys.
+
+    :param variables: Dictionary {(dam_id, t): LpVariable}
+    :param dam_index: Row of each dam in the array
+    :return: Array of shape (num_dams, num_time_steps) with the values (NaN if the variable has no value)
+    """
+    values = np.full((len(dam_index), num_time_steps), np.nan)
+    for (i, t), var in variables.items():
+        if var.varValue is not None:
+            values[dam_index[i], t] = var.varValue
+    return values
 
 
 class LPModel:
@@ -81,577 +247,256 @@ class LPModel:
         self.instance = instance
         self.config = config
         self.solution = solution
+        self.variables = {}
+        # Conjuntos SOS2 del modelo (formulación "sos2"), indexados por (curva, embalse, franja)
+        self.sos2_sets = {}
+        # Regiones de la curva Potencia - Caudal turbinado codificadas con las binarias y_pq (formulación "sos2"
+        # o piezas cóncavas de detect_concave_curves)
+        self.pq_regions = {}
+        # Expresiones de las variables sustituidas (substitute_defined_variables), indexadas como las variables
+        self.expressions = {}
+        # Variables fijadas a 0 por el presolve, como (familia, índice)
+        self.presolve_fixed = set()
+        # Funciones que construyen las filas de cada familia perezosa (lazy_constraints) a partir de su índice,
+        # filas ya añadidas ({(familia, índice): número de filas}) y número de resoluciones
+        self.lazy_rows = {}
+        self.lazy_added = {}
+        self.lazy_rounds = 0
+        # Parámetros derivados de los de la instancia con los que se construye el modelo en lugar de ellos (modelo
+        # comprimido de solve_compressed o ventana de Relax&Fix) y resumen de la compresión
+        self.derived_parameters = None
+        self.compression_report = {}
+        # Filas del balance de volumen de cada (embalse, franja), p. ej. para leer sus duales
+        self.balance_rows = {}
+        self._bounds = None
+        # Parámetros de la instancia y campos de la configuración con los que se calcularon
+        self._parameters = None
 
-    # Método de prueba que posteriormente se eliminará
-    def LPModel_print(self):
-        # Sets
-        """
-        Conjunto embalses: I
-        """
-        I = self.instance.get_ids_of_dams()
-        """
-        Conjunto franjas de tiempo: T
-        """
-        T = list(range(self.instance.get_largest_impact_horizon()))
-        """
-        Conjunto lags relevantes: L
-        """
-        L = {
-            dam_id: self.instance.get_verification_lags_of_dam(dam_id)
-            for dam_id in self.instance.get_ids_of_dams()
-        }
+    @property
+    def parameters(self) -> ModelParameters:
+        """
+        Sets and parameters of the model (memoized by content of the instance and the configuration),
+        or the derived ones it is built with instead (see derived_parameters). They are looked up once
+        and kept until a field of the configuration they depend on changes.
+        """
+        if self.derived_parameters is not None:
+            return self.derived_parameters
+        campos = configuration_fields(self.config)
+        if self._parameters is None or self._parameters[0] != campos:
+            self._parameters = (campos, ModelParameters.from_instance(self.instance, self.config))
+        return self._parameters[1]
+
+    @property
+    def bounds(self) -> PresolveBounds:
         """
-        Conjunto breakpoints en curva Potencia - Caudal turbinado: BreakPointsPQ
+        Bounds of volumes and flows and reachable curve segments propagated from the parameters.
         """
-        BreakPointsPQ = {
-            dam_id: list(
-                range(
-                    len(
-                        self.instance.get_turbined_flow_obs_for_power_group(
-                            dam_id
-                        )["observed_flows"]
-                    )
-                )
+        if self._bounds is None:
+            self._bounds = PresolveBounds.from_parameters(
+                self.parameters, cumulative_startups=self.config.startup_formulation == "cumulative"
             )
-            for dam_id in self.instance.get_ids_of_dams()
-        }
-        # Ajustamos este conjunto para corregir indexación
-        for key in BreakPointsPQ:
-            for i in range(len(BreakPointsPQ[key])):
-                BreakPointsPQ[key][i] += 1
-        """
-        Conjunto breakpoints en curva Volumen - Caudal máximo: BreakPointsVQ
-        """
-        BreakPointsVQ = {}
-        for dam_id in self.instance.get_ids_of_dams():
-            if self.instance.get_flow_limit_obs_for_channel(dam_id) != None:
-                BreakPointsVQ[dam_id] = list(
-                    range(
-                        len(
-                            self.instance.get_flow_limit_obs_for_channel(
-                                dam_id
-                            )["observed_vols"]
-                        )
-                    )
-                )
-            else:
-                BreakPointsVQ[dam_id] = None
-        # Ajustamos este conjunto para corregir indexación
-        for key in BreakPointsVQ:
-            if BreakPointsVQ[key] != None:
-                for i in range(len(BreakPointsVQ[key])):
-                    BreakPointsVQ[key][i] += 1
+        return self._bounds
 
-        # Parameters
-        """
-        Parámetro duración de cada franja (s): D
-        """
-        D = self.instance.get_time_step_seconds()
-        """
-        Parámetro franja donde se compara con volumen objetivo: D_1
-        """
-        D_1 = self.instance.get_decision_horizon()
-        """
-        Parámetro caudal no regulado (m3/s): Qnr
-        """
-        Qnr = {
-            dam_id: self.instance.get_all_unregulated_flows_of_dam(dam_id)
-            for dam_id in self.instance.get_ids_of_dams()
-        }
-        """
-        Parámetro caudal máximo permitido por canal (m3/s): QMax
-        """
-        QMax = {
-            dam_id: self.instance.get_max_flow_of_channel(dam_id)
-            for dam_id in self.instance.get_ids_of_dams()
-        }
-        """
-        Parámetro caudal turbinado en los breakpoints
-        de la curva Potencia - Caudal turbinado (m3/s): QtBP
-        """
-        QtBP = {
-            dam_id: self.instance.get_turbined_flow_obs_for_power_group(
-                dam_id
-            )["observed_flows"]
-            for dam_id in self.instance.get_ids_of_dams()
-        }
-        """
-        Parámetro potencia en los breakpoints
-        de la curva Potencia - Caudal turbinado (MWh): PotBP
-        """
-        PotBP = {
-            dam_id: self.instance.get_turbined_flow_obs_for_power_group(
-                dam_id
-            )["observed_powers"]
-            for dam_id in self.instance.get_ids_of_dams()
-        }
-        """
-        Parámetro caudal máximo en los breakpoints
-        de la curva Volumen - Caudal máximo (m3/s): QmaxBP
-        """
-        QmaxBP = {}
-        for dam_id in self.instance.get_ids_of_dams():
-            if self.instance.get_flow_limit_obs_for_channel(dam_id) != None:
-                QmaxBP[dam_id] = self.instance.get_flow_limit_obs_for_channel(
-                    dam_id
-                )["observed_flows"]
-            else:
-                QmaxBP[dam_id] = None
-        """
-        Parámetro volumen en los breakpoints
-        de la curva Volumen - Caudal máximo (m3): VolBP
-        """
-        VolBP = {}
-        for dam_id in self.instance.get_ids_of_dams():
-            if self.instance.get_flow_limit_obs_for_channel(dam_id) != None:
-                VolBP[dam_id] = self.instance.get_flow_limit_obs_for_channel(
-                    dam_id
-                )["observed_vols"]
-            else:
-                VolBP[dam_id] = None
-        """
-        Parámetro volumen inicial (m3): V0
-        """
-        V0 = {
-            dam_id: self.instance.get_initial_vol_of_dam(dam_id)
-            for dam_id in self.instance.get_ids_of_dams()
-        }
-        """
-        Parámetro volumen máximo (m3): VMax
-        """
-        VMax = {
-            dam_id: self.instance.get_max_vol_of_dam(dam_id)
-            for dam_id in self.instance.get_ids_of_dams()
-        }
-        """
-        Parámetro volumen mínimo (m3): VMin
-        """
-        VMin = {
-            dam_id: self.instance.get_min_vol_of_dam(dam_id)
-            for dam_id in self.instance.get_ids_of_dams()
-        }
-        """
-        Parámetro franjas sin cambio en el caudal de salida: TMin
-        """
-        # TMin = self.config.step_min
-        """
-        Parámetro franjas sin cambio en el caudal de salida: K
-        """
-        K = self.config.flow_smoothing
-        """
-        Parámetro precio en cada franja (€/MWh): Price
-        """
-        Price = self.instance.get_all_prices()
-        """
-        Parámetro lags iniciales en el caudal de entrada
-        a cada embalse (m3/s): IniLags
-        """
-        IniLags = {
-            dam_id: self.instance.get_initial_lags_of_channel(dam_id)
-            for dam_id in self.instance.get_ids_of_dams()
-        }
-        """
-        Parámetro volumen final objetivo (m3): VolFinal
-        """
-        VolFinal = {
-            dam_id: self.config.volume_objectives[dam_id]
-            for dam_id in self.instance.get_ids_of_dams()
-        }
-        """
-        Parámetro caudal entrante al primer embalse (m3/s): Q0
-        """
-        Q0 = self.instance.get_all_incoming_flows()
-        """
-        Parámetro bonus por exceder volumen objetivo (€/m3): BonusVol
-        """
-        BonusVol = self.config.volume_exceedance_bonus
-        """
-        Parámetro penalización por no llegar a volumen objetivo (€/m3): PenVol
+    @property
+    def volume_scale(self) -> float:
         """
-        PenVol = self.config.volume_shortage_penalty
+        Volume unit of the model (m3): ModelParameters.EscalaVol with scale_units, 1 otherwise.
         """
-        Parámetro penalización por franja en zona límite
-        (€/nºfranjas): PenZL
-        """
-        PenZL = self.config.limit_zones_penalty
-        """
-        Parámetro penalización por arranque de grupo de potencia
-        (€/nºarranques): PenSU
-        """
-        PenSU = self.config.startups_penalty
+        return self.parameters.EscalaVol if self.config.scale_units else 1.0
+
+    def presolve_report(self) -> dict:
         """
-        Parámetro caudal turbinado de apagado de turbina (m3/s): shutdown_flows
+        :return: Number of variables of each family fixed by the presolve
         """
-        shutdown_flows = {
-            dam_id: self.instance.get_shutdown_flows_of_power_group(dam_id)
-            for dam_id in self.instance.get_ids_of_dams()
-        }
+        report = {}
+        for varname, _ in self.presolve_fixed:
+            report[varname] = report.get(varname, 0) + 1
+        return report
+
+    def lazy_report(self) -> dict:
         """
-        Parámetro caudal turbinado de arranque de turbina (m3/s): startup_flows
+        :return: Number of solves and of rows of each family added by the lazy constraint generation
         """
-        startup_flows = {
-            dam_id: self.instance.get_startup_flows_of_power_group(dam_id)
-            for dam_id in self.instance.get_ids_of_dams()
-        }
+        report = {"rounds": self.lazy_rounds}
+        for (family, _), num_rows in self.lazy_added.items():
+            report[family] = report.get(family, 0) + num_rows
+        return report
 
-        # Proceso para eliminar la desviación de decimales de startup_flows y shutdown_flows
-        for i in I:
-            for y in range(len(startup_flows[i])):
-                for w in range(len(QtBP[i])):
-                    if (startup_flows[i][y] - QtBP[i][w]) <= 0.1 and (startup_flows[i][y] - QtBP[i][w]) >= -0.1:
-                        QtBP[i][w] = startup_flows[i][y]
+    # Método de prueba que posteriormente se eliminará
+    def LPModel_print(self):
+        # Sets and parameters
+        p = self.parameters
+        print(f"I={list(p.I)}")
+        print(f"T={list(range(p.num_time_steps))}")
+        print(f"L={dict(p.L)}")
+        print(f"BreakPointsPQ={dict(p.BreakPointsPQ)}")
+        print(f"BreakPointsVQ={dict(p.BreakPointsVQ)}")
+        print(f"D={p.D}")
+        print(f"Qnr={dict(zip(p.I, p.Qnr.tolist()))}")
+        print(f"QMax={dict(zip(p.I, p.QMax.tolist()))}")
+        print(f"QtBP={ {i: p.QtBP[i].tolist() for i in p.I} }")
+        print(f"PotBP={ {i: p.PotBP[i].tolist() for i in p.I} }")
+        print(f"QmaxBP={ {i: p.QmaxBP[i].tolist() if p.QmaxBP[i] is not None else None for i in p.I} }")
+        print(f"VolBP={ {i: p.VolBP[i].tolist() if p.VolBP[i] is not None else None for i in p.I} }")
+        print(f"V0={dict(zip(p.I, p.V0.tolist()))}")
+        print(f"VMax={dict(zip(p.I, p.VMax.tolist()))}")
+        print(f"VMin={dict(zip(p.I, p.VMin.tolist()))}")
+        print(f"K={p.K}")
+        print(f"Price={p.Price.tolist()}")
+        print(f"IniLags={ {i: p.IniLags[i].tolist() for i in p.I} }")
+        print(f"VolFinal={dict(zip(p.I, p.VolFinal.tolist()))}")
+        print(f"Q0={p.Q0.tolist()}")
+        print(f"BonusVol={p.BonusVol}")
+        print(f"PenVol={p.PenVol}")
+        print(f"PenZL={p.PenZL}")
+        print(f"PenSU={p.PenSU}")
+        print(f"shutdown_flows={ {i: p.shutdown_flows[i].tolist() for i in p.I} }")
+        print(f"startup_flows={ {i: p.startup_flows[i].tolist() for i in p.I} }")
+        print(f"ZonaLimitePQ={ {i: list(p.ZonaLimitePQ[i]) for i in p.I} }")
+        print(f"FranjasGrupos={ {i: {pg: list(franjas) for pg, franjas in p.FranjasGrupos[i].items()} for i in p.I} }")
+        print(f"D_1={p.D_1}")
+        if self.config.simplify_pq_curves:
+            for i, (num_bp, num_vars) in self.curve_simplification_report().items():
+                print(f"Simplificación curva PQ {i}: {num_bp} breakpoints y {num_vars} variables eliminadas")
 
-        for i in I:
-            for y in range(len(shutdown_flows[i])):
-                for w in range(len(QtBP[i])):
-                    if (shutdown_flows[i][y] - QtBP[i][w]) <= 0.1 and (shutdown_flows[i][y] - QtBP[i][w]) >= -0.1:
-                        QtBP[i][w] = shutdown_flows[i][y]
+    def curve_simplification_report(self) -> dict:
         """
-        Parámetro zonas límite de cada embalse
-        en la curva Potencia - Caudal turbinado: ZonaLimitePQ
+        :return: Number of breakpoints and of variables of the model removed by the simplification
+        of the PQ curve of each dam (see LPConfiguration.simplify_pq_curves)
         """
-        ZonaLimitePQ = {}
-        for dam_id in self.instance.get_ids_of_dams():
-            ZonaLimitePQ[dam_id] = []
-        for i in I:
-            for bp in QtBP[i]:
-                if bp in shutdown_flows[i]:
-                    ZonaLimitePQ[i].append(QtBP[i].index(bp)+1)
-        # Proceso para eliminar la primera franja
-        # (antes del primer arranque) de este parámetro
-        for i in I:
-            ZonaLimitePQ[i].pop(0)
-        """
-        Parámetro conjunto de franjas para cada powergroup
-        de cada embalse: FranjasGrupos
-        """
-        FranjasGrupos1 = {}
-        FranjasGrupos = {}
-        for i in I:
-            FranjasGrupos1[i] = {}
-            for gp in range(len(startup_flows[i])):
-                FranjasGrupos1[i]["Grupo_potencia" + str(gp + 1)] = []
-                for bp in QtBP[i]:
-                    if gp == (len(startup_flows[i]) - 1):
-                        if bp >= startup_flows[i][gp]:
-                            FranjasGrupos1[i]["Grupo_potencia" + str(gp + 1)].append(QtBP[i].index(bp) + 1)
-                            if bp == QtBP[i][-1]:
-                                FranjasGrupos1[i]["Grupo_potencia" + str(gp + 1)].pop(-1)
-                    else:
-                        if bp >= startup_flows[i][gp] and bp < startup_flows[i][gp + 1]:
-                            FranjasGrupos1[i]["Grupo_potencia" + str(gp + 1)].append(QtBP[i].index(bp) + 1)
-            FranjasGrupos[i] = {"Grupo_potencia0": [1]}
-            FranjasGrupos[i].update(FranjasGrupos1[i])
-
-        print(f"{I=}")
-        print(f"{T=}")
-        print(f"{L=}")
-        print(f"{BreakPointsPQ=}")
-        print(f"{BreakPointsVQ=}")
-        print(f"{D=}")
-        print(f"{Qnr=}")
-        print(f"{QMax=}")
-        print(f"{QtBP=}")
-        print(f"{PotBP=}")
-        print(f"{QmaxBP=}")
-        print(f"{VolBP=}")
-        print(f"{V0=}")
-        print(f"{VMax=}")
-        print(f"{VMin=}")
-        # print(f"{TMin=}")
-        print(f"{K=}")
-        print(f"{Price=}")
-        print(f"{IniLags=}")
-        print(f"{VolFinal=}")
-        print(f"{Q0=}")
-        print(f"{BonusVol=}")
-        print(f"{PenVol=}")
-        print(f"{PenZL=}")
-        print(f"{PenSU=}")
-        print(f"{shutdown_flows=}")
-        print(f"{startup_flows=}")
-        print(f"{ZonaLimitePQ=}")
-        print(f"{FranjasGrupos=}")
-        print(f"{D_1=}")
+        p = self.parameters
 
-    def solve(self, options: dict = None) -> dict:
-        # LP Problem
-        lpproblem = lp.LpProblem("Problema_General_24h_PL", lp.LpMaximize)
+        def num_variables(num_bp):
+            # Variables de la curva Potencia - Caudal turbinado por franja de tiempo
+            if self.config.pwl_formulation == "sos2":
+                return num_bp
+            if self.config.pwl_formulation == "log":
+                return num_bp + (num_bp + 1) + (num_bp - 2).bit_length()
+            return num_bp + (num_bp + 1)
 
-        # Sets
-        """
-        Conjunto embalses: I
-        """
-        I = self.instance.get_ids_of_dams()
-        """
-        Conjunto franjas de tiempo: T
-        """
-        T = list(range(self.instance.get_largest_impact_horizon()))
-        """
-        Conjunto lags relevantes: L
-        """
-        L = {
-            dam_id: self.instance.get_verification_lags_of_dam(dam_id)
-            for dam_id in self.instance.get_ids_of_dams()
-        }
-        """
-        Conjunto breakpoints en curva Potencia - Caudal turbinado: BreakPointsPQ
-        """
-        BreakPointsPQ = {
-            dam_id: list(
-                range(
-                    len(
-                        self.instance.get_turbined_flow_obs_for_power_group(dam_id)[
-                            "observed_flows"
-                        ]
-                    )
-                )
+        report = {}
+        for i in p.I:
+            num_bp = len(p.BreakPointsPQ[i])
+            eliminados = p.BreakPointsEliminadosPQ[i]
+            report[i] = (
+                eliminados,
+                p.num_time_steps * (num_variables(num_bp + eliminados) - num_variables(num_bp)),
             )
-            for dam_id in self.instance.get_ids_of_dams()
-        }
-        # Ajustamos este conjunto para corregir indexación
-        for key in BreakPointsPQ:
-            for i in range(len(BreakPointsPQ[key])):
-                BreakPointsPQ[key][i] += 1
-        """
-        Conjunto breakpoints en curva Volumen - Caudal máximo: BreakPointsVQ
-        """
-        BreakPointsVQ = {}
-        for dam_id in self.instance.get_ids_of_dams():
-            if self.instance.get_flow_limit_obs_for_channel(dam_id) != None:
-                BreakPointsVQ[dam_id] = list(
-                    range(
-                        len(
-                            self.instance.get_flow_limit_obs_for_channel(dam_id)[
-                                "observed_vols"
-                            ]
-                        )
-                    )
-                )
-            else:
-                BreakPointsVQ[dam_id] = None
-        # Ajustamos este conjunto para corregir indexación
-        for key in BreakPointsVQ:
-            if BreakPointsVQ[key] != None:
-                for i in range(len(BreakPointsVQ[key])):
-                    BreakPointsVQ[key][i] += 1
-        # Parameters
-        """
-        Parámetro duración de cada franja (s): D
-        """
-        D = self.instance.get_time_step_seconds()
-        """
-        Parámetro franja donde se compara con volumen objetivo: D_1
-        """
-        D_1 = self.instance.get_decision_horizon()
-        """
-        Parámetro caudal no regulado (m3/s): Qnr
-        """
-        Qnr = {
-            dam_id: self.instance.get_all_unregulated_flows_of_dam(dam_id)
-            for dam_id in self.instance.get_ids_of_dams()
-        }
-        """
-        Parámetro caudal máximo permitido por canal (m3/s): QMax
-        """
-        QMax = {
-            dam_id: self.instance.get_max_flow_of_channel(dam_id)
-            for dam_id in self.instance.get_ids_of_dams()
-        }
-        """
-        Parámetro caudal turbinado en los breakpoints
-        de la curva Potencia - Caudal turbinado (m3/s): QtBP
-        """
-        QtBP = {
-            dam_id: self.instance.get_turbined_flow_obs_for_power_group(dam_id)[
-                "observed_flows"
-            ]
-            for dam_id in self.instance.get_ids_of_dams()
-        }
-        """
-        Parámetro potencia en los breakpoints
-        de la curva Potencia - Caudal turbinado (MWh): PotBP
-        """
-        PotBP = {
-            dam_id: self.instance.get_turbined_flow_obs_for_power_group(dam_id)[
-                "observed_powers"
-            ]
-            for dam_id in self.instance.get_ids_of_dams()
-        }
-        """
-        Parámetro caudal máximo en los breakpoints
-        de la curva Volumen - Caudal máximo (m3/s): QmaxBP
-        """
-        QmaxBP = {}
-        for dam_id in self.instance.get_ids_of_dams():
-            if self.instance.get_flow_limit_obs_for_channel(dam_id) != None:
-                QmaxBP[dam_id] = self.instance.get_flow_limit_obs_for_channel(dam_id)[
-                    "observed_flows"
-                ]
-            else:
-                QmaxBP[dam_id] = None
-        """
-        Parámetro volumen en los breakpoints
-        de la curva Volumen - Caudal máximo (m3): VolBP
-        """
-        VolBP = {}
-        for dam_id in self.instance.get_ids_of_dams():
-            if self.instance.get_flow_limit_obs_for_channel(dam_id) != None:
-                VolBP[dam_id] = self.instance.get_flow_limit_obs_for_channel(dam_id)[
-                    "observed_vols"
-                ]
-            else:
-                VolBP[dam_id] = None
-        """
-        Parámetro volumen inicial (m3): V0
-        """
-        V0 = {
-            dam_id: self.instance.get_initial_vol_of_dam(dam_id)
-            for dam_id in self.instance.get_ids_of_dams()
-        }
-        """
-        Parámetro volumen máximo (m3): VMax
-        """
-        VMax = {
-            dam_id: self.instance.get_max_vol_of_dam(dam_id)
-            for dam_id in self.instance.get_ids_of_dams()
-        }
-        """
-        Parámetro volumen mínimo (m3): VMin
-        """
-        VMin = {
-            dam_id: self.instance.get_min_vol_of_dam(dam_id)
-            for dam_id in self.instance.get_ids_of_dams()
-        }
+        return report
 
-        #CON TMIN
+    def build_model(self) -> lp.LpProblem:
         """
-        Parámetro franjas sin cambio en el caudal de salida: TMin
-        """
-        #TMin = self.config.step_min
+        Builds the PuLP model of the problem.
 
-        #CON K FORMA CARLOS Y ÁLVARO
-        """
-        Parámetro franjas sin cambio en el caudal de salida: K
+        :return: The LpProblem, with its variables stored by name in self.variables
         """
-        K = self.config.flow_smoothing
-
+        # LP Problem
+        lpproblem = lp.LpProblem("Problema_General_24h_PL", lp.LpMaximize)
 
+        # Sets and parameters (calculados una única vez por instancia y configuración, ver model_parameters.py)
+        p = self.parameters
         """
-        Parámetro precio en cada franja (€/MWh): Price
-        """
-        Price = self.instance.get_all_prices()
-        """
-        Parámetro lags iniciales en el caudal de entrada
-        a cada embalse (m3/s): IniLags
-        """
-        IniLags = {
-            dam_id: self.instance.get_initial_lags_of_channel(dam_id)
-            for dam_id in self.instance.get_ids_of_dams()
-        }
-        """
-        Parámetro volumen final objetivo (m3): VolFinal
-        """
-        VolFinal = {
-            dam_id: self.config.volume_objectives[dam_id]
-            for dam_id in self.instance.get_ids_of_dams()
-        }
-        """
-        Parámetro caudal entrante al primer embalse (m3/s): Q0
-        """
-        Q0 = self.instance.get_all_incoming_flows()
-        """
-        Parámetro bonus por exceder volumen objetivo (€/m3): BonusVol
-        """
-        BonusVol = self.config.volume_exceedance_bonus
-        """
-        Parámetro penalización por no llegar a volumen objetivo (€/m3): PenVol
-        """
-        PenVol = self.config.volume_shortage_penalty
-        """
-        Parámetro penalización por franja en zona límite
-        (€/nºfranjas): PenZL
-        """
-        PenZL = self.config.limit_zones_penalty
-        """
-        Parámetro penalización por arranque de grupo de potencia
-        (€/nºarranques): PenSU
-        """
-        PenSU = self.config.startups_penalty
-        """
-        Parámetro caudal turbinado de apagado de turbina (m3/s): shutdown_flows
-        """
-        shutdown_flows = {
-            dam_id: self.instance.get_shutdown_flows_of_power_group(dam_id)
-            for dam_id in self.instance.get_ids_of_dams()
-        }
-        """
-        Parámetro caudal turbinado de arranque de turbina (m3/s): startup_flows
+        Conjunto embalses: I
         """
-        startup_flows = {
-            dam_id: self.instance.get_startup_flows_of_power_group(dam_id)
-            for dam_id in self.instance.get_ids_of_dams()
-        }
-
-        # Proceso para eliminar la desviación de decimales de startup_flows y shutdown_flows
-        for i in I:
-            for y in range(len(startup_flows[i])):
-                for w in range(len(QtBP[i])):
-                    if (startup_flows[i][y] - QtBP[i][w]) <= 0.1 and (
-                            startup_flows[i][y] - QtBP[i][w]
-                    ) >= -0.1:
-                        startup_flows[i][y] = QtBP[i][w]
-        for i in I:
-            for y in range(len(shutdown_flows[i])):
-                for w in range(len(QtBP[i])):
-                    if (shutdown_flows[i][y] - QtBP[i][w]) <= 0.1 and (
-                            shutdown_flows[i][y] - QtBP[i][w]
-                    ) >= -0.1:
-                        shutdown_flows[i][y] = QtBP[i][w]
-        """
-        Parámetro zonas límite de cada embalse
-        en la curva Potencia - Caudal turbinado: ZonaLimitePQ
-        """
-        ZonaLimitePQ = {}
-        for dam_id in self.instance.get_ids_of_dams():
-            ZonaLimitePQ[dam_id] = []
-        for i in I:
-            for bp in QtBP[i]:
-                if bp in shutdown_flows[i]:
-                    ZonaLimitePQ[i].append(QtBP[i].index(bp) + 1)
-        # Proceso para eliminar la primera franja
-        # (antes del primer arranque) de este parámetro
-        for i in I:
-            ZonaLimitePQ[i].pop(0)
+        I = p.I
         """
-        Parámetro conjunto de franjas para cada powergroup
-        de cada embalse: FranjasGrupos
+        Conjunto franjas de tiempo: T
         """
-        FranjasGrupos1 = {}
-        FranjasGrupos = {}
-        for i in I:
-            FranjasGrupos1[i] = {}
-            for gp in range(len(startup_flows[i])):
-                FranjasGrupos1[i]["Grupo_potencia" + str(gp + 1)] = []
-                for bp in QtBP[i]:
-                    if gp == (len(startup_flows[i]) - 1):
-                        if bp >= startup_flows[i][gp]:
-                            FranjasGrupos1[i]["Grupo_potencia" + str(gp + 1)].append(
-                                QtBP[i].index(bp) + 1
-                            )
-                            if bp == QtBP[i][-1]:
-                                FranjasGrupos1[i]["Grupo_potencia" + str(gp + 1)].pop(-1)
-                    else:
-                        if bp >= startup_flows[i][gp] and bp < startup_flows[i][gp + 1]:
-                            FranjasGrupos1[i]["Grupo_potencia" + str(gp + 1)].append(
-                                QtBP[i].index(bp) + 1
-                            )
-            FranjasGrupos[i] = {"Grupo_potencia0": [1]}
-            FranjasGrupos[i].update(FranjasGrupos1[i])
+        T = list(range(p.num_time_steps))
+        """
+        Conjuntos lags relevantes (L) y breakpoints en las curvas
+        Potencia - Caudal turbinado (BreakPointsPQ) y Volumen - Caudal máximo (BreakPointsVQ)
+        """
+        L = p.L
+        BreakPointsPQ = p.BreakPointsPQ
+        BreakPointsVQ = p.BreakPointsVQ
+        """
+        Parámetros generales: D, D_1, K, Price, Q0, BonusVol, PenVol, PenZL, PenSU
+        """
+        D = p.D
+        D_1 = p.D_1
+        K = p.K
+        Price = p.Price
+        Q0 = p.Q0
+        BonusVol = p.BonusVol
+        PenVol = p.PenVol
+        PenZL = p.PenZL
+        PenSU = p.PenSU
+        """
+        Parámetros de cada embalse: Qnr, QMax, V0, VMax, VMin, VolFinal, IniLags
+        (volúmenes en la unidad del modelo, escala m3; ver scale_units)
+        """
+        escala = self.volume_scale
+        # Volumen (en la unidad del modelo) que mueve un caudal de 1 m3/s durante una franja
+        DV = D / escala
+        # Número de franjas de la instancia de cada franja del modelo (varias con la compresión temporal)
+        duracion = [n for _, n in p.Periodos] if p.Periodos is not None else [1] * p.num_time_steps
+        Qnr = dict(zip(I, p.Qnr))
+        QMax = dict(zip(I, p.QMax))
+        V0 = dict(zip(I, p.V0 / escala))
+        VMax = dict(zip(I, p.VMax / escala))
+        VMin = dict(zip(I, p.VMin / escala))
+        VolFinal = dict(zip(I, p.VolFinal / escala))
+        IniLags = p.IniLags
+        """
+        Parámetros de las curvas de cada embalse: QtBP, PotBP, QmaxBP, VolBP, ZonaLimitePQ, FranjasGrupos
+        """
+        QtBP = p.QtBP
+        PotBP = p.PotBP
+        QmaxBP = p.QmaxBP
+        VolBP = {i: p.VolBP[i] / escala if p.VolBP[i] is not None else None for i in I}
+        ZonaLimitePQ = p.ZonaLimitePQ
+        FranjasGrupos = p.FranjasGrupos
+        RegionesPQ = p.RegionesPQ
+        """
+        Formulación de las curvas Potencia - Caudal turbinado y Volumen - Caudal máximo
+        """
+        if self.config.pwl_formulation not in ("winston", "sos2", "log"):
+            raise ValueError(f"Unknown piecewise linear formulation '{self.config.pwl_formulation}'")
+        winston = self.config.pwl_formulation == "winston"
+        sos2 = self.config.pwl_formulation == "sos2"
+        log = self.config.pwl_formulation == "log"
+        if sos2 and self.config.solver not in SOS_BACKENDS:
+            # Sin soporte SOS, el backend no ramificaría sobre los conjuntos y la formulación quedaría relajada
+            raise ValueError(
+                f"The 'sos2' formulation requires a solver with SOS support {SOS_BACKENDS}, not '{self.config.solver}'"
+            )
+        CodigosPQ = p.CodigosPQ
+        """
+        Forma de las curvas (detect_concave_curves): con "winston", cada pieza cóncava de la curva
+        Potencia - Caudal turbinado se codifica con una binaria y_pq, como las regiones de "sos2" pero sin
+        conjuntos SOS2, y las curvas Volumen - Caudal máximo cóncavas se escriben con cortes lineales
+        """
+        piezas = self.config.detect_concave_curves and winston
+        # Curva PQ codificada con binarias por región (y_pq) en lugar de por franja (w_pq)
+        regiones = sos2 or piezas
+        if piezas:
+            RegionesPQ = p.PiezasPQ
+        self.pq_regions = RegionesPQ if regiones else {}
+        CortesVQ = [i for i in I if self.config.detect_concave_curves and p.ConcavaVQ[i]]
+        # Las curvas VQ escritas con cortes no tienen variables de la formulación lineal a trozos
+        QmaxBP = {i: None if i in CortesVQ else QmaxBP[i] for i in I}
+        """
+        Formulación de la restricción golpe de ariete
+        """
+        if self.config.water_hammer_formulation not in ("pairwise", "aggregated", "window_max"):
+            raise ValueError(f"Unknown water hammer formulation '{self.config.water_hammer_formulation}'")
+        ventana_max = self.config.water_hammer_formulation == "window_max"
+        perezosas = self.config.lazy_constraints
+        if perezosas and self.config.water_hammer_formulation != "pairwise":
+            raise ValueError("Lazy constraints require the 'pairwise' water hammer formulation")
+        self.lazy_rows = {}
+        self.lazy_added = {}
+        self.lazy_rounds = 0
+        self.balance_rows = {}
+        if self.config.startup_formulation not in ("previous_group", "cumulative"):
+            raise ValueError(f"Unknown startup formulation '{self.config.startup_formulation}'")
+        # Bloques de K + 1 franjas: toda ventana [t - K, t] es un sufijo de un bloque más un prefijo del siguiente
+        B = K + 1
         # Variables
         """
         Variable volumen en cada embalse en cada franja de tiempo
-        (m3): vol
+        (m3, o escala m3 con scale_units): vol
         """
         vol = lp.LpVariable.dicts(
             "Volumen ", [(i, t) for i in I for t in T], lowBound=0, cat=lp.LpContinuous
@@ -725,6 +570,17 @@ class LPModel:
         0 si no hay variación negativa de caudal en la franja
         """
         x_neg = lp.LpVariable.dicts("01VariacionNeg ", [(i, t) for i in I for t in T], cat=lp.LpBinary)
+        """
+        Variables de la formulación "window_max" del golpe de ariete: máximo de x+ (x-) desde el inicio
+        de su bloque hasta la franja (prefijo) y desde la franja hasta el final de su bloque (sufijo).
+        En la primera franja del bloque el prefijo es la propia x+ (x-) y en la última, el sufijo
+        """
+        claves_prefijo = [(i, t) for i in I for t in T if t % B != 0] if ventana_max else []
+        claves_sufijo = [(i, t) for i in I for t in T if t % B != B - 1 and t != T[-1]] if ventana_max else []
+        max_pos_pre = lp.LpVariable.dicts("MaxVariacionPosPrefijo ", claves_prefijo, lowBound=0, upBound=1)
+        max_neg_pre = lp.LpVariable.dicts("MaxVariacionNegPrefijo ", claves_prefijo, lowBound=0, upBound=1)
+        max_pos_suf = lp.LpVariable.dicts("MaxVariacionPosSufijo ", claves_sufijo, lowBound=0, upBound=1)
+        max_neg_suf = lp.LpVariable.dicts("MaxVariacionNegSufijo ", claves_sufijo, lowBound=0, upBound=1)
 
         #CON K FORMA ÁLVARO
         """
@@ -738,10 +594,22 @@ class LPModel:
         """
         Variable asociada al IP with Piecewise Linear Functions
         de Winston en relación a la curva Potencia - Caudal turbinado
+        (continua en la formulación logarítmica, donde la integralidad la imponen los bits g_pq)
         """
         w_pq = lp.LpVariable.dicts(
-            "01Franja_PQ ",
-            [(i, t, bp) for i in I for t in T for bp in range(0, BreakPointsPQ[i][-1] + 1)],
+            "01Franja_PQ " if winston else "Franja_PQ ",
+            [(i, t, bp) for i in I for t in T for bp in range(0, BreakPointsPQ[i][-1] + 1)] if not regiones else [],
+            lowBound=0,
+            upBound=1,
+            cat=lp.LpBinary if winston else lp.LpContinuous,
+        )
+        """
+        Variable binaria de la formulación logarítmica: g_pq
+        Bit b del código Gray (ver CodigosPQ) de la franja de la curva Potencia - Caudal turbinado
+        """
+        g_pq = lp.LpVariable.dicts(
+            "01BitFranja_PQ ",
+            [(i, t, b) for i in I for t in T for b in range(len(CodigosPQ[i][0]))] if log else [],
             cat=lp.LpBinary,
         )
         """
@@ -755,6 +623,16 @@ class LPModel:
             cat=lp.LpContinuous,
         )
         """
+        Variable binaria de la formulación SOS2: y_pq
+        1 si el punto de la curva Potencia - Caudal turbinado está en la región r (ver RegionesPQ)
+        0 si no lo está
+        """
+        y_pq = lp.LpVariable.dicts(
+            "01Region_PQ ",
+            [(i, t, r) for i in I for t in T for r in range(len(RegionesPQ[i]))] if regiones else [],
+            cat=lp.LpBinary,
+        )
+        """
         Variable asociada al IP with Piecewise Linear Functions
         de Winston en relación a la curva Volumen - Caudal máximo
         """
@@ -763,10 +641,10 @@ class LPModel:
             [
                 (i, t, bp)
                 for i in I
-                if QmaxBP[i] != None
+                if QmaxBP[i] is not None
                 for t in T
                 for bp in range(0, BreakPointsVQ[i][-1] + 1)
-            ],
+            ] if not sos2 else [],
             cat=lp.LpBinary,
         )
         """
@@ -775,7 +653,7 @@ class LPModel:
         """
         z_vq = lp.LpVariable.dicts(
             "PropFranj_VQ ",
-            [(i, t, bp) for i in I if QmaxBP[i] != None for t in T for bp in BreakPointsVQ[i]],
+            [(i, t, bp) for i in I if QmaxBP[i] is not None for t in T for bp in BreakPointsVQ[i]],
             lowBound=0,
             cat=lp.LpContinuous,
         )
@@ -786,20 +664,20 @@ class LPModel:
         """
         q_max_vol = lp.LpVariable.dicts(
             "Caudal máximo volumen ",
-            [(i, t) for i in I if QmaxBP[i] != None for t in T],
+            [(i, t) for i in I if QmaxBP[i] is not None for t in T],
             lowBound=0,
             cat=lp.LpContinuous,
         )
         """
         Variable desviación positiva respecto a volumen objetivo
-        (m3): pos_desv
+        (m3, o escala m3 con scale_units): pos_desv
         """
         pos_desv = lp.LpVariable.dicts(
             "Desviación positiva del ", [i for i in I], lowBound=0, cat=lp.LpContinuous
         )
         """
         Variable desviación negativa respecto a volumen objetivo
-        (m3): pos_desv
+        (m3, o escala m3 con scale_units): neg_desv
         """
         neg_desv = lp.LpVariable.dicts(
             "Desviación negativa del ",
@@ -809,7 +687,7 @@ class LPModel:
         )
         """
         Variable beneficio por falta o exceso respecto
-        al volumen objetivo (€): ben_desv
+        al volumen objetivo (€, o escala € con scale_units): ben_desv
         """
         ben_desv = lp.LpVariable.dicts(
             "Beneficio por desviación volumen del ",
@@ -852,6 +730,104 @@ class LPModel:
             cat=lp.LpContinuous,
         )
 
+        """
+        Sustitución de las variables definidas por una igualdad: caudal de entrada (qe), caudal turbinado (qtb),
+        variación de caudal (qch) y potencia (pot). Sus expresiones ocupan su lugar en las restricciones
+        y las variables, que no forman parte del modelo, solo guardan los valores recuperados tras resolver
+        """
+        sustituir = self.config.substitute_defined_variables
+        definidas = {"qe": qe, "qtb": qtb, "qch": qch, "pot": pot}
+        self.expressions = {}
+
+        # Caudal turbinado según los lags relevantes: media de los lags iniciales y caudales de salida anteriores
+        # (con la compresión temporal, combinación de los de las franjas que alcanza cada lag, ver PesosLags)
+        def caudal_turbinado(i, t):
+            if p.PesosLags is not None:
+                constante, pesos = p.PesosLags[i][t]
+                return lp.lpSum(qs[(i, s)] * peso for s, peso in pesos) + constante
+            return lp.lpSum(IniLags[i][l - 1 - t] for l in L[i] if l - 1 - t >= 0) * (1 / len(L[i])) + lp.lpSum(
+                qs[(i, t - l)] for l in L[i] if t - l >= 0
+            ) * (1 / len(L[i]))
+
+        if sustituir:
+            qtb = {(i, t): caudal_turbinado(i, t) for i in I for t in T}
+            qe = {
+                (i, t): lp.LpAffineExpression(constant=Q0[t] + Qnr[i][t])
+                if i == I[0]
+                else qtb[(I[I.index(i) - 1], t)] + Qnr[i][t]
+                for i in I
+                for t in T
+            }
+            qch = {
+                (i, t): qs[(i, t)] - IniLags[i][0] if t == T[0] else qs[(i, t)] - qs[(i, t - 1)]
+                for i in I
+                for t in T
+            }
+            pot = {
+                (i, t): lp.lpSum(z_pq[(i, t, bp)] * PotBP[i][bp - 1] for bp in BreakPointsPQ[i])
+                for i in I
+                for t in T
+            }
+            self.expressions = {"qe": qe, "qtb": qtb, "qch": qch, "pot": pot}
+
+        """
+        Presolve: cotas propagadas de volúmenes y caudales, y franjas de las curvas y arranques
+        inalcanzables en cada franja de tiempo, que se fijan a 0
+        """
+        self.presolve_fixed = set()
+        if self.config.presolve:
+            b = self.bounds
+
+            def fijar(varname, variables, key):
+                var = variables[key]
+                var.cat = lp.LpContinuous
+                var.lowBound = 0
+                var.upBound = 0
+                self.presolve_fixed.add((varname, key))
+
+            for d, i in enumerate(I):
+                lista_keys = list(FranjasGrupos[i].keys())
+                for t in T:
+                    vol[(i, t)].upBound = b.vol_ub[d, t] / escala
+                    qs[(i, t)].upBound = b.qs_ub[d, t]
+                    if not sustituir:
+                        # Con las variables sustituidas, estas cotas ya las implican las de qs
+                        qe[(i, t)].lowBound = b.qe_lb[d, t]
+                        qe[(i, t)].upBound = b.qe_ub[d, t]
+                        qtb[(i, t)].lowBound = b.qtb_lb[d, t]
+                        qtb[(i, t)].upBound = b.qtb_ub[d, t]
+                        qch[(i, t)].lowBound = b.qch_lb[d, t]
+                        qch[(i, t)].upBound = b.qch_ub[d, t]
+                    if b.qch_ub[d, t] <= TOLERANCE:
+                        fijar("x_pos", x_pos, (i, t))
+                    if b.qch_lb[d, t] >= -TOLERANCE:
+                        fijar("x_neg", x_neg, (i, t))
+
+                    franjas = b.franjas_pq[i][t]
+                    for franja in range(1, len(franjas) + 1):
+                        if not franjas[franja - 1] and not regiones:
+                            fijar("w_pq", w_pq, (i, t, franja))
+                    for bp in BreakPointsPQ[i]:
+                        if not franjas[max(bp - 2, 0):bp].any():
+                            fijar("z_pq", z_pq, (i, t, bp))
+                    for r, region in enumerate(RegionesPQ[i] if regiones else []):
+                        if not any(franjas[franja - 1] for franja in region):
+                            fijar("y_pq", y_pq, (i, t, r))
+
+                    if QmaxBP[i] is not None:
+                        franjas = b.franjas_vq[i][t]
+                        for franja in range(1, len(franjas) + 1):
+                            if not franjas[franja - 1] and not sos2:
+                                fijar("w_vq", w_vq, (i, t, franja))
+                        for bp in BreakPointsVQ[i]:
+                            if not franjas[max(bp - 2, 0):bp].any():
+                                fijar("z_vq", z_vq, (i, t, bp))
+
+                    for k, pg in enumerate(lista_keys):
+                        if not b.arranques[i][t, k]:
+                            fijar("pwch", pwch, (i, t, pg))
+            print(f"Presolve: variables fijadas a 0 {self.presolve_report()}")
+
         # Constraints
         """
         Restricción balance de volumen
@@ -859,14 +835,18 @@ class LPModel:
         for i in I:
             for t in T:
                 if t == T[0]:
-                    lpproblem += vol[(i, t)] <= V0[i] + D * (qe[(i, t)] - qs[(i, t)])
+                    fila = vol[(i, t)] <= V0[i] + DV * duracion[t] * (qe[(i, t)] - qs[(i, t)])
                 else:
-                    lpproblem += vol[(i, t)] <= vol[(i, t - 1)] + D * (qe[(i, t)] - qs[(i, t)])
+                    fila = vol[(i, t)] <= vol[(i, t - 1)] + DV * duracion[t] * (qe[(i, t)] - qs[(i, t)])
+                lpproblem += fila
+                self.balance_rows[(i, t)] = fila
         """
         Restricción caudal de entrada
         """
         for i in I:
             for t in T:
+                if sustituir:
+                    continue
                 if i == I[0]:
                     lpproblem += qe[(i, t)] == Q0[t] + Qnr[i][t]
                 else:
@@ -876,17 +856,17 @@ class LPModel:
         """
         for i in I:
             for t in T:
-                lpproblem += qtb[(i, t)] == lp.lpSum(
-                    IniLags[i][l - 1 - t] for l in L[i] if l - 1 - t >= 0
-                ) * (1 / len(L[i])) + lp.lpSum(qs[(i, t - l)] for l in L[i] if t - l >= 0) * (
-                                     1 / len(L[i])
-                             )
+                if sustituir:
+                    continue
+                lpproblem += qtb[(i, t)] == caudal_turbinado(i, t)
         """
         Restricción asociada al IP with Piecewise Linear Functions de Winston
         en referencia a la curva Potencia - Caudal turbinado
         """
         for i in I:
             for t in T:
+                if sustituir:
+                    continue
                 lpproblem += pot[(i, t)] == lp.lpSum(
                     z_pq[(i, t, bp)] * PotBP[i][bp - 1] for bp in BreakPointsPQ[i]
                 )
@@ -905,16 +885,18 @@ class LPModel:
         """
         for i in I:
             for t in T:
-                lpproblem += w_pq[(i, t, 0)] == 0
-                lpproblem += w_pq[(i, t, BreakPointsPQ[i][-1])] == 0
+                if not regiones:
+                    lpproblem += w_pq[(i, t, 0)] == 0
+                    lpproblem += w_pq[(i, t, BreakPointsPQ[i][-1])] == 0
         """
         Restricción asociada al IP with Piecewise Linear Functions de Winston
         en referencia a la curva Potencia - Caudal turbinado
         """
         for i in I:
             for t in T:
-                for bp in BreakPointsPQ[i]:
-                    lpproblem += z_pq[(i, t, bp)] <= w_pq[(i, t, bp - 1)] + w_pq[(i, t, bp)]
+                if not regiones:
+                    for bp in BreakPointsPQ[i]:
+                        lpproblem += z_pq[(i, t, bp)] <= w_pq[(i, t, bp - 1)] + w_pq[(i, t, bp)]
         """
         Restricción asociada al IP with Piecewise Linear Functions de Winston
         en referencia a la curva Potencia - Caudal turbinado
@@ -928,14 +910,63 @@ class LPModel:
         """
         for i in I:
             for t in T:
-                lpproblem += lp.lpSum(w_pq[(i, t, bp)] for bp in BreakPointsPQ[i]) == 1
+                if not regiones:
+                    lpproblem += lp.lpSum(w_pq[(i, t, bp)] for bp in BreakPointsPQ[i]) == 1
+        """
+        Restricciones de la formulación logarítmica de la curva Potencia - Caudal turbinado:
+        solo puede valer 1 la franja cuyo código Gray coincide con los bits g_pq y, para cada bit,
+        solo pueden tener peso z_pq los breakpoints cuyas franjas adyacentes tienen ese valor del bit
+        """
+        for i in I:
+            for t in T:
+                if log:
+                    for b in range(len(CodigosPQ[i][0])):
+                        lpproblem += lp.lpSum(
+                            w_pq[(i, t, franja)]
+                            for franja, codigo in enumerate(CodigosPQ[i], start=1)
+                            if codigo[b]
+                        ) == g_pq[(i, t, b)]
+                        # Valores del bit b en las franjas adyacentes a cada breakpoint (franjas bp - 1 y bp)
+                        adyacentes = {
+                            bp: {
+                                CodigosPQ[i][franja - 1][b]
+                                for franja in (bp - 1, bp)
+                                if 1 <= franja < BreakPointsPQ[i][-1]
+                            }
+                            for bp in BreakPointsPQ[i]
+                        }
+                        lpproblem += lp.lpSum(
+                            z_pq[(i, t, bp)] for bp, bits in adyacentes.items() if bits == {1}
+                        ) <= g_pq[(i, t, b)]
+                        lpproblem += lp.lpSum(
+                            z_pq[(i, t, bp)] for bp, bits in adyacentes.items() if bits == {0}
+                        ) <= 1 - g_pq[(i, t, b)]
+        """
+        Restricciones de la formulación SOS2 de la curva Potencia - Caudal turbinado:
+        el punto está en la región elegida (y_pq) y, dentro de ella, en un único segmento (SOS2 sobre z_pq).
+        Con piezas cóncavas no hace falta el SOS2: al maximizar la potencia, la combinación de los breakpoints
+        de la pieza ya está sobre la curva
+        """
+        sos2_sets = {}
+        for i in I:
+            for t in T:
+                if regiones:
+                    lpproblem += lp.lpSum(y_pq[(i, t, r)] for r in range(len(RegionesPQ[i]))) == 1
+                    for bp in BreakPointsPQ[i]:
+                        lpproblem += z_pq[(i, t, bp)] <= lp.lpSum(
+                            y_pq[(i, t, r)]
+                            for r, region in enumerate(RegionesPQ[i])
+                            if bp in region or bp - 1 in region
+                        )
+                    if sos2:
+                        sos2_sets[("PQ", i, t)] = {z_pq[(i, t, bp)]: bp for bp in BreakPointsPQ[i]}
         """
         Restricción asociada al IP with Piecewise Linear Functions de Winston
         en referencia a la curva Volumen - Caudal máximo
         """
         for i in I:
             for t in T:
-                if QmaxBP[i] != None:
+                if QmaxBP[i] is not None:
                     lpproblem += q_max_vol[(i, t)] == lp.lpSum(
                         z_vq[(i, t, bp)] * QmaxBP[i][bp - 1] for bp in BreakPointsVQ[i]
                     )
@@ -945,7 +976,7 @@ class LPModel:
         """
         for i in I:
             for t in T:
-                if QmaxBP[i] != None:
+                if QmaxBP[i] is not None:
                     if t == T[0]:
                         lpproblem += V0[i] == lp.lpSum(
                             z_vq[(i, t, bp)] * VolBP[i][bp - 1] for bp in BreakPointsVQ[i]
@@ -960,7 +991,7 @@ class LPModel:
         """
         for i in I:
             for t in T:
-                if QmaxBP[i] != None:
+                if QmaxBP[i] is not None and not sos2:
                     lpproblem += w_vq[(i, t, 0)] == 0
                     lpproblem += w_vq[(i, t, BreakPointsVQ[i][-1])] == 0
         """
@@ -969,7 +1000,7 @@ class LPModel:
         """
         for i in I:
             for t in T:
-                if QmaxBP[i] != None:
+                if QmaxBP[i] is not None and not sos2:
                     for bp in BreakPointsVQ[i]:
                         lpproblem += z_vq[(i, t, bp)] <= lp.lpSum(
                             w_vq[(i, t, tr)] for tr in range(bp - 1, bp + 1)
@@ -980,7 +1011,7 @@ class LPModel:
         """
         for i in I:
             for t in T:
-                if QmaxBP[i] != None:
+                if QmaxBP[i] is not None:
                     lpproblem += lp.lpSum(z_vq[(i, t, bp)] for bp in BreakPointsVQ[i]) == 1
         """
         Restricción asociada al IP with Piecewise Linear Functions de Winston
@@ -988,13 +1019,24 @@ class LPModel:
         """
         for i in I:
             for t in T:
-                if QmaxBP[i] != None:
+                if QmaxBP[i] is not None and not sos2:
                     lpproblem += lp.lpSum(w_vq[(i, t, bp)] for bp in BreakPointsVQ[i]) == 1
         """
+        Restricción de la formulación SOS2 de la curva Volumen - Caudal máximo
+        """
+        for i in I:
+            for t in T:
+                if QmaxBP[i] is not None and sos2:
+                    sos2_sets[("VQ", i, t)] = {z_vq[(i, t, bp)]: bp for bp in BreakPointsVQ[i]}
+        lpproblem.sos2 = {f"SOS2_{curva}_{i}_{t}": conjunto for (curva, i, t), conjunto in sos2_sets.items()}
+        self.sos2_sets = sos2_sets
+        """
         Restricción cálculo variación caudal en cada franja
         """
         for i in I:
             for t in T:
+                if sustituir:
+                    continue
                 if t == T[0]:
                     lpproblem += qch[(i, t)] == qs[(i, t)] - IniLags[i][0]
                 else:
@@ -1027,15 +1069,25 @@ class LPModel:
         """
         Restricción para contabilizar variación positiva de caudal en cada franja
         """
+        # Big-M: el caudal máximo por canal o, con presolve o tight_big_m, las cotas propagadas de la variación
+        # en cada franja (el caudal de salida máximo alcanzable en t, o en t - 1 para la variación negativa)
+        big_m_ajustada = self.config.presolve or self.config.tight_big_m
+
+        def big_m_pos(i, t):
+            return QMax[i] if not big_m_ajustada else max(self.bounds.qch_ub[p.dam_index[i], t], 0.0)
+
+        def big_m_neg(i, t):
+            return QMax[i] if not big_m_ajustada else max(-self.bounds.qch_lb[p.dam_index[i], t], 0.0)
+
         for i in I:
             for t in T:
-                lpproblem += qch[(i, t)] <= x_pos[(i, t)] * QMax[i]
+                lpproblem += qch[(i, t)] <= x_pos[(i, t)] * big_m_pos(i, t)
         """
         Restricción para contabilizar variación negativa de caudal en cada franja
         """
         for i in I:
             for t in T:
-                lpproblem += -qch[(i, t)] <= x_neg[(i, t)] * QMax[i]
+                lpproblem += -qch[(i, t)] <= x_neg[(i, t)] * big_m_neg(i, t)
         """
         Restricción para que solo se cuenta la variación correcta
         """
@@ -1069,13 +1121,77 @@ class LPModel:
         """
         Restricción golpe de ariete
         """
-        for i in I:
-            for t in T:
-                for k in range(1, K+1):
-                    if t - k >= 0:
-                        lpproblem += x_pos[(i, t)] + x_neg[(i, t - k)] <= 1
-                        lpproblem += x_neg[(i, t)] + x_pos[(i, t - k)] <= 1
+        # Franjas anteriores a t sin variación de sentido contrario a la de t: las K anteriores o, con la compresión
+        # temporal, las que empiezan como mucho K franjas de la instancia antes que t
+        def ventana_golpe_ariete(t):
+            if p.Periodos is None:
+                return [t - k for k in range(1, K + 1) if t - k >= 0]
+            return [s for s in range(t - 1, -1, -1) if p.Periodos[t][0] - p.Periodos[s][0] <= K]
+
+        if self.config.water_hammer_formulation == "pairwise":
+            # Filas de la franja t: no hay variación en t y de sentido contrario en t - k
+            def filas_golpe_ariete(i, t):
+                filas = []
+                for s in ventana_golpe_ariete(t):
+                    filas.append(x_pos[(i, t)] + x_neg[(i, s)] <= 1)
+                    filas.append(x_neg[(i, t)] + x_pos[(i, s)] <= 1)
+                return filas
+
+            self.lazy_rows["water_hammer"] = filas_golpe_ariete
+            for i in I:
+                for t in T:
+                    if not perezosas:
+                        for fila in filas_golpe_ariete(i, t):
+                            lpproblem += fila
+
+        elif self.config.water_hammer_formulation == "aggregated":
+            # Si hay variación positiva (negativa) en t, ninguna negativa (positiva) en las K franjas anteriores
+            for i in I:
+                for t in T:
+                    ventana = ventana_golpe_ariete(t)
+                    if ventana:
+                        lpproblem += len(ventana) * x_pos[(i, t)] + lp.lpSum(
+                            x_neg[(i, s)] for s in ventana
+                        ) <= len(ventana)
+                        lpproblem += len(ventana) * x_neg[(i, t)] + lp.lpSum(
+                            x_pos[(i, s)] for s in ventana
+                        ) <= len(ventana)
 
+        else:
+            def prefijo(x, pre, i, t):
+                return x[(i, t)] if t % B == 0 else pre[(i, t)]
+
+            def sufijo(x, suf, i, t):
+                return suf[(i, t)] if (i, t) in suf else x[(i, t)]
+
+            for i in I:
+                for x, pre, suf in ((x_pos, max_pos_pre, max_pos_suf), (x_neg, max_neg_pre, max_neg_suf)):
+                    for t in T:
+                        if (i, t) in pre:
+                            lpproblem += pre[(i, t)] >= x[(i, t)]
+                            lpproblem += pre[(i, t)] >= prefijo(x, pre, i, t - 1)
+                        if (i, t) in suf:
+                            lpproblem += suf[(i, t)] >= x[(i, t)]
+                            lpproblem += suf[(i, t)] >= sufijo(x, suf, i, t + 1)
+                # En la ventana [t - K, t] no puede haber a la vez variaciones positivas y negativas
+                for t in T[1:]:
+                    a = max(t - K, 0)
+                    if a // B == t // B:
+                        lpproblem += prefijo(x_pos, max_pos_pre, i, t) + prefijo(x_neg, max_neg_pre, i, t) <= 1
+                    else:
+                        for maximo_pos in (sufijo(x_pos, max_pos_suf, i, a), prefijo(x_pos, max_pos_pre, i, t)):
+                            for maximo_neg in (sufijo(x_neg, max_neg_suf, i, a), prefijo(x_neg, max_neg_pre, i, t)):
+                                lpproblem += maximo_pos + maximo_neg <= 1
+
+        # En una ventana de Relax&Fix, tampoco de sentido contrario a las variaciones de las K franjas anteriores
+        if p.VariacionesIniciales is not None:
+            for i in I:
+                for t in T[:K]:
+                    anteriores = p.VariacionesIniciales[i][:K - t]
+                    if any(neg for _, neg in anteriores):
+                        lpproblem += x_pos[(i, t)] <= 0
+                    if any(pos for pos, _ in anteriores):
+                        lpproblem += x_neg[(i, t)] <= 0
         """
         Restricción volumen máximo
         """
@@ -1088,6 +1204,15 @@ class LPModel:
         for i in I:
             for t in T:
                 lpproblem += vol[(i, t)] >= VMin[i]
+        # Con la compresión temporal, también en las franjas de la instancia dentro de cada franja: volumen
+        # anterior más las entradas acumuladas (ver EntradasParciales) menos el caudal de salida de esas franjas
+        if p.EntradasParciales is not None:
+            for d, i in enumerate(I):
+                for t in T:
+                    anterior = V0[i] if t == T[0] else vol[(i, t - 1)]
+                    for k, (constante, pesos) in enumerate(p.EntradasParciales[i][t], start=1):
+                        entradas = lp.lpSum(qs[(I[d - 1], s)] * peso for s, peso in pesos) + constante
+                        lpproblem += anterior + DV * (entradas - k * qs[(i, t)]) >= VMin[i]
         """
         Restricción caudal máximo por canal
         (restricción por sección)
@@ -1101,34 +1226,84 @@ class LPModel:
         """
         for i in I:
             for t in T:
-                if QmaxBP[i] != None:
+                if QmaxBP[i] is not None:
                     lpproblem += qs[(i, t)] <= q_max_vol[(i, t)]
+                    # Con la compresión temporal el volumen varía dentro de la franja: el caudal tampoco puede
+                    # superar el máximo del volumen al final de la franja (el de la franja siguiente)
+                    if duracion[t] > 1 and t + 1 in T:
+                        lpproblem += qs[(i, t)] <= q_max_vol[(i, t + 1)]
+        """
+        Restricción caudal máximo por canal (restricción por volumen) con curva Volumen - Caudal máximo cóncava:
+        un corte por franja de la curva, evaluada en el volumen de la franja anterior, que debe estar
+        en el rango de la curva
+        """
+        for i in CortesVQ:
+            pendientes = np.diff(p.QmaxBP[i]) / np.diff(VolBP[i])
+            for t in T:
+                if t == T[0]:
+                    lpproblem += qs[(i, t)] <= np.interp(V0[i], VolBP[i], p.QmaxBP[i])
+                    continue
+                lpproblem += vol[(i, t - 1)] >= VolBP[i][0]
+                lpproblem += vol[(i, t - 1)] <= VolBP[i][-1]
+                for j, pendiente in enumerate(pendientes):
+                    lpproblem += qs[(i, t)] <= p.QmaxBP[i][j] + pendiente * (vol[(i, t - 1)] - VolBP[i][j])
+            for t in T:
+                if duracion[t] > 1:
+                    for j, pendiente in enumerate(pendientes):
+                        lpproblem += qs[(i, t)] <= p.QmaxBP[i][j] + pendiente * (vol[(i, t)] - VolBP[i][j])
         """
         Restricción ganancia (€) total de cada embalse
         """
         for i in I:
             lpproblem += pot_embalse[i] == lp.lpSum(
-                pot[(i, t)] * Price[t] * (D / 3600) for t in T
+                pot[(i, t)] * Price[t] * (D * duracion[t] / 3600) for t in T
             )
         """
         Restricción cómputo desviación respecto a volumen objetivo
         """
         for i in I:
             for t in T:
-                if t == T[D_1 - 1]:
+                if p.ValorAgua is None and t == T[D_1 - 1]:
                     lpproblem += vol[(i, t)] == VolFinal[i] + pos_desv[i] - neg_desv[i]
         """
         Restricción cálculo beneficio por exceso/falta de volumen
         respecto al objetivo
         """
-        for i in I:
+        for d, i in enumerate(I):
+            if p.ValorAgua is not None:
+                # Ventana que acaba antes que el horizonte de decisión: el agua final se valora a ValorAgua,
+                # tanto la del embalse como la que ha salido y se turbina después de la ventana
+                en_transito = lp.lpSum(
+                    qs[(i, t)] * (sum(1 for l in L[i] if t + l >= len(T)) / len(L[i])) for t in T
+                )
+                valor_final = (vol[(i, T[-1])] + DV * en_transito) * p.ValorAgua[d]
+                if p.VolFinalAlcanzable is None:
+                    lpproblem += ben_desv[i] == valor_final
+                    continue
+                # Falta de volumen objetivo que ya no se puede evitar después de la ventana
+                lpproblem += vol[(i, T[-1])] + neg_desv[i] >= p.VolFinalAlcanzable[d] / escala
+                lpproblem += ben_desv[i] == valor_final - neg_desv[i] * PenVol
+                continue
             lpproblem += ben_desv[i] == pos_desv[i] * BonusVol - neg_desv[i] * PenVol
         """
         Restricción número total de franjas en zona límite para cada embalse
         """
+        # Función que devuelve la suma de los indicadores de las franjas dadas de la curva
+        # Potencia - Caudal turbinado (1 si el punto de i en t está en alguna de ellas):
+        # las binarias w_pq de Winston o, con SOS2 o piezas cóncavas, las binarias y_pq de las regiones que las forman
+        def indicador_franjas_pq(i, t, franjas):
+            if t < 0:
+                # Franja anterior a una ventana de Relax&Fix: segmento fijado antes de ella
+                return int(p.SegmentoInicial[i] in franjas)
+            if not regiones:
+                return lp.lpSum(w_pq[(i, t, franja)] for franja in franjas)
+            return lp.lpSum(
+                y_pq[(i, t, r)] for r, region in enumerate(RegionesPQ[i]) if set(region) <= set(franjas)
+            )
+
         for i in I:
             lpproblem += zl_tot[i] == lp.lpSum(
-                w_pq[(i, t, bp)] for t in T for bp in ZonaLimitePQ[i]
+                duracion[t] * indicador_franjas_pq(i, t, ZonaLimitePQ[i]) for t in T
             )
 
         # Función que, dado el conjunto FranjasGrupos y un powergroup específico, te devuelve
@@ -1144,38 +1319,116 @@ class LPModel:
                 franjas_posteriores += diccionario[pw_posterior]
             return franjas_posteriores
 
+        # Grupos de potencia de cada embalse y franjas de los grupos superiores a cada uno,
+        # calculados una única vez
+        lista_grupos = {i: list(FranjasGrupos[i].keys()) for i in I}
+        franjas_superiores = {
+            i: {pg: obtener_franjas_pw_mayores(FranjasGrupos[i], pg) for pg in FranjasGrupos[i]} for i in I
+        }
+
         """
         Restricción cómputo arranques de powergroups
         """
-        # TODO: implementar que compute dos veces cuando hay dos arranques simultáneos de una franja a la siguiente
+        # Estado "en el grupo pg o en uno superior" en cada franja, calculado una única vez por (i, t, pg)
+        estados = {}
+
+        def estado(i, t, pg):
+            if (i, t, pg) not in estados:
+                estados[(i, t, pg)] = indicador_franjas_pq(
+                    i, t, list(FranjasGrupos[i][pg]) + franjas_superiores[i][pg]
+                )
+            return estados[(i, t, pg)]
+
+        # Filas de los arranques de todos los grupos en la franja t > 0
+        def filas_arranque(i, t):
+            filas = []
+            for pg in lista_grupos[i][1:]:
+                if self.config.startup_formulation == "cumulative":
+                    # Hay arranque de pg cuando el estado pasa de 0 a 1, por lo que al saltar varios grupos
+                    # de una franja a la siguiente se cuentan todos los arranques
+                    filas.append(pwch[(i, t, pg)] >= estado(i, t, pg) - estado(i, t - 1, pg))
+                    continue
+                # Arranque del grupo superior al de la franja anterior
+                anterior = lista_grupos[i][lista_grupos[i].index(pg) - 1]
+                filas.append(
+                    indicador_franjas_pq(i, t - 1, FranjasGrupos[i][anterior])
+                    + indicador_franjas_pq(i, t, franjas_superiores[i][anterior])
+                    - 1
+                    <= pwch[(i, t, pg)]
+                )
+                filas.append(
+                    indicador_franjas_pq(i, t - 1, FranjasGrupos[i][anterior])
+                    + indicador_franjas_pq(i, t, franjas_superiores[i][anterior])
+                    >= 2 * pwch[(i, t, pg)]
+                )
+            return filas
+
+        self.lazy_rows["startups"] = filas_arranque
+        # En una ventana de Relax&Fix también hay arranques en la primera franja respecto al segmento inicial
+        franjas_arranque = T if p.SegmentoInicial is not None else T[1:]
         for i in I:
-            for t in T:
-                if t != T[0]:
-                    for pg in FranjasGrupos[i]:
-                        if pg != list(FranjasGrupos[i].keys())[-1]:
-                            lista_keys = list(FranjasGrupos[i].keys())
-                            franjassuperiores = obtener_franjas_pw_mayores(FranjasGrupos[i], pg)
-                            lpproblem += (
-                                    lp.lpSum(
-                                        w_pq[(i, t - 1, franja)] for franja in FranjasGrupos[i][pg]
-                                    )
-                                    + lp.lpSum(
-                                        w_pq[(i, t, franja_sup)] for franja_sup in franjassuperiores
-                                    )
-                                    - 1
-                                    <= pwch[(i, t, lista_keys[lista_keys.index(pg) + 1])]
-                            )
-                            lpproblem += (
-                                    lp.lpSum(
-                                        w_pq[(i, t - 1, franja)] for franja in FranjasGrupos[i][pg]
-                                    )
-                                    + lp.lpSum(
-                                        w_pq[(i, t, franja_sup)] for franja_sup in franjassuperiores
-                                    )
-                                    >= 2 * pwch[(i, t, lista_keys[lista_keys.index(pg) + 1])]
+            for t in franjas_arranque:
+                if not perezosas or t == T[0]:
+                    for fila in filas_arranque(i, t):
+                        lpproblem += fila
+        """
+        Desigualdades válidas (opcionales): arranques acumulados respecto al cambio de estado de los grupos
+        de potencia
+        """
+        if self.config.startup_cuts and self.config.startup_formulation != "cumulative":
+            for i in I:
+                for t in T[1:]:
+                    for k, pg in enumerate(lista_grupos[i][1:], start=1):
+                        # Al pasar de un grupo inferior a pg a pg o uno superior arranca algún grupo entre 1 y pg
+                        franjas = list(FranjasGrupos[i][pg]) + franjas_superiores[i][pg]
+                        lpproblem += lp.lpSum(
+                            pwch[(i, t, lista_grupos[i][j])] for j in range(1, k + 1)
+                        ) >= indicador_franjas_pq(i, t, franjas) - indicador_franjas_pq(i, t - 1, franjas)
+        """
+        Desigualdades válidas (opcionales): franjas de la curva Volumen - Caudal máximo alcanzables en t + 1
+        desde la franja de t, con el volumen subiendo como mucho DV * qe_ub en la franja, y volumen de la franja
+        anterior dentro de la franja elegida
+        """
+        if self.config.volume_reachability_cuts and not sos2:
+            qe_ub = self.bounds.qe_ub
+            for d, i in enumerate(I):
+                if QmaxBP[i] is None:
+                    continue
+                franjas_vq = range(1, BreakPointsVQ[i][-1])
+                for t in T:
+                    if t != T[0]:
+                        lpproblem += vol[(i, t - 1)] >= lp.lpSum(
+                            w_vq[(i, t, franja)] * VolBP[i][franja - 1] for franja in franjas_vq
+                        )
+                        lpproblem += vol[(i, t - 1)] <= lp.lpSum(
+                            w_vq[(i, t, franja)] * VolBP[i][franja] for franja in franjas_vq
+                        )
+                    if t == T[-1]:
+                        continue
+                    for siguiente in franjas_vq:
+                        alcanzables = [
+                            franja for franja in franjas_vq
+                            if VolBP[i][siguiente - 1] - VolBP[i][franja] <= DV * qe_ub[d, t] + TOLERANCE
+                        ]
+                        if len(alcanzables) < len(franjas_vq):
+                            lpproblem += w_vq[(i, t + 1, siguiente)] <= lp.lpSum(
+                                w_vq[(i, t, franja)] for franja in alcanzables
                             )
-                        if t == 0:
-                            lpproblem += pwch[(i, t, pg)] == 0
+        """
+        Desigualdades válidas (opcionales): con la franja s elegida solo los breakpoints s y s + 1 tienen peso,
+        luego el peso de los breakpoints hasta j (desde j + 1) no supera la suma de las franjas hasta j (desde j)
+        """
+        if self.config.pq_segment_cuts and not regiones:
+            for i in I:
+                ultimo = BreakPointsPQ[i][-1]
+                for t in T:
+                    for j in BreakPointsPQ[i][:-1]:
+                        lpproblem += lp.lpSum(
+                            z_pq[(i, t, bp)] for bp in BreakPointsPQ[i] if bp <= j
+                        ) <= lp.lpSum(w_pq[(i, t, franja)] for franja in range(1, j + 1))
+                        lpproblem += lp.lpSum(
+                            z_pq[(i, t, bp)] for bp in BreakPointsPQ[i] if bp > j
+                        ) <= lp.lpSum(w_pq[(i, t, franja)] for franja in range(j, ultimo))
         """
         Restricción cálculo número de arranques totales en cada embalse
         """
@@ -1187,14 +1440,402 @@ class LPModel:
     
         # Objective Function
         lpproblem += lp.lpSum(
-            pot_embalse[i] + ben_desv[i] - zl_tot[i] * PenZL - pwch_tot[i] * PenSU for i in I
+            pot_embalse[i] + ben_desv[i] * escala - zl_tot[i] * PenZL - pwch_tot[i] * PenSU for i in I
+        )
+
+        self.variables = {
+            "vol": vol,
+            "qe": definidas["qe"],
+            "qs": qs,
+            "pot": definidas["pot"],
+            "qtb": definidas["qtb"],
+            "qch": definidas["qch"],
+            "x_pos": x_pos,
+            "x_neg": x_neg,
+            "max_pos_pre": max_pos_pre,
+            "max_neg_pre": max_neg_pre,
+            "max_pos_suf": max_pos_suf,
+            "max_neg_suf": max_neg_suf,
+            "w_pq": w_pq,
+            "z_pq": z_pq,
+            "y_pq": y_pq,
+            "g_pq": g_pq,
+            "w_vq": w_vq,
+            "z_vq": z_vq,
+            "q_max_vol": q_max_vol,
+            "pos_desv": pos_desv,
+            "neg_desv": neg_desv,
+            "ben_desv": ben_desv,
+            "zl_tot": zl_tot,
+            "pwch": pwch,
+            "pwch_tot": pwch_tot,
+            "pot_embalse": pot_embalse,
+        }
+
+        return lpproblem
+
+    def solve(self, options: dict = None) -> dict:
+        if self.config.model_builder == "matrix":
+            if self.config.coarse_to_fine or self.config.compress_time_steps:
+                raise ValueError("coarse_to_fine and compress_time_steps require the 'pulp' model builder")
+            return self.solve_matrix(options)
+
+        if self.config.coarse_to_fine:
+            lpproblem = self.solve_coarse_to_fine()
+        elif self.config.compress_time_steps:
+            lpproblem = self.solve_compressed()
+        else:
+            lpproblem = self.build_model()
+            self.solve_built_model(lpproblem)
+
+        self.store_solution(lpproblem)
+
+        return dict()
+
+    def solve_built_model(self, lpproblem: lp.LpProblem, warm_start: bool = False):
+        """
+        Solves lpproblem with the solver of the configuration (generating the lazy rows with lazy_constraints).
+
+        :param warm_start: Whether the current values of the variables are passed as initial solution
+        """
+        if self.config.lazy_constraints:
+            self.solve_with_lazy_rows(lpproblem, warm_start=warm_start)
+        else:
+            solve_problem(lpproblem, self.config, warm_start=warm_start)
+
+    def solve_coarse_to_fine(self) -> lp.LpProblem:
+        """
+        Solves the model of the instance aggregated to time steps of coarse_time_step_minutes and then the full model
+        with the volumes bounded around the coarse trajectory (see LPConfiguration.coarse_to_fine), starting from
+        the coarse schedule disaggregated to the time steps of the instance (see set_disaggregated_start). If the
+        bounded model ends without a solution (infeasible, or no solution within the time limit), the bounds are
+        removed and it is solved again.
+
+        It is a heuristic: the optimum of the bounded model need not be the one of the full model (e.g. 2 dams,
+        percentile 100, with volume_trust_region 0.1: 8932.29 against the optimum 9001.97).
+
+        :return: The full model, solved
+        """
+        p = self.parameters
+        factor, resto = divmod(self.config.coarse_time_step_minutes * 60, int(p.D))
+        if resto or factor < 2:
+            raise ValueError(
+                f"The coarse time step ({self.config.coarse_time_step_minutes} min) must be a multiple "
+                f"of at least two time steps of the instance ({int(p.D) // 60} min)"
+            )
+        config_agregada = replace(
+            self.config,
+            coarse_to_fine=False,
+            time_limit_seconds=self.config.coarse_time_limit_seconds or self.config.time_limit_seconds,
+            flow_smoothing=math.ceil(p.K / factor),
+            # La penalización es por franja en zona límite y cada franja agregada equivale a factor franjas
+            limit_zones_penalty=self.config.limit_zones_penalty * factor,
         )
+        agregado = LPModel(instance=aggregate_instance(self.instance, factor), config=config_agregada)
+        print("--------Modelo agregado--------")
+        agregado.solve()
+
+        lpproblem = self.build_model()
+        volumenes = agregado.solution.volumes if agregado.solution is not None else None
+        if volumenes is None or not np.all(np.isfinite(volumenes)):
+            print("El modelo agregado no tiene solución: se resuelve el modelo completo sin región de confianza")
+            self.solve_built_model(lpproblem)
+            return lpproblem
+
+        # Región de confianza de los volúmenes alrededor de la trayectoria agregada (en la unidad del modelo)
+        escala = self.volume_scale
+        referencia = disaggregate_volumes(volumenes, p.V0, factor, p.num_time_steps) / escala
+        radio = self.config.volume_trust_region * (p.VMax - p.VMin) / escala
+        cotas = {}
+        for (i, t), var in self.variables["vol"].items():
+            d = p.dam_index[i]
+            cotas[(i, t)] = (var.lowBound, var.upBound)
+            upper = min(var.upBound if var.upBound is not None else np.inf, referencia[d, t] + radio[d])
+            var.lowBound = min(max(var.lowBound or 0.0, referencia[d, t] - radio[d]), upper)
+            var.upBound = upper
+        print("--------Modelo completo--------")
+        self.set_disaggregated_start(agregado, factor)
+        self.solve_built_model(lpproblem, warm_start=True)
+        if lpproblem.sol_status not in (lp.LpSolutionOptimal, lp.LpSolutionIntegerFeasible):
+            print(f"Región de confianza sin solución ({lp.LpStatus[lpproblem.status]}): "
+                  f"se resuelve el modelo completo sin ella")
+            for (i, t), (lower, upper) in cotas.items():
+                self.variables["vol"][(i, t)].lowBound = lower
+                self.variables["vol"][(i, t)].upBound = upper
+            self.set_disaggregated_start(agregado, factor)
+            self.solve_built_model(lpproblem, warm_start=True)
+        return lpproblem
+
+    def set_disaggregated_start(self, agregado: "LPModel", factor: int):
+        """
+        Sets the initial solution of a warm start from the solution of the aggregated model: the exiting flow of each
+        time step is the one of its coarse time step, so the flow changes happen only at the first time step of each
+        coarse one. The other variables are left without value, for the solver to complete them (the turbined flows
+        and the curves lag the exiting flows, so the coarse values do not carry over).
+
+        :param agregado: Solved model of the instance aggregated by factor
+        """
+        for familia in self.variables.values():
+            for var in familia.values():
+                var.varValue = None
+        for (i, t), var in self.variables["qs"].items():
+            var.varValue = agregado.variables["qs"][(i, t // factor)].varValue
+        for nombre in ("qch", "x_pos", "x_neg"):
+            for (i, t), var in self.variables[nombre].items():
+                var.varValue = agregado.variables[nombre][(i, t // factor)].varValue if t % factor == 0 else 0.0
+
+    def solve_compressed(self) -> lp.LpProblem:
+        """
+        Solves the model with the time steps merged into periods (see LPConfiguration.compress_time_steps), expands
+        its exiting flows to the time steps of the instance and evaluates them with the full model, whose other
+        variables are optimized with those flows fixed. If the fixed flows are infeasible in the full model, they are
+        released and the full model is solved. The options that assume time steps of equal duration (presolve,
+        tight_big_m, lazy_constraints, volume_reachability_cuts, "window_max") only apply to the full model. The
+        objective values of both models are stored in self.compression_report.
+
+        :return: The full model, solved
+        """
+        p = self.parameters
+        periodos = find_periods(p, self.config.compression_tolerance)
+        lpproblem = self.build_model()
+        if len(periodos) == p.num_time_steps:
+            print("Ninguna franja se puede agrupar: se resuelve el modelo completo")
+            self.solve_built_model(lpproblem)
+            objetivo_comprimido = lp.value(lpproblem.objective)
+        else:
+            # Las cotas del presolve, las big-M ajustadas, las filas perezosas, los cortes de volumen alcanzable y
+            # "window_max" suponen franjas de igual duración: solo se aplican al modelo completo
+            config_comprimida = replace(
+                self.config,
+                compress_time_steps=False,
+                presolve=False,
+                tight_big_m=False,
+                lazy_constraints=False,
+                volume_reachability_cuts=False,
+                water_hammer_formulation=(
+                    "pairwise" if self.config.water_hammer_formulation == "window_max"
+                    else self.config.water_hammer_formulation
+                ),
+            )
+            comprimido = LPModel(instance=self.instance, config=config_comprimida)
+            comprimido.derived_parameters = compress_parameters(p, periodos)
+            lpcomprimido = comprimido.build_model()
+            comprimido.solve_built_model(lpcomprimido)
+            print("--------Modelo comprimido--------")
+            comprimido.store_solution(lpcomprimido)
+            objetivo_comprimido = lp.value(lpcomprimido.objective)
+            if comprimido.solution is None or not np.all(np.isfinite(comprimido.solution.flows)):
+                print("El modelo comprimido no tiene solución: se resuelve el modelo completo")
+                self.solve_built_model(lpproblem)
+            else:
+                self.solve_with_fixed_flows(lpproblem, comprimido.solution.flows, periodos)
+
+        objetivo = lp.value(lpproblem.objective)
+        self.compression_report = {
+            "time_steps": p.num_time_steps,
+            "periods": len(periodos),
+            "compressed_objective": objetivo_comprimido,
+            "expanded_objective": objetivo,
+            "objective_loss": (
+                objetivo_comprimido - objetivo
+                if objetivo_comprimido is not None and objetivo is not None else None
+            ),
+        }
+        print(f"Compresión temporal: {self.compression_report}")
+        return lpproblem
+
+    def solve_with_fixed_flows(self, lpproblem: lp.LpProblem, caudales: np.ndarray, periodos: tuple):
+        """
+        Solves lpproblem with the exiting flow of each time step fixed to the one of its period in the compressed
+        model (see solve_compressed). If the fixed flows are infeasible, they are released and lpproblem is solved
+        again.
+
+        :param caudales: Exiting flow of each dam in each period, shape (num_dams, num_periods)
+        :param periodos: First time step and number of time steps of each period
+        """
+        p = self.parameters
+        # Caudal de salida de cada franja: el del periodo que la contiene
+        periodo_de = np.repeat(np.arange(len(periodos)), [n for _, n in periodos])
+        cotas = {}
+        for (i, t), var in self.variables["qs"].items():
+            cotas[(i, t)] = (var.lowBound, var.upBound)
+            valor = caudales[p.dam_index[i], periodo_de[t]]
+            if var.lowBound is not None:
+                valor = max(valor, var.lowBound)
+            if var.upBound is not None:
+                valor = min(valor, var.upBound)
+            var.lowBound = var.upBound = float(valor)
+        print("--------Modelo completo--------")
+        self.solve_built_model(lpproblem)
+        if lpproblem.status == lp.LpStatusInfeasible:
+            print("Caudales del modelo comprimido infactibles: se resuelve el modelo completo sin fijarlos")
+            for (i, t), (lower, upper) in cotas.items():
+                self.variables["qs"][(i, t)].lowBound = lower
+                self.variables["qs"][(i, t)].upBound = upper
+            self.solve_built_model(lpproblem)
+
+    def violated_lazy_rows(self) -> list:
+        """
+        Checks the values of the variables against the rows of the lazy families (see
+        LPConfiguration.lazy_constraints) with array operations over all the dams and time steps.
+
+        :return: Indices (family, (dam_id, t)) of the time steps with violated rows that are not in the model yet
+        """
+        p = self.parameters
+        T = p.num_time_steps
+        violadas = []
+
+        # Golpe de ariete: x_pos[t] + x_neg[t - k] <= 1 y x_neg[t] + x_pos[t - k] <= 1
+        x_pos = np.nan_to_num(variable_values(self.variables["x_pos"], p.dam_index, T))
+        x_neg = np.nan_to_num(variable_values(self.variables["x_neg"], p.dam_index, T))
+        violacion = np.zeros((len(p.I), T), dtype=bool)
+        for k in range(1, min(p.K, T - 1) + 1):
+            for actual, anterior in ((x_pos, x_neg), (x_neg, x_pos)):
+                violacion[:, k:] |= actual[:, k:] + anterior[:, :-k] > 1 + TOLERANCE
+        for d, t in np.argwhere(violacion):
+            violadas.append(("water_hammer", (p.I[d], int(t))))
+
+        # Arranques: indicadores de cada grupo de potencia en cada franja a partir de las binarias de la curva PQ
+        for i in p.I:
+            grupos = list(p.FranjasGrupos[i].keys())
+            if self.pq_regions:
+                unidades = [(("y_pq", r), region) for r, region in enumerate(self.pq_regions[i])]
+            else:
+                unidades = [(("w_pq", franja), (franja,)) for franja in range(1, len(p.BreakPointsPQ[i]))]
+            valores = np.array(
+                [[self.variables[name][(i, t, u)].varValue or 0.0 for (name, u), _ in unidades] for t in range(T)]
+            )
+            pertenencia = np.array(
+                [[set(franjas) <= set(p.FranjasGrupos[i][pg]) for pg in grupos] for _, franjas in unidades],
+                dtype=float,
+            )
+            en_grupo = valores @ pertenencia
+            # Estado "en el grupo pg o en uno superior"
+            estado = np.cumsum(en_grupo[:, ::-1], axis=1)[:, ::-1]
+            arranques = np.array(
+                [[self.variables["pwch"][(i, t, pg)].varValue or 0.0 for pg in grupos] for t in range(T)]
+            )
+            if self.config.startup_formulation == "cumulative":
+                violacion = estado[1:, 1:] - estado[:-1, 1:] > arranques[1:, 1:] + TOLERANCE
+            else:
+                # Paso del grupo k en t - 1 a uno superior en t, que arranca el grupo k + 1
+                paso = en_grupo[:-1, :-1] + estado[1:, 1:]
+                violacion = (paso - 1 > arranques[1:, 1:] + TOLERANCE) | (paso < 2 * arranques[1:, 1:] - TOLERANCE)
+            for t in np.flatnonzero(violacion.any(axis=1)):
+                violadas.append(("startups", (i, int(t) + 1)))
+
+        return [fila for fila in violadas if fila not in self.lazy_added]
+
+    def reset_flow_change_indicators(self):
+        """
+        Sets the binary flow change indicators x_pos and x_neg that are not fixed to the value implied by the flow
+        change of the solution. They do not appear in the objective, so a solution with an indicator at 1 and no
+        flow change has an equivalent one with the indicator at 0, which violates fewer water hammer rows.
+        """
+        for (i, t), var in self.variables["qch"].items():
+            qch = var.value()
+            if qch is None:
+                continue
+            for x, sentido in ((self.variables["x_pos"][(i, t)], qch > TOLERANCE),
+                               (self.variables["x_neg"][(i, t)], qch < -TOLERANCE)):
+                if x.cat == lp.LpInteger and x.lowBound != x.upBound and x.varValue is not None:
+                    x.varValue = float(sentido)
+
+    def solve_with_lazy_rows(self, lpproblem: lp.LpProblem, warm_start: bool = False):
+        """
+        Solves lpproblem, adds the rows of the lazy families violated by its solution (and those of the time steps
+        within K of each violated one) and solves it again until none is violated (see
+        LPConfiguration.lazy_constraints). The rows stay in lpproblem.
+        The time limit of the configuration is shared by all the solves: each one gets the time left and starts
+        from the solution of the previous one. If the time runs out (or a solve finds no solution), the last
+        solution found is kept, and the lazy rows it still violates are reported.
+        """
+        p = self.parameters
+        limite = self.config.time_limit_seconds
+        comienzo = time.perf_counter()
+        # Estado y valores de la última solución encontrada, y filas perezosas que viola
+        incumbente = None
+        violadas = []
+        while True:
+            config = self.config
+            if limite is not None:
+                restante = limite - (time.perf_counter() - comienzo)
+                if restante <= 0:
+                    break
+                config = replace(config, time_limit_seconds=restante)
+            solve_problem(lpproblem, config, warm_start=warm_start)
+            self.lazy_rounds += 1
+            if lpproblem.sol_status not in (lp.LpSolutionOptimal, lp.LpSolutionIntegerFeasible):
+                if incumbente is not None:
+                    # Sin solución (p.ej. por tiempo), los valores pueden ser los de una relajación
+                    estado, estado_solucion, valores = incumbente
+                    for var, valor in valores:
+                        var.varValue = valor
+                    lpproblem.assignStatus(estado, estado_solucion)
+                break
+            self.reset_flow_change_indicators()
+            incumbente = (
+                lpproblem.status,
+                lpproblem.sol_status,
+                [(var, var.varValue) for var in lpproblem.variables()],
+            )
+            violadas = self.violated_lazy_rows()
+            if not violadas:
+                break
+            # Con las filas de una franja, el solver suele desplazar el cambio de caudal (o el arranque) a una franja
+            # vecina: se añaden también las filas de las franjas a menos de K de cada franja violada
+            nuevas = list(violadas)
+            for family, (i, t) in violadas:
+                for vecina in range(max(t - p.K, 1), min(t + p.K + 1, p.num_time_steps)):
+                    if (family, (i, vecina)) not in self.lazy_added and (family, (i, vecina)) not in nuevas:
+                        nuevas.append((family, (i, vecina)))
+            for family, key in nuevas:
+                filas = self.lazy_rows[family](*key)
+                for fila in filas:
+                    lpproblem += fila
+                self.lazy_added[(family, key)] = len(filas)
+            # La solución anterior es el MIP start de la siguiente: el solver la repara o la descarta si no cumple
+            # las filas añadidas
+            warm_start = True
+        if violadas:
+            print(f"Tiempo agotado: la solución viola {len(violadas)} franjas de restricciones perezosas")
+        print(f"Restricciones perezosas: {self.lazy_report()}")
+
+    def recover_substituted_values(self):
+        """
+        Sets the values of the variables substituted by their expressions (see
+        LPConfiguration.substitute_defined_variables) from the solution of the model.
+        """
+        for varname, expressions in self.expressions.items():
+            for key, expression in expressions.items():
+                self.variables[varname][key].varValue = expression.value()
 
-        # Solve
-        # solver = lp.GUROBI(path=None, keepFiles=0, MIPGap=self.config.MIPGap)
-        solver = lp.GUROBI_CMD(gapRel=self.config.MIPGap, timeLimit=self.config.time_limit_seconds)
-        # solver = lp.PULP_CBC_CMD(gapRel=self.config.MIPGap)  # <-- caca
-        lpproblem.solve(solver)
+    def store_solution(self, lpproblem: lp.LpProblem):
+        """
+        Prints the characterization of the solution of the solved lpproblem and stores it in self.solution.
+        If the solver found no (integer) feasible solution, e.g. at the time limit, self.solution is set to None:
+        the values of the variables may be those of a relaxation (CBC with SOS constraints).
+        """
+        if lpproblem.sol_status not in (lp.LpSolutionOptimal, lp.LpSolutionIntegerFeasible):
+            print("--------Función objetivo--------")
+            print("Estado de la solución: ", lp.LpStatus[lpproblem.status], "(sin solución factible)")
+            self.solution = None
+            return
+        self.recover_substituted_values()
+        I = self.instance.get_ids_of_dams()
+        Price = self.instance.get_all_prices()
+        vol = self.variables["vol"]
+        qs = self.variables["qs"]
+        pot = self.variables["pot"]
+        qtb = self.variables["qtb"]
+        w_pq = self.variables["w_pq"]
+        pos_desv = self.variables["pos_desv"]
+        neg_desv = self.variables["neg_desv"]
+        ben_desv = self.variables["ben_desv"]
+        zl_tot = self.variables["zl_tot"]
+        pwch = self.variables["pwch"]
+        pwch_tot = self.variables["pwch_tot"]
+        pot_embalse = self.variables["pot_embalse"]
 
         # Caracterización de la solución
         print("--------Función objetivo--------")
@@ -1203,13 +1844,15 @@ class LPModel:
         print("--------Potencia generada en cada embalse--------")
         for var in pot_embalse.values():
             print(f"{var.name} (€): {var.value()}")
+        # Los volúmenes se devuelven a m3 (ver scale_units)
+        escala = self.volume_scale
         print("--------Desviación en volumen--------")
         for var in pos_desv.values():
-            print(f"{var.name} (m3): {var.value()}")
+            print(f"{var.name} (m3): {lp.value(var * escala)}")
         for var in neg_desv.values():
-            print(f"{var.name} (m3): {var.value()}")
+            print(f"{var.name} (m3): {lp.value(var * escala)}")
         for var in ben_desv.values():
-            print(f"{var.name} (€): {var.value()}")
+            print(f"{var.name} (€): {lp.value(var * escala)}")
         print("--------Zonas límite--------")
         for var in zl_tot.values():
             print(f"{var.name}: {var.value()}")
@@ -1226,33 +1869,56 @@ class LPModel:
             if var.value() != 0:
                 print(f"{var.name}: {var.value()}")
         # solution.json
-        qsalida = {dam_id: [] for dam_id in I}
-        for var in qs.values():
-            for dam_id in I:
-                if dam_id in var.name:
-                    qsalida[dam_id].append(var.value())
-        potencia = {dam_id: [] for dam_id in I}
-        for var in pot.values():
-            for dam_id in I:
-                if dam_id in var.name:
-                    potencia[dam_id].append(var.value())
-        volumenes = {dam_id: [] for dam_id in I}
-        for var in vol.values():
-            for dam_id in I:
-                if dam_id in var.name:
-                    volumenes[dam_id].append(var.value())
-        sol_dict = {
-            "dams": [
-                {
-                    "flows": qsalida[dam_id],
-                    "id": dam_id,
-                    "power": potencia[dam_id],
-                    "volume": volumenes[dam_id],
-                }
-                for dam_id in I
-            ],
-            "price": Price,
-        }
-        self.solution = LPSolution.from_dict(sol_dict)
+        p = self.parameters
+        self.solution = LPSolution(
+            dam_ids=I,
+            flows=variable_values(qs, p.dam_index, p.num_time_steps),
+            powers=variable_values(pot, p.dam_index, p.num_time_steps),
+            volumes=variable_values(vol, p.dam_index, p.num_time_steps) * escala,
+            price=Price,
+        )
+
+    def solve_matrix(self, options: dict = None) -> dict:
+        """
+        Solves the problem building the model directly as sparse arrays (see lp_matrix.py)
+        and handing them to the solver, without PuLP objects.
+        """
+        model = build_matrix_model(self.instance, self.config)
+        x, objective_value, status = solve_matrix_model(model, self.config)
+
+        # Caracterización de la solución
+        print("--------Función objetivo--------")
+        print("Estado de la solución: ", status)
+        print("Valor de la función objetivo (€): ", objective_value)
+        if x is None:
+            return dict()
+
+        I = self.instance.get_ids_of_dams()
+        index = model.index
+        print("--------Potencia generada en cada embalse--------")
+        for d, dam_id in enumerate(I):
+            print(f"Potencia total del {dam_id} (€): {x[index['pot_embalse'][d]]}")
+        # Los volúmenes se devuelven a m3 (ver scale_units)
+        escala = self.volume_scale
+        print("--------Desviación en volumen--------")
+        for d, dam_id in enumerate(I):
+            print(f"Desviación positiva del {dam_id} (m3): {x[index['pos_desv'][d]] * escala}")
+            print(f"Desviación negativa del {dam_id} (m3): {x[index['neg_desv'][d]] * escala}")
+            print(f"Beneficio por desviación volumen del {dam_id} (€): {x[index['ben_desv'][d]] * escala}")
+        print("--------Zonas límite--------")
+        for d, dam_id in enumerate(I):
+            print(f"Zonas límites totales del {dam_id}: {x[index['zl_tot'][d]]}")
+        print("--------Arranques grupos de potencia--------")
+        for d, dam_id in enumerate(I):
+            print(f"Arranque totales del {dam_id}: {x[index['pwch_tot'][d]]}")
+
+        # solution.json
+        self.solution = LPSolution(
+            dam_ids=I,
+            flows=x[index["qs"]],
+            powers=x[index["pot"]],
+            volumes=x[index["vol"]] * escala,
+            price=self.instance.get_all_prices(),
+        )
 
-        return dict()
\ No newline at end of file
+        return dict()
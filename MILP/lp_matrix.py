@@ -0,0 +1,539 @@
+import numpy as np
+import scipy.sparse as sp
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from instance_ana import InstanceData
+from model_parameters import ModelParameters
+from presolve import PresolveBounds, TOLERANCE
+
+# Familias de variables cuyos índices de columna se guardan por embalse (las que dependen de los breakpoints)
+FAMILIAS_POR_EMBALSE = ("w_pq", "z_pq", "w_vq", "z_vq", "q_max_vol", "pwch")
+
+@dataclass
+class MatrixModel:
+    """
+    Modelo del problema en forma matricial:
+    max objective @ x  s.a.  row_lower <= A @ x <= row_upper,  col_lower <= x <= col_upper
+    """
+    A: sp.csr_matrix
+    row_lower: np.ndarray
+    row_upper: np.ndarray
+    col_lower: np.ndarray
+    col_upper: np.ndarray
+    objective: np.ndarray
+    # 1 para las variables enteras/binarias, 0 para las continuas
+    integrality: np.ndarray
+    # Índices de columna de cada familia de variables, p.ej. index["vol"][dam, t]
+    # (las familias con breakpoints se guardan por embalse: index["w_pq"][dam_id][t, bp])
+    index: dict = field(default_factory=dict)
+
+    @property
+    def num_rows(self) -> int:
+        return self.A.shape[0]
+
+    @property
+    def num_cols(self) -> int:
+        return self.A.shape[1]
+
+
+class MatrixBuilder:
+    """
+    Acumula columnas y coeficientes en formato COO y genera el MatrixModel en CSR.
+    """
+
+    def __init__(self):
+        self.num_cols = 0
+        self.num_rows = 0
+        self._col_lower = []
+        self._col_upper = []
+        self._integrality = []
+        self._row_lower = []
+        self._row_upper = []
+        self._rows = []
+        self._cols = []
+        self._vals = []
+
+    def add_columns(self, shape, lower=0.0, upper=np.inf, integer=False) -> np.ndarray:
+        """
+        Adds a block of variables.
+
+        :param shape: Shape of the block (e.g. (num_dams, num_time_steps))
+        :param lower: Lower bound(s), broadcastable to the shape
+        :param upper: Upper bound(s), broadcastable to the shape
+        :param integer: Whether the variables are integer
+        :return: Array with the column index of each variable of the block
+        """
+        idx = np.arange(self.num_cols, self.num_cols + int(np.prod(shape))).reshape(shape)
+        self.num_cols += idx.size
+        self._col_lower.append(np.broadcast_to(np.asarray(lower, dtype=float), idx.shape).ravel())
+        self._col_upper.append(np.broadcast_to(np.asarray(upper, dtype=float), idx.shape).ravel())
+        self._integrality.append(np.full(idx.size, 1 if integer else 0, dtype=np.int8))
+        return idx
+
+    def add_rows(self, shape, lower=-np.inf, upper=np.inf) -> np.ndarray:
+        """
+        Adds a block of constraints lower <= row <= upper. The coefficients are added with add_terms.
+
+        :return: Array with the row index of each constraint of the block
+        """
+        idx = np.arange(self.num_rows, self.num_rows + int(np.prod(shape))).reshape(shape)
+        self.num_rows += idx.size
+        self._row_lower.append(np.broadcast_to(np.asarray(lower, dtype=float), idx.shape).ravel())
+        self._row_upper.append(np.broadcast_to(np.asarray(upper, dtype=float), idx.shape).ravel())
+        return idx
+
+    def add_terms(self, rows, cols, vals):
+        """
+        Adds the coefficients vals of the columns cols in the rows rows (all broadcast together).
+        """
+        rows, cols, vals = np.broadcast_arrays(rows, cols, np.asarray(vals, dtype=float))
+        if rows.size:
+            self._rows.append(rows.ravel())
+            self._cols.append(cols.ravel())
+            self._vals.append(vals.ravel())
+
+    def add_block(self, block: MatrixModel) -> int:
+        """
+        Adds the columns and rows of a MatrixModel built on its own (its rows only use its own columns).
+        The objective of the block is not added.
+
+        :return: Offset of the column indices of the block in this model
+        """
+        offset = self.num_cols
+        A = block.A.tocoo()
+        self._rows.append(A.row + self.num_rows)
+        self._cols.append(A.col + offset)
+        self._vals.append(A.data)
+        self.num_cols += block.num_cols
+        self.num_rows += block.num_rows
+        self._col_lower.append(block.col_lower)
+        self._col_upper.append(block.col_upper)
+        self._integrality.append(block.integrality)
+        self._row_lower.append(block.row_lower)
+        self._row_upper.append(block.row_upper)
+        return offset
+
+    def build(self, objective: dict, index: dict) -> MatrixModel:
+        """
+        :param objective: List of (column indices, coefficients) pairs of the objective function
+        :param index: Column indices of each variable family
+        :return: The assembled MatrixModel
+        """
+        c = np.zeros(self.num_cols)
+        for cols, coefs in objective:
+            np.add.at(c, np.ravel(cols), np.broadcast_to(coefs, np.shape(cols)).ravel())
+        A = sp.coo_matrix(
+            (np.concatenate(self._vals), (np.concatenate(self._rows), np.concatenate(self._cols))),
+            shape=(self.num_rows, self.num_cols),
+        ).tocsr()
+        return MatrixModel(
+            A=A,
+            row_lower=np.concatenate(self._row_lower),
+            row_upper=np.concatenate(self._row_upper),
+            col_lower=np.concatenate(self._col_lower),
+            col_upper=np.concatenate(self._col_upper),
+            objective=c,
+            integrality=np.concatenate(self._integrality),
+            index=index,
+        )
+
+
+def build_matrix_model(instance: InstanceData, config) -> MatrixModel:
+
+    """
+    Builds the same model as LPModel.build_model directly as sparse arrays,
+    without creating PuLP variables or expressions.
+    Simple bounds (VMax, VMin, QMax and the fixed extremes of the Winston binaries)
+    are written as column bounds instead of rows, as are the propagated bounds of config.presolve.
+    The variables and rows of each dam are built as a separate block (see build_dam_block), in
+    config.build_workers processes, and stacked with the incoming flow rows that link the dams.
+
+    :param instance: Instance of the problem
+    :param config: LPConfiguration of the model
+    :return: MatrixModel with the constraint matrix in CSR format
+    """
+
+    if config.pwl_formulation != "winston":
+        raise ValueError("The matrix builder only supports the 'winston' piecewise linear formulation")
+    if config.substitute_defined_variables:
+        raise ValueError("The matrix builder does not support substitute_defined_variables")
+    if config.water_hammer_formulation != "pairwise":
+        raise ValueError("The matrix builder only supports the 'pairwise' water hammer formulation")
+    if config.detect_concave_curves:
+        raise ValueError("The matrix builder does not support detect_concave_curves")
+    if config.startup_cuts or config.volume_reachability_cuts or config.pq_segment_cuts:
+        raise ValueError("The matrix builder does not support the valid inequality families")
+    if config.lazy_constraints:
+        raise ValueError("The matrix builder does not support lazy_constraints")
+    p = ModelParameters.from_instance(instance, config)
+    n = len(p.I)
+    T = p.num_time_steps
+
+    # Bloques de cada embalse, construidos en paralelo con build_workers > 1. Cada proceso calcula los parámetros
+    # y las cotas una sola vez (ver _init_worker) y solo recibe la posición de los embalses que construye
+    workers = min(config.build_workers, n)
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(instance, config)) as pool:
+            bloques = list(pool.map(_build_worker_block, range(n)))
+    else:
+        datos = _block_data(instance, config)
+        bloques = [build_dam_block(*datos, d) for d in range(n)]
+
+    b = MatrixBuilder()
+    objective = []
+    desplazamientos = []
+    for bloque in bloques:
+        desplazamiento = b.add_block(bloque)
+        desplazamientos.append(desplazamiento)
+        objective.append((desplazamiento + np.arange(bloque.num_cols), bloque.objective))
+
+    # Índices globales de columna: las familias con breakpoints se guardan por embalse y el resto se apila
+    index = {}
+    for familia in bloques[0].index:
+        if familia not in FAMILIAS_POR_EMBALSE:
+            index[familia] = np.stack(
+                [bloque.index[familia] + desplazamiento for bloque, desplazamiento in zip(bloques, desplazamientos)]
+            )
+    for familia in FAMILIAS_POR_EMBALSE:
+        index[familia] = {
+            i: bloque.index[familia] + desplazamiento
+            for i, bloque, desplazamiento in zip(p.I, bloques, desplazamientos)
+            if familia in bloque.index
+        }
+
+    """
+    Restricción caudal de entrada (la única que acopla cada embalse con el de aguas arriba)
+    """
+    rhs = p.Qnr[:, :T].copy()
+    rhs[0] += p.Q0[:T]
+    r = b.add_rows((n, T), lower=rhs, upper=rhs)
+    b.add_terms(r, index["qe"], 1.0)
+    b.add_terms(r[1:], index["qtb"][:-1], -1.0)
+
+    return b.build(objective, index)
+
+
+def _block_data(instance: InstanceData, config) -> tuple:
+    """
+    :return: Arguments of build_dam_block before the position of the dam: parameters, configuration,
+        propagated bounds (None without presolve) and big-M of x_pos and x_neg of each dam and time step
+    """
+    p = ModelParameters.from_instance(instance, config)
+    # Cotas de las variables y big-M de la variación de caudal (propagadas con presolve, ver presolve.py;
+    # con tight_big_m solo el big-M)
+    bounds = None
+    M_pos = M_neg = np.broadcast_to(p.QMax[:, None], (len(p.I), p.num_time_steps))
+    if config.presolve:
+        bounds = PresolveBounds.from_parameters(p, cumulative_startups=config.startup_formulation == "cumulative")
+        M_pos, M_neg = np.maximum(bounds.qch_ub, 0.0), np.maximum(-bounds.qch_lb, 0.0)
+    elif config.tight_big_m:
+        propagadas = PresolveBounds.from_parameters(p)
+        M_pos, M_neg = np.maximum(propagadas.qch_ub, 0.0), np.maximum(-propagadas.qch_lb, 0.0)
+    return p, config, bounds, M_pos, M_neg
+
+
+# Argumentos de build_dam_block en cada proceso de trabajo de build_matrix_model (ver _init_worker)
+_worker_data = None
+
+
+def _init_worker(instance: InstanceData, config):
+    """
+    Computes once per worker process the data of _block_data (ModelParameters and PresolveBounds hold
+    read-only mappings that cannot be pickled, so they are not sent from the main process).
+    """
+    global _worker_data
+    _worker_data = _block_data(instance, config)
+
+
+def _build_worker_block(d: int) -> MatrixModel:
+    return build_dam_block(*_worker_data, d)
+
+
+def build_dam_block(p: ModelParameters, config, bounds: PresolveBounds | None, M_pos: np.ndarray,
+                    M_neg: np.ndarray, d: int) -> MatrixModel:
+
+    """
+    Builds the variables and rows of one dam, that is, all of them except the incoming flow rows,
+    which link the dam with the turbined flow of the one upstream (see build_matrix_model).
+
+    :param p: Parameters of the model
+    :param config: LPConfiguration of the model
+    :param bounds: Propagated bounds of the model (None without config.presolve)
+    :param M_pos: Big-M of x_pos of each dam and time step
+    :param M_neg: Big-M of x_neg of each dam and time step
+    :param d: Position of the dam in p.I
+    :return: MatrixModel of the dam, with index holding the column indices of its variables (e.g. index["vol"][t])
+    """
+
+    i = p.I[d]
+    T = p.num_time_steps
+    D = p.D
+    K = p.K
+    Price = p.Price[:T]
+    QMax = p.QMax[d]
+    # Volúmenes en la unidad del modelo (escala m3, ver scale_units)
+    escala = p.EscalaVol if config.scale_units else 1.0
+    V0 = p.V0[d] / escala
+    VMax = p.VMax[d] / escala
+    VMin = p.VMin[d] / escala
+    VolFinal = p.VolFinal[d] / escala
+
+    b = MatrixBuilder()
+
+    if bounds is not None:
+        vol_upper = np.minimum(VMax, bounds.vol_ub[d] / escala)
+        qe_lower, qe_upper = bounds.qe_lb[d], bounds.qe_ub[d]
+        qs_upper = np.minimum(QMax, bounds.qs_ub[d])
+        qtb_lower, qtb_upper = bounds.qtb_lb[d], bounds.qtb_ub[d]
+        qch_lower, qch_upper = bounds.qch_lb[d], bounds.qch_ub[d]
+    else:
+        vol_upper, qe_lower, qe_upper = VMax, 0.0, np.inf
+        qs_upper, qtb_lower, qtb_upper = QMax, 0.0, np.inf
+        qch_lower, qch_upper = -np.inf, np.inf
+
+    # Variables
+    vol = b.add_columns(T, lower=VMin, upper=vol_upper)
+    qe = b.add_columns(T, lower=qe_lower, upper=qe_upper)
+    qs = b.add_columns(T, upper=qs_upper)
+    pot = b.add_columns(T)
+    qtb = b.add_columns(T, lower=qtb_lower, upper=qtb_upper)
+    qch = b.add_columns(T, lower=qch_lower, upper=qch_upper)
+    x_pos = b.add_columns(T, upper=1 if bounds is None else bounds.qch_ub[d] > TOLERANCE, integer=True)
+    x_neg = b.add_columns(T, upper=1 if bounds is None else bounds.qch_lb[d] < -TOLERANCE, integer=True)
+    pos_desv = b.add_columns(())
+    neg_desv = b.add_columns(())
+    ben_desv = b.add_columns((), lower=-np.inf)
+    zl_tot = b.add_columns((), lower=-np.inf, integer=True)
+    pwch_tot = b.add_columns((), lower=-np.inf, integer=True)
+    pot_embalse = b.add_columns((), lower=-np.inf)
+    index = {}
+
+    """
+    Restricción balance de volumen
+    """
+    r = b.add_rows(T, upper=np.where(np.arange(T) == 0, V0, 0.0))
+    b.add_terms(r, vol, 1.0)
+    b.add_terms(r[1:], vol[:-1], -1.0)
+    b.add_terms(r, qe, -D / escala)
+    b.add_terms(r, qs, D / escala)
+    """
+    Restricción cálculo variación caudal en cada franja
+    """
+    rhs = np.zeros(T)
+    rhs[0] = -p.IniLags[i][0]
+    r = b.add_rows(T, lower=rhs, upper=rhs)
+    b.add_terms(r, qch, 1.0)
+    b.add_terms(r, qs, -1.0)
+    b.add_terms(r[1:], qs[:-1], 1.0)
+    """
+    Restricción para contabilizar variación positiva/negativa de caudal en cada franja
+    y para que solo se cuente la variación correcta
+    """
+    r = b.add_rows(T, upper=0.0)
+    b.add_terms(r, qch, 1.0)
+    b.add_terms(r, x_pos, -M_pos[d])
+    r = b.add_rows(T, upper=0.0)
+    b.add_terms(r, qch, -1.0)
+    b.add_terms(r, x_neg, -M_neg[d])
+    r = b.add_rows(T, upper=1.0)
+    b.add_terms(r, x_pos, 1.0)
+    b.add_terms(r, x_neg, 1.0)
+    """
+    Restricción golpe de ariete
+    """
+    for k in range(1, min(K, T - 1) + 1):
+        r = b.add_rows(T - k, upper=1.0)
+        b.add_terms(r, x_pos[k:], 1.0)
+        b.add_terms(r, x_neg[:-k], 1.0)
+        r = b.add_rows(T - k, upper=1.0)
+        b.add_terms(r, x_neg[k:], 1.0)
+        b.add_terms(r, x_pos[:-k], 1.0)
+    """
+    Restricción cómputo desviación respecto a volumen objetivo
+    y cálculo beneficio por exceso/falta de volumen respecto al objetivo
+    """
+    r = b.add_rows((), lower=VolFinal, upper=VolFinal)
+    b.add_terms(r, vol[p.D_1 - 1], 1.0)
+    b.add_terms(r, pos_desv, -1.0)
+    b.add_terms(r, neg_desv, 1.0)
+    r = b.add_rows((), lower=0.0, upper=0.0)
+    b.add_terms(r, ben_desv, 1.0)
+    b.add_terms(r, pos_desv, -p.BonusVol)
+    b.add_terms(r, neg_desv, p.PenVol)
+    """
+    Restricción ganancia (€) total del embalse
+    """
+    r = b.add_rows((), lower=0.0, upper=0.0)
+    b.add_terms(r, pot_embalse, 1.0)
+    b.add_terms(r, pot, -Price * (D / 3600))
+
+    """
+    Restricción caudal turbinado en base a lags relevantes
+    """
+    L = p.L[i]
+    IniLags = p.IniLags[i]
+    rhs = np.zeros(T)
+    for l in L:
+        for t in range(min(l, T)):
+            rhs[t] += IniLags[l - 1 - t] / len(L)
+    r = b.add_rows(T, lower=rhs, upper=rhs)
+    b.add_terms(r, qtb, 1.0)
+    for l in L:
+        if l < T:
+            b.add_terms(r[l:], qs[:T - l], -1 / len(L))
+
+    """
+    IP with Piecewise Linear Functions de Winston
+    en referencia a la curva Potencia - Caudal turbinado
+    """
+    QtBP = p.QtBP[i]
+    PotBP = p.PotBP[i]
+    nbp = len(QtBP)
+    w_upper = np.ones(nbp + 1)
+    w_upper[[0, nbp]] = 0
+    if bounds is not None:
+        w_upper = np.tile(w_upper, (T, 1))
+        w_upper[:, 1:nbp] = bounds.franjas_pq[i]
+    w_pq = index["w_pq"] = b.add_columns((T, nbp + 1), upper=w_upper, integer=True)
+    z_pq = index["z_pq"] = b.add_columns((T, nbp))
+    r = b.add_rows(T, lower=0.0, upper=0.0)
+    b.add_terms(r, pot, 1.0)
+    b.add_terms(r[:, None], z_pq, -PotBP)
+    r = b.add_rows(T, lower=0.0, upper=0.0)
+    b.add_terms(r, qtb, 1.0)
+    b.add_terms(r[:, None], z_pq, -QtBP)
+    r = b.add_rows((T, nbp), upper=0.0)
+    b.add_terms(r, z_pq, 1.0)
+    b.add_terms(r, w_pq[:, :-1], -1.0)
+    b.add_terms(r, w_pq[:, 1:], -1.0)
+    r = b.add_rows(T, lower=1.0, upper=1.0)
+    b.add_terms(r[:, None], z_pq, 1.0)
+    r = b.add_rows(T, lower=1.0, upper=1.0)
+    b.add_terms(r[:, None], w_pq[:, 1:], 1.0)
+
+    """
+    IP with Piecewise Linear Functions de Winston
+    en referencia a la curva Volumen - Caudal máximo
+    """
+    if p.VolBP[i] is not None:
+        QmaxBP = p.QmaxBP[i]
+        VolBP = p.VolBP[i] / escala
+        nvq = len(VolBP)
+        w_upper = np.ones(nvq + 1)
+        w_upper[[0, nvq]] = 0
+        if bounds is not None:
+            w_upper = np.tile(w_upper, (T, 1))
+            w_upper[:, 1:nvq] = bounds.franjas_vq[i]
+        w_vq = index["w_vq"] = b.add_columns((T, nvq + 1), upper=w_upper, integer=True)
+        z_vq = index["z_vq"] = b.add_columns((T, nvq))
+        q_max_vol = index["q_max_vol"] = b.add_columns(T)
+        r = b.add_rows(T, lower=0.0, upper=0.0)
+        b.add_terms(r, q_max_vol, 1.0)
+        b.add_terms(r[:, None], z_vq, -QmaxBP)
+        rhs = np.zeros(T)
+        rhs[0] = V0
+        r = b.add_rows(T, lower=rhs, upper=rhs)
+        b.add_terms(r[:, None], z_vq, VolBP)
+        b.add_terms(r[1:], vol[:-1], -1.0)
+        r = b.add_rows((T, nvq), upper=0.0)
+        b.add_terms(r, z_vq, 1.0)
+        b.add_terms(r, w_vq[:, :-1], -1.0)
+        b.add_terms(r, w_vq[:, 1:], -1.0)
+        r = b.add_rows(T, lower=1.0, upper=1.0)
+        b.add_terms(r[:, None], z_vq, 1.0)
+        r = b.add_rows(T, lower=1.0, upper=1.0)
+        b.add_terms(r[:, None], w_vq[:, 1:], 1.0)
+        """
+        Restricción caudal máximo por canal (restricción por volumen)
+        """
+        r = b.add_rows(T, upper=0.0)
+        b.add_terms(r, qs, 1.0)
+        b.add_terms(r, q_max_vol, -1.0)
+
+    ZonaLimitePQ = list(p.ZonaLimitePQ[i])
+    FranjasGrupos = [list(franjas) for franjas in p.FranjasGrupos[i].values()]
+
+    """
+    Restricción número total de franjas en zona límite del embalse
+    """
+    r = b.add_rows((), lower=0.0, upper=0.0)
+    b.add_terms(r, zl_tot, 1.0)
+    b.add_terms(r, w_pq[:, ZonaLimitePQ], -1.0)
+
+    """
+    Restricción cómputo arranques de powergroups
+    """
+    pwch = index["pwch"] = b.add_columns(
+        (T, len(FranjasGrupos)), upper=1 if bounds is None else bounds.arranques[i], integer=True
+    )
+    for pg in range(len(FranjasGrupos) - 1):
+        if config.startup_formulation == "cumulative":
+            # pwch >= cambio del estado "en el grupo pg + 1 o superior" respecto a la franja anterior
+            franjas_desde = [f for grupo in FranjasGrupos[pg + 1:] for f in grupo]
+            r = b.add_rows(T - 1, lower=0.0)
+            b.add_terms(r, pwch[1:, pg + 1], 1.0)
+            b.add_terms(r[:, None], w_pq[1:, franjas_desde], -1.0)
+            b.add_terms(r[:, None], w_pq[:-1, franjas_desde], 1.0)
+            continue
+        franjas = FranjasGrupos[pg]
+        franjassuperiores = [f for grupo in FranjasGrupos[pg + 1:] for f in grupo]
+        for lower, upper, coef in ((-np.inf, 1.0, -1.0), (0.0, np.inf, -2.0)):
+            r = b.add_rows(T - 1, lower=lower, upper=upper)
+            b.add_terms(r[:, None], w_pq[:-1, franjas], 1.0)
+            b.add_terms(r[:, None], w_pq[1:, franjassuperiores], 1.0)
+            b.add_terms(r, pwch[1:, pg + 1], coef)
+    """
+    Restricción cálculo número de arranques totales del embalse
+    """
+    r = b.add_rows((), lower=0.0, upper=0.0)
+    b.add_terms(r, pwch_tot, 1.0)
+    b.add_terms(r, pwch, -1.0)
+
+    index.update({
+        "vol": vol,
+        "qe": qe,
+        "qs": qs,
+        "pot": pot,
+        "qtb": qtb,
+        "qch": qch,
+        "x_pos": x_pos,
+        "x_neg": x_neg,
+        "pos_desv": pos_desv,
+        "neg_desv": neg_desv,
+        "ben_desv": ben_desv,
+        "zl_tot": zl_tot,
+        "pwch_tot": pwch_tot,
+        "pot_embalse": pot_embalse,
+    })
+
+    # Objective Function (términos del embalse)
+    objective = [
+        (pot_embalse, 1.0),
+        (ben_desv, escala),
+        (zl_tot, -p.PenZL),
+        (pwch_tot, -p.PenSU),
+    ]
+
+    return b.build(objective, index)
+
+
+def solve_matrix_model(model: MatrixModel, config) -> tuple[np.ndarray | None, float | None, str]:
+
+    """
+    Solves the MatrixModel passing the arrays directly to HiGHS (scipy.optimize.milp).
+
+    :return: Values of the variables, objective value and status message of the solver
+    """
+
+    from scipy.optimize import Bounds, LinearConstraint, milp
+
+    res = milp(
+        c=-model.objective,
+        integrality=model.integrality,
+        bounds=Bounds(model.col_lower, model.col_upper),
+        constraints=LinearConstraint(model.A, model.row_lower, model.row_upper),
+        options={"time_limit": config.time_limit_seconds, "mip_rel_gap": config.MIPGap, "disp": True},
+    )
+    if res.x is None:
+        return None, None, res.message
+    return res.x, -res.fun, res.message
@@ -0,0 +1,364 @@
+import hashlib
+import json
+from collections import OrderedDict
+from dataclasses import dataclass
+from types import MappingProxyType
+import numpy as np
+from instance_ana import InstanceData
+
+# Parámetros ya calculados, indexados por el hash del contenido de la instancia y la configuración;
+# solo se guardan los _CACHE_SIZE usados más recientemente
+_CACHE = OrderedDict()
+_CACHE_SIZE = 16
+
+
+def configuration_fields(config) -> list:
+    """
+    :return: Fields of the LPConfiguration that the parameters of the model depend on
+    """
+    return [
+        config.volume_objectives,
+        config.volume_shortage_penalty,
+        config.volume_exceedance_bonus,
+        config.startups_penalty,
+        config.limit_zones_penalty,
+        config.flow_smoothing,
+        config.simplify_pq_curves,
+    ]
+
+
+def _frozen(values, dtype=float) -> np.ndarray:
+    """
+    :return: Read-only array (of floats by default) with the given values
+    """
+    array = np.array(values, dtype=dtype)
+    array.setflags(write=False)
+    return array
+
+
+def _snap_to_breakpoints(flows: list[float], breakpoints: list[float]) -> list[float]:
+
+    """
+    Proceso para eliminar la desviación de decimales de startup_flows y shutdown_flows:
+    cada caudal a menos de 0.1 m3/s de un breakpoint de la curva Potencia - Caudal turbinado
+    toma el valor de ese breakpoint.
+    """
+
+    flows = list(flows)
+    for y in range(len(flows)):
+        for bp in breakpoints:
+            if -0.1 <= flows[y] - bp <= 0.1:
+                flows[y] = bp
+    return flows
+
+
+def _simplify_curve(
+    flows: list[float], powers: list[float], max_flow: float, startup: list[float], shutdown: list[float]
+) -> tuple[list[float], list[float]]:
+
+    """
+    Simplificación de la curva Potencia - Caudal turbinado:
+    se eliminan los breakpoints posteriores al primero que alcanza el caudal turbinado máximo
+    (que pasa a ser el último, en el caudal máximo) y los breakpoints intermedios entre dos franjas
+    colineales del mismo grupo de potencia y zona límite.
+    Los breakpoints de arranque y apagado se mantienen siempre.
+    """
+
+    def etiqueta(j):
+        # Franja 1, grupo de potencia y zona límite de la franja que empieza en el breakpoint j
+        return j == 0, sum(start <= flows[j] for start in startup), flows[j] in shutdown
+
+    ultimo = next((j for j, flow in enumerate(flows) if flow >= max_flow), len(flows) - 1)
+    ultimo = max([ultimo, 1] + [j for j, flow in enumerate(flows) if flow in startup or flow in shutdown])
+
+    puntos = [0]
+    for j in range(1, ultimo):
+        a, b = puntos[-1], j + 1
+        colineal = abs(
+            (flows[j] - flows[a]) * (powers[b] - powers[a]) - (powers[j] - powers[a]) * (flows[b] - flows[a])
+        ) <= 1e-9 * max(1.0, abs(flows[b] - flows[a]) * abs(powers[b] - powers[a]))
+        if flows[j] in startup or flows[j] in shutdown or not colineal or etiqueta(a) != etiqueta(j):
+            puntos.append(j)
+    puntos.append(ultimo)
+    flows, powers = [flows[j] for j in puntos], [powers[j] for j in puntos]
+
+    # El último breakpoint se lleva al caudal máximo, interpolando la potencia
+    if flows[-1] > max_flow > flows[-2] and flows[-1] not in startup and flows[-1] not in shutdown:
+        powers[-1] = powers[-2] + (powers[-1] - powers[-2]) * (max_flow - flows[-2]) / (flows[-1] - flows[-2])
+        flows[-1] = max_flow
+    return flows, powers
+
+
+def _is_concave(x, y) -> bool:
+    """
+    :return: Whether the piecewise linear function through (x, y) is concave
+    (strictly increasing abscissas and non-increasing slopes)
+    """
+    anchos = np.diff(x)
+    if np.any(anchos <= 0):
+        return False
+    return bool(np.all(np.diff(np.diff(y) / anchos) <= 1e-9))
+
+
+def _concave_pieces(flows: list[float], powers: list[float], regions: tuple) -> tuple:
+
+    """
+    Divide cada región de la curva Potencia - Caudal turbinado en piezas: franjas consecutivas
+    en las que la curva es cóncava (pendientes no crecientes).
+    """
+
+    piezas = []
+    for region in regions:
+        piezas.append([region[0]])
+        for franja in region[1:]:
+            # La franja s va del breakpoint s al s + 1 (posiciones s - 1 y s)
+            pieza = piezas[-1] + [franja]
+            if _is_concave(flows[pieza[0] - 1:franja + 1], powers[pieza[0] - 1:franja + 1]):
+                piezas[-1] = pieza
+            else:
+                piezas.append([franja])
+    return tuple(tuple(pieza) for pieza in piezas)
+
+
+@dataclass(frozen=True)
+class ModelParameters:
+    """
+    Sets and parameters of the model, derived once from an InstanceData and an LPConfiguration.
+    All arrays are read-only; the values indexed by dam follow the order of I (see dam_index).
+    """
+
+    # Conjunto embalses: I
+    I: tuple[str, ...]
+    # Posición de cada embalse en I
+    dam_index: MappingProxyType
+    # Número de franjas de tiempo (conjunto T = range(num_time_steps))
+    num_time_steps: int
+    # Conjunto lags relevantes: L
+    L: MappingProxyType
+    # Conjuntos breakpoints en curvas Potencia - Caudal turbinado y Volumen - Caudal máximo (desde 1)
+    BreakPointsPQ: MappingProxyType
+    BreakPointsVQ: MappingProxyType
+
+    # Duración de cada franja (s): D
+    D: float
+    # Franja donde se compara con volumen objetivo: D_1
+    D_1: int
+    # Franjas sin cambio en el sentido de la variación del caudal de salida: K
+    K: int
+    # Precio en cada franja (€/MWh): Price
+    Price: np.ndarray
+    # Caudal entrante al primer embalse (m3/s): Q0
+    Q0: np.ndarray
+    # Caudal no regulado de cada embalse en cada franja (m3/s): Qnr, shape (num_dams, num_time_steps)
+    Qnr: np.ndarray
+    # Caudal máximo permitido por canal (m3/s): QMax
+    QMax: np.ndarray
+    # Volumen inicial, máximo, mínimo y final objetivo de cada embalse (m3)
+    V0: np.ndarray
+    VMax: np.ndarray
+    VMin: np.ndarray
+    VolFinal: np.ndarray
+    # Unidad de volumen de los modelos con scale_units (m3): potencia de 10 más cercana al volumen que la
+    # mediana de los caudales máximos desembalsa en una franja, para que los volúmenes y los términos
+    # D * caudal del balance sean del orden de la unidad: EscalaVol
+    EscalaVol: float
+    # Lags iniciales en el caudal de entrada a cada embalse (m3/s): IniLags
+    IniLags: MappingProxyType
+
+    # Breakpoints de la curva Potencia - Caudal turbinado: caudal (m3/s) y potencia (MWh)
+    QtBP: MappingProxyType
+    PotBP: MappingProxyType
+    # Breakpoints de la curva Volumen - Caudal máximo: caudal (m3/s) y volumen (m3); None si no existe
+    QmaxBP: MappingProxyType
+    VolBP: MappingProxyType
+
+    # Caudales turbinados de arranque y apagado de turbina, ajustados a los breakpoints (m3/s)
+    startup_flows: MappingProxyType
+    shutdown_flows: MappingProxyType
+    # Franjas de la curva Potencia - Caudal turbinado en zona límite: ZonaLimitePQ
+    ZonaLimitePQ: MappingProxyType
+    # Franjas de la curva Potencia - Caudal turbinado de cada grupo de potencia: FranjasGrupos
+    FranjasGrupos: MappingProxyType
+    # Regiones de la curva Potencia - Caudal turbinado: franjas consecutivas con el mismo grupo de potencia
+    # y zona límite, que son las únicas que necesita distinguir la formulación SOS2: RegionesPQ
+    RegionesPQ: MappingProxyType
+    # Piezas de la curva Potencia - Caudal turbinado: franjas consecutivas de una misma región en las que
+    # la curva es cóncava. Como la potencia se maximiza (si todos los precios son positivos), la combinación
+    # de los breakpoints de una pieza ya está sobre la curva y basta una binaria por pieza; con algún precio
+    # no positivo cada franja es una pieza: PiezasPQ
+    PiezasPQ: MappingProxyType
+    # Si la curva Volumen - Caudal máximo de cada embalse es cóncava (None si no existe): ConcavaVQ
+    ConcavaVQ: MappingProxyType
+    # Código Gray de cada franja de la curva Potencia - Caudal turbinado (bits, desde la franja 1),
+    # usado por la formulación logarítmica: CodigosPQ
+    CodigosPQ: MappingProxyType
+    # Breakpoints de la curva Potencia - Caudal turbinado eliminados al simplificarla (ver simplify_pq_curves)
+    BreakPointsEliminadosPQ: MappingProxyType
+
+    # Bonus por exceder y penalización por no llegar a volumen objetivo (€/m3)
+    BonusVol: float
+    PenVol: float
+    # Penalización por franja en zona límite y por arranque de grupo de potencia (€/ocurrencia)
+    PenZL: float
+    PenSU: float
+
+    # Franjas de la instancia que forman cada franja del modelo con la compresión temporal (ver compression.py):
+    # primera franja y número de franjas de cada una; None sin compresión: Periodos
+    Periodos: tuple = None
+    # Caudal turbinado de cada embalse en cada franja con la compresión temporal: parte constante (lags iniciales)
+    # y pesos de los caudales de salida de las franjas anteriores, como (constante, ((franja, peso), ...));
+    # None sin compresión: PesosLags
+    PesosLags: MappingProxyType = None
+    # Caudal de entrada de cada embalse acumulado en las k primeras franjas de la instancia de cada franja con la
+    # compresión temporal (k = 1, ..., duración - 1), en la misma forma que PesosLags con los caudales de salida
+    # del embalse anterior; None sin compresión: EntradasParciales
+    EntradasParciales: MappingProxyType = None
+
+    # Estado anterior a la primera franja en las ventanas de Relax&Fix (ver relax_and_fix/lp_RF.py); None en el
+    # modelo completo. Indicadores de variación de caudal (x_pos, x_neg) de cada embalse en las K franjas
+    # anteriores, de la más reciente a la más antigua: VariacionesIniciales
+    VariacionesIniciales: MappingProxyType = None
+    # Segmento de la curva Potencia - Caudal turbinado de cada embalse en la franja anterior: SegmentoInicial
+    SegmentoInicial: MappingProxyType = None
+    # Valor del agua de cada embalse al final del horizonte (€/m3), que sustituye a la desviación respecto
+    # al volumen objetivo cuando la ventana acaba antes que el horizonte de decisión: ValorAgua
+    ValorAgua: np.ndarray = None
+    # Volumen de cada embalse al final de la ventana por debajo del cual el volumen objetivo ya no se alcanza, ni
+    # con el caudal de entrada máximo hasta el horizonte de decisión (m3); lo que falta hasta él se penaliza como
+    # falta de volumen junto con ValorAgua: VolFinalAlcanzable
+    VolFinalAlcanzable: np.ndarray = None
+
+    @classmethod
+    def from_instance(cls, instance: InstanceData, config) -> "ModelParameters":
+        """
+        Returns the parameters of the model for the given instance and configuration.
+        They are memoized by the content of the instance and of the fields of the configuration
+        used in the model (see configuration_fields), so repeated models of the same instance reuse them;
+        only the _CACHE_SIZE most recently used are kept.
+
+        :param instance: Instance of the problem
+        :param config: LPConfiguration of the model
+        """
+        key = hashlib.sha256(
+            json.dumps([instance.data, *configuration_fields(config)], sort_keys=True, default=str).encode()
+        ).hexdigest()
+        if key in _CACHE:
+            _CACHE.move_to_end(key)
+            return _CACHE[key]
+        parameters = _CACHE[key] = cls._compute(instance, config)
+        if len(_CACHE) > _CACHE_SIZE:
+            _CACHE.popitem(last=False)
+        return parameters
+
+    @classmethod
+    def _compute(cls, instance: InstanceData, config) -> "ModelParameters":
+        I = tuple(instance.get_ids_of_dams())
+
+        QtBP, PotBP, QmaxBP, VolBP = {}, {}, {}, {}
+        startup_flows, shutdown_flows, ZonaLimitePQ, FranjasGrupos, RegionesPQ = {}, {}, {}, {}, {}
+        CodigosPQ, BreakPointsEliminadosPQ, PiezasPQ, ConcavaVQ = {}, {}, {}, {}
+        precios_positivos = bool(np.all(np.asarray(instance.get_all_prices()) > 0))
+        for i in I:
+            obs = instance.get_turbined_flow_obs_for_power_group(i)
+            limit = instance.get_flow_limit_obs_for_channel(i)
+            QmaxBP[i] = _frozen(limit["observed_flows"]) if limit is not None else None
+            VolBP[i] = _frozen(limit["observed_vols"]) if limit is not None else None
+
+            flows = obs["observed_flows"]
+            powers = obs["observed_powers"]
+            startup = _snap_to_breakpoints(instance.get_startup_flows_of_power_group(i), flows)
+            shutdown = _snap_to_breakpoints(instance.get_shutdown_flows_of_power_group(i), flows)
+            if config.simplify_pq_curves:
+                # El caudal turbinado es la media de caudales de salida (<= QMax) o de lags iniciales
+                max_flow = max(
+                    [instance.get_max_flow_of_channel(i)] + list(instance.get_initial_lags_of_channel(i))
+                )
+                flows, powers = _simplify_curve(flows, powers, max_flow, startup, shutdown)
+            BreakPointsEliminadosPQ[i] = len(obs["observed_flows"]) - len(flows)
+            QtBP[i] = _frozen(flows)
+            PotBP[i] = _frozen(powers)
+            startup_flows[i] = _frozen(startup)
+            shutdown_flows[i] = _frozen(shutdown)
+
+            # Se elimina la primera franja (antes del primer arranque) de las zonas límite
+            ZonaLimitePQ[i] = tuple(flows.index(bp) + 1 for bp in flows if bp in shutdown)[1:]
+
+            grupos = {"Grupo_potencia0": (1,)}
+            for gp in range(len(startup)):
+                if gp == len(startup) - 1:
+                    # El último breakpoint no inicia ninguna franja
+                    franjas = [flows.index(bp) + 1 for bp in flows if bp >= startup[gp] and bp != flows[-1]]
+                else:
+                    franjas = [flows.index(bp) + 1 for bp in flows if startup[gp] <= bp < startup[gp + 1]]
+                grupos["Grupo_potencia" + str(gp + 1)] = tuple(franjas)
+            FranjasGrupos[i] = MappingProxyType(grupos)
+
+            grupo_de_franja = {franja: pg for pg, franjas in grupos.items() for franja in franjas}
+            regiones = []
+            for franja in range(1, len(flows)):
+                etiqueta = (grupo_de_franja.get(franja), franja in ZonaLimitePQ[i])
+                if regiones and etiqueta == etiqueta_anterior:
+                    regiones[-1].append(franja)
+                else:
+                    regiones.append([franja])
+                etiqueta_anterior = etiqueta
+            RegionesPQ[i] = tuple(tuple(region) for region in regiones)
+            if precios_positivos:
+                PiezasPQ[i] = _concave_pieces(flows, powers, RegionesPQ[i])
+            else:
+                PiezasPQ[i] = tuple((franja,) for franja in range(1, len(flows)))
+            ConcavaVQ[i] = _is_concave(VolBP[i], QmaxBP[i]) if VolBP[i] is not None else None
+
+            # Franjas consecutivas tienen códigos que difieren en un único bit
+            num_franjas = len(flows) - 1
+            num_bits = (num_franjas - 1).bit_length()
+            CodigosPQ[i] = tuple(
+                tuple(((franja ^ (franja >> 1)) >> bit) & 1 for bit in range(num_bits))
+                for franja in range(num_franjas)
+            )
+
+        # Volumen que la mediana de los caudales máximos desembalsa en una franja (m3)
+        volumen_franja = instance.get_time_step_seconds() * float(
+            np.median([instance.get_max_flow_of_channel(i) for i in I])
+        )
+
+        return cls(
+            I=I,
+            dam_index=MappingProxyType({i: d for d, i in enumerate(I)}),
+            num_time_steps=instance.get_largest_impact_horizon(),
+            L=MappingProxyType({i: tuple(instance.get_verification_lags_of_dam(i)) for i in I}),
+            BreakPointsPQ=MappingProxyType({i: tuple(range(1, len(QtBP[i]) + 1)) for i in I}),
+            BreakPointsVQ=MappingProxyType(
+                {i: tuple(range(1, len(VolBP[i]) + 1)) if VolBP[i] is not None else None for i in I}
+            ),
+            D=instance.get_time_step_seconds(),
+            D_1=instance.get_decision_horizon(),
+            K=config.flow_smoothing,
+            Price=_frozen(instance.get_all_prices()),
+            Q0=_frozen(instance.get_all_incoming_flows()),
+            Qnr=_frozen([instance.get_all_unregulated_flows_of_dam(i) for i in I]),
+            QMax=_frozen([instance.get_max_flow_of_channel(i) for i in I]),
+            V0=_frozen([instance.get_initial_vol_of_dam(i) for i in I]),
+            VMax=_frozen([instance.get_max_vol_of_dam(i) for i in I]),
+            VMin=_frozen([instance.get_min_vol_of_dam(i) for i in I]),
+            VolFinal=_frozen([config.volume_objectives[i] for i in I]),
+            EscalaVol=10.0 ** round(np.log10(max(volumen_franja, 1.0))),
+            IniLags=MappingProxyType({i: _frozen(instance.get_initial_lags_of_channel(i)) for i in I}),
+            QtBP=MappingProxyType(QtBP),
+            PotBP=MappingProxyType(PotBP),
+            QmaxBP=MappingProxyType(QmaxBP),
+            VolBP=MappingProxyType(VolBP),
+            startup_flows=MappingProxyType(startup_flows),
+            shutdown_flows=MappingProxyType(shutdown_flows),
+            ZonaLimitePQ=MappingProxyType(ZonaLimitePQ),
+            FranjasGrupos=MappingProxyType(FranjasGrupos),
+            RegionesPQ=MappingProxyType(RegionesPQ),
+            PiezasPQ=MappingProxyType(PiezasPQ),
+            ConcavaVQ=MappingProxyType(ConcavaVQ),
+            CodigosPQ=MappingProxyType(CodigosPQ),
+            BreakPointsEliminadosPQ=MappingProxyType(BreakPointsEliminadosPQ),
+            BonusVol=config.volume_exceedance_bonus,
+            PenVol=config.volume_shortage_penalty,
+            PenZL=config.limit_zones_penalty,
+            PenSU=config.startups_penalty,
+        )
@@ -0,0 +1,144 @@
+from dataclasses import dataclass
+from types import MappingProxyType
+import numpy as np
+from model_parameters import ModelParameters, _frozen
+
+# Tolerancia al comparar caudales (m3/s) y volúmenes (m3) con las cotas propagadas
+TOLERANCE = 1e-6
+
+
+def _max_pwl(x: np.ndarray, y: np.ndarray, lower: float, upper: float) -> float:
+    """
+    :return: Maximum of the piecewise linear function through (x, y) in the interval [lower, upper]
+    """
+    puntos = np.concatenate(([lower, upper], x[(x > lower) & (x < upper)]))
+    return float(np.interp(puntos, x, y).max())
+
+
+@dataclass(frozen=True)
+class PresolveBounds:
+    """
+    Bounds of the model propagated forward in time from the initial volumes and lags, the incoming
+    and unregulated flows and the channel limits, and the curve segments that are reachable with them.
+    Arrays indexed by dam follow the order of ModelParameters.I and have shape (num_dams, num_time_steps).
+    """
+
+    # Cota superior del volumen de cada embalse en cada franja (m3); la inferior es VMin
+    vol_ub: np.ndarray
+    # Cotas del caudal de entrada (m3/s)
+    qe_lb: np.ndarray
+    qe_ub: np.ndarray
+    # Cota superior del caudal de salida (m3/s); la inferior es 0
+    qs_ub: np.ndarray
+    # Cotas del caudal turbinado (m3/s)
+    qtb_lb: np.ndarray
+    qtb_ub: np.ndarray
+    # Cotas de la variación del caudal de salida (m3/s), usadas como big-M de x_pos y x_neg
+    qch_lb: np.ndarray
+    qch_ub: np.ndarray
+    # Franjas alcanzables de la curva Potencia - Caudal turbinado: array (num_time_steps, franjas) por embalse,
+    # donde la columna s - 1 corresponde a la franja s
+    franjas_pq: MappingProxyType
+    # Franjas alcanzables de la curva Volumen - Caudal máximo (None si no existe)
+    franjas_vq: MappingProxyType
+    # Arranques posibles de cada grupo de potencia: array (num_time_steps, grupos) por embalse,
+    # con los grupos en el orden de FranjasGrupos (según la formulación de los arranques, ver from_parameters)
+    arranques: MappingProxyType
+
+    @classmethod
+    def from_parameters(cls, p: ModelParameters, cumulative_startups: bool = False) -> "PresolveBounds":
+        """
+        Propagates the bounds dam by dam (in the order of I, so the turbined flow of the previous dam
+        is known) and time step by time step.
+
+        :param p: Parameters of the model
+        :param cumulative_startups: Whether the startups follow the "cumulative" formulation (a startup of every
+            group between the previous one and the current one) instead of "previous_group"
+        """
+        n, T = len(p.I), p.num_time_steps
+        vol_ub, qe_lb, qe_ub, qs_ub, qtb_lb, qtb_ub, qch_lb, qch_ub = (np.zeros((n, T)) for _ in range(8))
+        franjas_pq, franjas_vq, arranques = {}, {}, {}
+
+        for d, i in enumerate(p.I):
+            L = p.L[i]
+            for t in range(T):
+                # Caudal de entrada: caudal entrante (primer embalse) o turbinado del anterior, más el no regulado
+                if d == 0:
+                    qe_lb[d, t] = qe_ub[d, t] = p.Q0[t] + p.Qnr[d, t]
+                else:
+                    qe_lb[d, t] = qtb_lb[d - 1, t] + p.Qnr[d, t]
+                    qe_ub[d, t] = qtb_ub[d - 1, t] + p.Qnr[d, t]
+
+                # Caudal de salida: limitado por el canal, por el volumen disponible sobre VMin
+                # y por la curva Volumen - Caudal máximo del volumen de la franja anterior
+                vol_anterior = p.V0[d] if t == 0 else vol_ub[d, t - 1]
+                qs_ub[d, t] = min(p.QMax[d], max(0.0, (vol_anterior - p.VMin[d]) / p.D + qe_ub[d, t]))
+                if p.VolBP[i] is not None:
+                    lower = p.V0[d] if t == 0 else p.VMin[d]
+                    qs_ub[d, t] = min(qs_ub[d, t], _max_pwl(p.VolBP[i], p.QmaxBP[i], lower, vol_anterior))
+
+                vol_ub[d, t] = min(p.VMax[d], vol_anterior + p.D * qe_ub[d, t])
+
+                # Caudal turbinado: media de los lags iniciales y de los caudales de salida anteriores
+                lags = [p.IniLags[i][l - 1 - t] for l in L if l - 1 - t >= 0]
+                salidas = [t - l for l in L if t - l >= 0]
+                qtb_lb[d, t] = sum(lags) / len(L)
+                qtb_ub[d, t] = (sum(lags) + sum(qs_ub[d, s] for s in salidas)) / len(L)
+
+            # Variación del caudal de salida respecto al lag inicial (t = 0) o a la franja anterior
+            qs_anterior_lb = np.concatenate(([p.IniLags[i][0]], np.zeros(T - 1)))
+            qs_anterior_ub = np.concatenate(([p.IniLags[i][0]], qs_ub[d, :-1]))
+            qch_lb[d] = -qs_anterior_ub
+            qch_ub[d] = qs_ub[d] - qs_anterior_lb
+
+            # Franjas alcanzables: las que cortan el intervalo [cota inferior, cota superior]
+            QtBP = p.QtBP[i]
+            franjas_pq[i] = _frozen(
+                (QtBP[:-1][None, :] <= qtb_ub[d][:, None] + TOLERANCE)
+                & (QtBP[1:][None, :] >= qtb_lb[d][:, None] - TOLERANCE),
+                dtype=bool,
+            )
+            if p.VolBP[i] is not None:
+                # La curva Volumen - Caudal máximo se evalúa en el volumen de la franja anterior
+                vol_lb_anterior = np.concatenate(([p.V0[d]], np.full(T - 1, p.VMin[d])))
+                vol_ub_anterior = np.concatenate(([p.V0[d]], vol_ub[d, :-1]))
+                VolBP = p.VolBP[i]
+                franjas_vq[i] = _frozen(
+                    (VolBP[:-1][None, :] <= vol_ub_anterior[:, None] + TOLERANCE)
+                    & (VolBP[1:][None, :] >= vol_lb_anterior[:, None] - TOLERANCE),
+                    dtype=bool,
+                )
+            else:
+                franjas_vq[i] = None
+
+            # Un arranque del grupo k + 1 en t exige estar en el grupo k ("previous_group") o en un grupo
+            # no superior a k ("cumulative") en t - 1 y en un grupo superior a k en t;
+            # el grupo 0 no tiene arranques, ni la primera franja salvo respecto al segmento inicial de una
+            # ventana de Relax&Fix
+            grupos = list(p.FranjasGrupos[i].values())
+            alcanzable = np.array(
+                [[franjas_pq[i][t, [f - 1 for f in franjas]].any() for franjas in grupos] for t in range(T)]
+            ).reshape(T, len(grupos))
+            if p.SegmentoInicial is not None:
+                inicial = np.array([[p.SegmentoInicial[i] in franjas for franjas in grupos]])
+                alcanzable = np.concatenate((inicial, alcanzable))
+            superiores = np.flip(np.logical_or.accumulate(np.flip(alcanzable, axis=1), axis=1), axis=1)
+            anteriores = np.logical_or.accumulate(alcanzable, axis=1) if cumulative_startups else alcanzable
+            posibles = np.zeros((T, len(grupos)), dtype=bool)
+            primera = 0 if p.SegmentoInicial is not None else 1
+            posibles[primera:, 1:] = anteriores[:-1, :-1] & superiores[1:, 1:]
+            arranques[i] = _frozen(posibles, dtype=bool)
+
+        return cls(
+            vol_ub=_frozen(vol_ub),
+            qe_lb=_frozen(qe_lb),
+            qe_ub=_frozen(qe_ub),
+            qs_ub=_frozen(qs_ub),
+            qtb_lb=_frozen(qtb_lb),
+            qtb_ub=_frozen(qtb_ub),
+            qch_lb=_frozen(qch_lb),
+            qch_ub=_frozen(qch_ub),
+            franjas_pq=MappingProxyType(franjas_pq),
+            franjas_vq=MappingProxyType(franjas_vq),
+            arranques=MappingProxyType(arranques),
+        )
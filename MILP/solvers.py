@@ -0,0 +1,323 @@
+import time
+import warnings
+from functools import lru_cache
+import numpy as np
+import pulp as lp
+from pulp import constants
+
+# Backends de resolución disponibles, en orden de preferencia para el fallback
+SOLVER_BACKENDS = ["gurobi_cmd", "highs", "cbc"]
+
+# Backends que admiten restricciones SOS (formulación "sos2" de las curvas)
+SOS_BACKENDS = ["gurobi_cmd", "cbc"]
+
+# Backends que devuelven los duales de las restricciones de un LP (GUROBI_CMD solo lee los valores primales)
+DUAL_BACKENDS = ["highs", "cbc"]
+
+
+def highs_lp(lpproblem: lp.LpProblem, variables: list, mip: bool = True):
+    """
+    :return: highspy.HighsLp of the LpProblem, with the columns in the order of variables and the rows
+        in the order of its constraints, as CSR arrays
+    """
+    import highspy
+
+    position = {var.name: k for k, var in enumerate(variables)}
+    num_cols = len(variables)
+
+    cost = np.zeros(num_cols)
+    for var, coef in lpproblem.objective.items():
+        cost[position[var.name]] = coef
+    col_lower = np.array([-np.inf if var.lowBound is None else var.lowBound for var in variables], dtype=float)
+    col_upper = np.array([np.inf if var.upBound is None else var.upBound for var in variables], dtype=float)
+    integrality = np.array([var.cat == constants.LpInteger for var in variables], dtype=np.int8)
+
+    constraints = list(lpproblem.constraints.values())
+    start = np.zeros(len(constraints) + 1, dtype=np.int32)
+    index, value = [], []
+    row_lower = np.full(len(constraints), -np.inf)
+    row_upper = np.full(len(constraints), np.inf)
+    for r, constraint in enumerate(constraints):
+        for var, coef in constraint.items():
+            index.append(position[var.name])
+            value.append(coef)
+        start[r + 1] = len(index)
+        lower, upper = constraint.getLb(), constraint.getUb()
+        if lower is not None:
+            row_lower[r] = lower
+        if upper is not None:
+            row_upper[r] = upper
+
+    model = highspy.HighsLp()
+    model.num_col_ = num_cols
+    model.num_row_ = len(constraints)
+    model.sense_ = (
+        highspy.ObjSense.kMaximize if lpproblem.sense == constants.LpMaximize else highspy.ObjSense.kMinimize
+    )
+    model.offset_ = lpproblem.objective.constant
+    model.col_cost_ = cost
+    model.col_lower_ = col_lower
+    model.col_upper_ = col_upper
+    model.row_lower_ = row_lower
+    model.row_upper_ = row_upper
+    model.a_matrix_.format_ = highspy.MatrixFormat.kRowwise
+    model.a_matrix_.start_ = start
+    model.a_matrix_.index_ = np.array(index, dtype=np.int32)
+    model.a_matrix_.value_ = np.array(value, dtype=float)
+    if mip and integrality.any():
+        model.integrality_ = [
+            highspy.HighsVarType.kInteger if integer else highspy.HighsVarType.kContinuous
+            for integer in integrality
+        ]
+    return model
+
+
+def run_highs(h, lpproblem: lp.LpProblem, variables: list, msg=True, gapRel=None, timeLimit=None, threads=None,
+              warmStart=False) -> int:
+    """
+    Sets the options of the highspy.Highs instance h, which has the model of the LpProblem (see highs_lp), solves it
+    and passes the solution to the LpProblem: values of the variables, duals of the constraints (linear problems),
+    final gap (lpproblem.mip_gap) and status.
+
+    :param warmStart: Whether the current values of the variables are passed as initial solution
+    :return: Status of the solution (see pulp.LpStatus)
+    """
+    import highspy
+
+    h.setOptionValue("output_flag", bool(msg))
+    if gapRel is not None:
+        h.setOptionValue("mip_rel_gap", float(gapRel))
+    if timeLimit is not None:
+        h.setOptionValue("time_limit", float(timeLimit))
+    if threads is not None:
+        h.setOptionValue("threads", int(threads))
+    if warmStart:
+        start_values = [(k, var.varValue) for k, var in enumerate(variables) if var.varValue is not None]
+        if start_values:
+            cols, vals = zip(*start_values)
+            h.setSolution(len(cols), np.array(cols, dtype=np.int32), np.array(vals, dtype=float))
+    h.run()
+
+    model_status = h.getModelStatus()
+    has_solution = h.getInfo().primal_solution_status == 2
+    if model_status == highspy.HighsModelStatus.kOptimal:
+        status, sol_status = constants.LpStatusOptimal, constants.LpSolutionOptimal
+    elif model_status in (highspy.HighsModelStatus.kInfeasible, highspy.HighsModelStatus.kUnboundedOrInfeasible):
+        status, sol_status = constants.LpStatusInfeasible, constants.LpSolutionInfeasible
+    elif model_status == highspy.HighsModelStatus.kUnbounded:
+        status, sol_status = constants.LpStatusUnbounded, constants.LpSolutionUnbounded
+    elif has_solution:
+        # Límite de tiempo (u otra parada) con solución factible
+        status, sol_status = constants.LpStatusOptimal, constants.LpSolutionIntegerFeasible
+    else:
+        status, sol_status = constants.LpStatusNotSolved, constants.LpSolutionNoSolutionFound
+
+    if has_solution:
+        col_value = h.getSolution().col_value
+        for k, var in enumerate(variables):
+            var.varValue = col_value[k]
+    if h.getInfo().dual_solution_status == 2:
+        # Duales de las filas (solo en problemas lineales), como los que PuLP lee de los otros backends
+        row_dual = h.getSolution().row_dual
+        for r, constraint in enumerate(lpproblem.constraints.values()):
+            constraint.pi = row_dual[r]
+    # Gap relativo final (solo en problemas enteros con solución), p.ej. para medir la dificultad de un bloque
+    lpproblem.mip_gap = h.getInfo().mip_gap if has_solution and lpproblem.isMIP() else None
+    lpproblem.assignStatus(status, sol_status)
+    return status
+
+
+class HighsArraySolver(lp.LpSolver):
+    """
+    In-process HiGHS backend: the LpProblem is converted once to CSR arrays and passed to highspy
+    with a single passModel call, without writing LP/MPS files or starting a subprocess.
+    """
+
+    name = "HiGHS_arrays"
+
+    def __init__(self, gapRel=None, timeLimit=None, threads=None, warmStart=False, msg=True):
+        super().__init__(mip=True, msg=msg, timeLimit=timeLimit)
+        self.gapRel = gapRel
+        self.threads = threads
+        self.warmStart = warmStart
+
+    def available(self):
+        return highspy_available()
+
+    def actualSolve(self, lpproblem: lp.LpProblem, **kwargs):
+        import highspy
+
+        if lpproblem.sos1 or lpproblem.sos2:
+            raise lp.PulpSolverError("HiGHS does not support SOS constraints")
+
+        variables = lpproblem.variables()
+        h = highspy.Highs()
+        h.passModel(highs_lp(lpproblem, variables, mip=self.mip))
+        return run_highs(
+            h, lpproblem, variables, self.msg, self.gapRel, self.timeLimit, self.threads, self.warmStart
+        )
+
+
+class PersistentHighsModel:
+    """
+    HiGHS model of an LpProblem kept in memory between solves in which only the bounds and the integrality of
+    some variables change (e.g. the Relax&Fix iterations): the problem is passed to highspy once and each solve
+    only updates those columns, instead of converting and passing the whole problem again as HighsArraySolver.
+    The constraints and the objective of the LpProblem must not change after it is created.
+    """
+
+    def __init__(self, lpproblem: lp.LpProblem):
+        import highspy
+
+        if lpproblem.sos1 or lpproblem.sos2:
+            raise lp.PulpSolverError("HiGHS does not support SOS constraints")
+        self.lpproblem = lpproblem
+        self.variables = lpproblem.variables()
+        self.position = {var.name: k for k, var in enumerate(self.variables)}
+        self.num_rows = len(lpproblem.constraints)
+        self.highs = highspy.Highs()
+        self.highs.passModel(highs_lp(lpproblem, self.variables))
+
+    def solve(self, config, changed_variables: list, warm_start: bool = False) -> int:
+        """
+        Copies the bounds and the integrality of changed_variables from the LpProblem to the HiGHS model
+        and solves it with the gap, time limit and threads of the configuration. As LpProblem.solve, it sets
+        the time of the solve in lpproblem.solutionTime.
+
+        :param changed_variables: Variables of the LpProblem whose bounds or integrality may have changed
+        :param warm_start: Whether the current values of the variables are passed as initial solution
+        :return: Status of the solution (see pulp.LpStatus)
+        """
+        if len(self.lpproblem.constraints) != self.num_rows:
+            raise ValueError("The constraints of the LpProblem changed after passing it to HiGHS")
+        cols = np.array([self.position[var.name] for var in changed_variables], dtype=np.int32)
+        lower = np.array([-np.inf if var.lowBound is None else var.lowBound for var in changed_variables], dtype=float)
+        upper = np.array([np.inf if var.upBound is None else var.upBound for var in changed_variables], dtype=float)
+        integrality = np.array([var.cat == constants.LpInteger for var in changed_variables], dtype=np.uint8)
+        h = self.highs
+        h.changeColsBounds(len(cols), cols, lower, upper)
+        h.changeColsIntegrality(len(cols), cols, integrality)
+        # Las opciones de la resolución anterior (p.ej. su time limit) no se conservan
+        h.resetOptions()
+        limite = config.time_limit_seconds
+        if limite is not None and not self.lpproblem.isMIP():
+            # En un problema lineal HiGHS compara el time limit con el tiempo de todas las resoluciones de la instancia
+            limite += h.getRunTime()
+        inicio = time.perf_counter()
+        status = run_highs(
+            h,
+            self.lpproblem,
+            self.variables,
+            gapRel=config.MIPGap,
+            timeLimit=limite,
+            threads=config.threads,
+            warmStart=warm_start,
+        )
+        self.lpproblem.solutionTime = time.perf_counter() - inicio
+        return status
+
+
+@lru_cache(maxsize=None)
+def highspy_available() -> bool:
+    try:
+        import highspy  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+@lru_cache(maxsize=None)
+def backend_available(backend: str) -> bool:
+    if backend == "gurobi_cmd":
+        return lp.GUROBI_CMD(msg=False).available()
+    if backend == "highs":
+        return highspy_available()
+    return lp.PULP_CBC_CMD(msg=False).available()
+
+
+def choose_backend(config, sos: bool = False, duals: bool = False) -> str:
+    """
+    Returns the backend chosen in config.solver ("gurobi_cmd", "highs" or "cbc") or, if it is not available
+    (e.g. no Gurobi license), does not support the SOS constraints of the model or does not return the duals
+    asked for, the next suitable one in SOLVER_BACKENDS.
+
+    :param sos: Whether the model has SOS constraints
+    :param duals: Whether the duals of the constraints are needed (linear problems)
+    """
+    if config.solver not in SOLVER_BACKENDS:
+        raise ValueError(f"Unknown solver backend '{config.solver}'. Options: {SOLVER_BACKENDS}")
+    candidates = [
+        b
+        for b in SOLVER_BACKENDS[SOLVER_BACKENDS.index(config.solver):]
+        if (not sos or b in SOS_BACKENDS) and (not duals or b in DUAL_BACKENDS)
+    ]
+    backend = next((b for b in candidates if backend_available(b)), None)
+    if backend is None:
+        raise RuntimeError(f"None of the solver backends {candidates} is available")
+    if backend != config.solver:
+        if not backend_available(config.solver):
+            motivo = "no está disponible"
+        elif sos and config.solver not in SOS_BACKENDS:
+            motivo = "no admite restricciones SOS"
+        else:
+            motivo = "no devuelve los duales"
+        warnings.warn(f"Solver '{config.solver}' {motivo}, se usa '{backend}'")
+    return backend
+
+
+def get_solver(config, warm_start: bool = False, sos: bool = False, duals: bool = False) -> lp.LpSolver:
+    """
+    Returns the PuLP solver of the backend of choose_backend, configured with its gap, time limit, threads
+    and working directory.
+
+    :param warm_start: Whether the current values of the variables are passed as initial solution
+    :param sos: Whether the model has SOS constraints
+    :param duals: Whether the duals of the constraints are needed (linear problems)
+    """
+    backend = choose_backend(config, sos=sos, duals=duals)
+
+    if backend == "highs":
+        return HighsArraySolver(
+            gapRel=config.MIPGap, timeLimit=config.time_limit_seconds, threads=config.threads, warmStart=warm_start
+        )
+    if backend == "gurobi_cmd":
+        solver = lp.GUROBI_CMD(
+            gapRel=config.MIPGap, timeLimit=config.time_limit_seconds, threads=config.threads, warmStart=warm_start
+        )
+    else:
+        solver = lp.PULP_CBC_CMD(
+            gapRel=config.MIPGap, timeLimit=config.time_limit_seconds, threads=config.threads, warmStart=warm_start
+        )
+    # Ficheros temporales (modelo, solución, MIP start) en un directorio propio de la ejecución
+    if config.workdir is not None:
+        solver.tmpDir = config.workdir
+    return solver
+
+
+def solve_problem(lpproblem: lp.LpProblem, config, warm_start: bool = False, duals: bool = False) -> int:
+    """
+    Solves the LpProblem with the backend of get_solver.
+
+    :param duals: Whether the duals of the constraints (constraint.pi) are needed
+
+    :return: Status of the solution (see pulp.LpStatus)
+    """
+    sos = bool(lpproblem.sos1 or lpproblem.sos2)
+    solver = get_solver(config, warm_start=warm_start, sos=sos, duals=duals)
+    if sos and isinstance(solver, lp.PULP_CBC_CMD):
+        # CBC solo lee las restricciones SOS del fichero LP (PuLP no las escribe en el MPS).
+        # El lector LP de CBC no admite nombres que empiezan por un dígito (p.ej. "01Franja_PQ"),
+        # por lo que las variables se renombran mientras se resuelve.
+        # El preproceso y el strong branching de CBC 2.10 fallan con conjuntos SOS, por lo que
+        # se desactiva el preproceso y se ramifica directamente con pseudocostes
+        solver.options = solver.options + ["preprocess off", "trust 0"]
+        variables = lpproblem.variables()
+        names = [var.name for var in variables]
+        for k, var in enumerate(variables):
+            var.name = f"x{k}"
+        try:
+            return lpproblem.solve(solver, use_mps=False)
+        finally:
+            for var, name in zip(variables, names):
+                var.name = name
+    return lpproblem.solve(solver)
@@ -1,2021 +1,874 @@
+import math
+import os
+import sys
+import time
+from dataclasses import replace
+from types import MappingProxyType
+import numpy as np
 import pulp as lp
-import json
-from instance_ana import InstanceData
-from dataclasses import dataclass
-
-@dataclass
-class LPConfiguration:
-    # Objective final volumes
-    volume_objectives: dict[str, float]
-
-    # Penalty for unfulfilling the objective volumes, and the bonus for exceeding them (in €/m3)
-    volume_shortage_penalty: float
-    volume_exceedance_bonus: float
-
-    # Penalty for each power group startup and for each time step with the turbined 
-    #flow in a limit zone (in €/occurrence)
-    startups_penalty: float
-    limit_zones_penalty: float
-
-    # Gap for the solution
-    MIPGap: float
-
-    # Solver timeout
-    time_limit_seconds: float
-
-    # Number of periods during which the flow through the channel may not vary
-    # in order to change the sense of the flow's change
-    flow_smoothing: int
-
-    # Number of periods during which the flow through the channel may not undergo more than one variation
-    # step_min: int = None
-
-class LPSolution:
-    def __init__(self, data):
-        self.data = data
-
-    @classmethod
-    def from_dict(cls, data) -> "LPSolution":
-        """Convierte una lista de embalses en un diccionario indexado por ID y crea una instancia de LPSolution."""
-        data_p = dict(data)
-        data_p["dams"] = {el["id"]: el for el in data_p["dams"]}
-        return cls(data_p)
-
-    def to_json(self, filepath=None) -> str:
-        """Convierte la solución en un JSON. Si se proporciona un filepath, lo guarda en un archivo."""
-        solution_json = json.dumps(self.data, indent=4)
-        if filepath:
-            with open(filepath, "w") as f:
-                f.write(solution_json)
-        return solution_json
-    
-    def get_exiting_flows_of_dam(self, idx: str) -> list[float]:
-        """
-        Get the assigned flows to the given dam.
-
-        :param idx: ID of the dam in the river basin
-        :return: List indicating the assigned flow exiting the reservoir at each point in time (m3/s)
-        """
-
-        return self.data["dams"][idx]["flows"]
-    
-    def get_volumes_of_dam(self, idx: str) -> list[float] | None:
-
-        """
-        Get the predicted volumes of the given dam.
-
-        :param idx: ID of the dam in the river basin
-        :return: List indicating the volume of the reservoir at the end of every time step (m3)
-        """
-
-        return self.data["dams"][idx].get("volume")
-
-
-class LPModel_RF:
-    def __init__(
-        self,
-        instance: InstanceData,
-        config: LPConfiguration,
-        fixed_values: dict = None,
-        current_binary_t_range: list = None,
-        solution: LPSolution = None,
-    ):
-        self.instance = instance
-        self.config = config
-        self.solution = solution
-        self.fixed_values = fixed_values if fixed_values is not None else {}
-        self.current_binary_t_range = current_binary_t_range
-        self.final_solution_values = {}
-
-    # Método de prueba que posteriormente se eliminará
-    def LPModel_print(self):
-        # Sets
-        """
-        Conjunto embalses: I
-        """
-        I = self.instance.get_ids_of_dams()
-        """
-        Conjunto franjas de tiempo: T
-        """
-        T = list(range(self.instance.get_largest_impact_horizon()))
-        """
-        Conjunto lags relevantes: L
-        """
-        L = {
-            dam_id: self.instance.get_verification_lags_of_dam(dam_id)
-            for dam_id in self.instance.get_ids_of_dams()
-        }
-        """
-        Conjunto breakpoints en curva Potencia - Caudal turbinado: BreakPointsPQ
-        """
-        BreakPointsPQ = {
-            dam_id: list(
-                range(
-                    len(
-                        self.instance.get_turbined_flow_obs_for_power_group(
-                            dam_id
-                        )["observed_flows"]
-                    )
-                )
-            )
-            for dam_id in self.instance.get_ids_of_dams()
-        }
-        # Ajustamos este conjunto para corregir indexación
-        for key in BreakPointsPQ:
-            for i in range(len(BreakPointsPQ[key])):
-                BreakPointsPQ[key][i] += 1
-        """
-        Conjunto breakpoints en curva Volumen - Caudal máximo: BreakPointsVQ
-        """
-        BreakPointsVQ = {}
-        for dam_id in self.instance.get_ids_of_dams():
-            if self.instance.get_flow_limit_obs_for_channel(dam_id) != None:
-                BreakPointsVQ[dam_id] = list(
-                    range(
-                        len(
-                            self.instance.get_flow_limit_obs_for_channel(
-                                dam_id
-                            )["observed_vols"]
-                        )
-                    )
-                )
-            else:
-                BreakPointsVQ[dam_id] = None
-        # Ajustamos este conjunto para corregir indexación
-        for key in BreakPointsVQ:
-            if BreakPointsVQ[key] != None:
-                for i in range(len(BreakPointsVQ[key])):
-                    BreakPointsVQ[key][i] += 1
-
-        # Parameters
-        """
-        Parámetro duración de cada franja (s): D
-        """
-        D = self.instance.get_time_step_seconds()
-        """
-        Parámetro franja donde se compara con volumen objetivo: D_1
-        """
-        D_1 = self.instance.get_decision_horizon()
-        """
-        Parámetro caudal no regulado (m3/s): Qnr
-        """
-        Qnr = {
-            dam_id: self.instance.get_all_unregulated_flows_of_dam(dam_id)
-            for dam_id in self.instance.get_ids_of_dams()
-        }
-        """
-        Parámetro caudal máximo permitido por canal (m3/s): QMax
-        """
-        QMax = {
-            dam_id: self.instance.get_max_flow_of_channel(dam_id)
-            for dam_id in self.instance.get_ids_of_dams()
-        }
-        """
-        Parámetro caudal turbinado en los breakpoints
-        de la curva Potencia - Caudal turbinado (m3/s): QtBP
-        """
-        QtBP = {
-            dam_id: self.instance.get_turbined_flow_obs_for_power_group(
-                dam_id
-            )["observed_flows"]
-            for dam_id in self.instance.get_ids_of_dams()
-        }
-        """
-        Parámetro potencia en los breakpoints
-        de la curva Potencia - Caudal turbinado (MWh): PotBP
-        """
-        PotBP = {
-            dam_id: self.instance.get_turbined_flow_obs_for_power_group(
-                dam_id
-            )["observed_powers"]
-            for dam_id in self.instance.get_ids_of_dams()
-        }
-        """
-        Parámetro caudal máximo en los breakpoints
-        de la curva Volumen - Caudal máximo (m3/s): QmaxBP
-        """
-        QmaxBP = {}
-        for dam_id in self.instance.get_ids_of_dams():
-            if self.instance.get_flow_limit_obs_for_channel(dam_id) != None:
-                QmaxBP[dam_id] = self.instance.get_flow_limit_obs_for_channel(
-                    dam_id
-                )["observed_flows"]
-            else:
-                QmaxBP[dam_id] = None
-        """
-        Parámetro volumen en los breakpoints
-        de la curva Volumen - Caudal máximo (m3): VolBP
-        """
-        VolBP = {}
-        for dam_id in self.instance.get_ids_of_dams():
-            if self.instance.get_flow_limit_obs_for_channel(dam_id) != None:
-                VolBP[dam_id] = self.instance.get_flow_limit_obs_for_channel(
-                    dam_id
-                )["observed_vols"]
-            else:
-                VolBP[dam_id] = None
-        """
-        Parámetro volumen inicial (m3): V0
-        """
-        V0 = {
-            dam_id: self.instance.get_initial_vol_of_dam(dam_id)
-            for dam_id in self.instance.get_ids_of_dams()
-        }
-        """
-        Parámetro volumen máximo (m3): VMax
-        """
-        VMax = {
-            dam_id: self.instance.get_max_vol_of_dam(dam_id)
-            for dam_id in self.instance.get_ids_of_dams()
-        }
-        """
-        Parámetro volumen mínimo (m3): VMin
-        """
-        VMin = {
-            dam_id: self.instance.get_min_vol_of_dam(dam_id)
-            for dam_id in self.instance.get_ids_of_dams()
-        }
-        """
-        Parámetro franjas sin cambio en el caudal de salida: TMin
-        """
-        # TMin = self.config.step_min
-        """
-        Parámetro franjas sin cambio en el caudal de salida: K
-        """
-        K = self.config.flow_smoothing
-        """
-        Parámetro precio en cada franja (€/MWh): Price
-        """
-        Price = self.instance.get_all_prices()
-        """
-        Parámetro lags iniciales en el caudal de entrada
-        a cada embalse (m3/s): IniLags
-        """
-        IniLags = {
-            dam_id: self.instance.get_initial_lags_of_channel(dam_id)
-            for dam_id in self.instance.get_ids_of_dams()
-        }
-        """
-        Parámetro volumen final objetivo (m3): VolFinal
-        """
-        VolFinal = {
-            dam_id: self.config.volume_objectives[dam_id]
-            for dam_id in self.instance.get_ids_of_dams()
-        }
-        """
-        Parámetro caudal entrante al primer embalse (m3/s): Q0
-        """
-        Q0 = self.instance.get_all_incoming_flows()
-        """
-        Parámetro bonus por exceder volumen objetivo (€/m3): BonusVol
-        """
-        BonusVol = self.config.volume_exceedance_bonus
-        """
-        Parámetro penalización por no llegar a volumen objetivo (€/m3): PenVol
-        """
-        PenVol = self.config.volume_shortage_penalty
-        """
-        Parámetro penalización por franja en zona límite
-        (€/nºfranjas): PenZL
-        """
-        PenZL = self.config.limit_zones_penalty
-        """
-        Parámetro penalización por arranque de grupo de potencia
-        (€/nºarranques): PenSU
-        """
-        PenSU = self.config.startups_penalty
-        """
-        Parámetro caudal turbinado de apagado de turbina (m3/s): shutdown_flows
-        """
-        shutdown_flows = {
-            dam_id: self.instance.get_shutdown_flows_of_power_group(dam_id)
-            for dam_id in self.instance.get_ids_of_dams()
-        }
-        """
-        Parámetro caudal turbinado de arranque de turbina (m3/s): startup_flows
-        """
-        startup_flows = {
-            dam_id: self.instance.get_startup_flows_of_power_group(dam_id)
-            for dam_id in self.instance.get_ids_of_dams()
-        }
-
-        # Proceso para eliminar la desviación de decimales de startup_flows y shutdown_flows
-        for i in I:
-            for y in range(len(startup_flows[i])):
-                for w in range(len(QtBP[i])):
-                    if (startup_flows[i][y] - QtBP[i][w]) <= 0.1 and (startup_flows[i][y] - QtBP[i][w]) >= -0.1:
-                        QtBP[i][w] = startup_flows[i][y]
-
-        for i in I:
-            for y in range(len(shutdown_flows[i])):
-                for w in range(len(QtBP[i])):
-                    if (shutdown_flows[i][y] - QtBP[i][w]) <= 0.1 and (shutdown_flows[i][y] - QtBP[i][w]) >= -0.1:
-                        QtBP[i][w] = shutdown_flows[i][y]
-        """
-        Parámetro zonas límite de cada embalse
-        en la curva Potencia - Caudal turbinado: ZonaLimitePQ
-        """
-        ZonaLimitePQ = {}
-        for dam_id in self.instance.get_ids_of_dams():
-            ZonaLimitePQ[dam_id] = []
-        for i in I:
-            for bp in QtBP[i]:
-                if bp in shutdown_flows[i]:
-                    ZonaLimitePQ[i].append(QtBP[i].index(bp)+1)
-        # Proceso para eliminar la primera franja
-        # (antes del primer arranque) de este parámetro
-        for i in I:
-            ZonaLimitePQ[i].pop(0)
-        """
-        Parámetro conjunto de franjas para cada powergroup
-        de cada embalse: FranjasGrupos
-        """
-        FranjasGrupos1 = {}
-        FranjasGrupos = {}
-        for i in I:
-            FranjasGrupos1[i] = {}
-            for gp in range(len(startup_flows[i])):
-                FranjasGrupos1[i]["Grupo_potencia" + str(gp + 1)] = []
-                for bp in QtBP[i]:
-                    if gp == (len(startup_flows[i]) - 1):
-                        if bp >= startup_flows[i][gp]:
-                            FranjasGrupos1[i]["Grupo_potencia" + str(gp + 1)].append(QtBP[i].index(bp) + 1)
-                            if bp == QtBP[i][-1]:
-                                FranjasGrupos1[i]["Grupo_potencia" + str(gp + 1)].pop(-1)
-                    else:
-                        if bp >= startup_flows[i][gp] and bp < startup_flows[i][gp + 1]:
-                            FranjasGrupos1[i]["Grupo_potencia" + str(gp + 1)].append(QtBP[i].index(bp) + 1)
-            FranjasGrupos[i] = {"Grupo_potencia0": [1]}
-            FranjasGrupos[i].update(FranjasGrupos1[i])
-
-        print(f"{I=}")
-        print(f"{T=}")
-        print(f"{L=}")
-        print(f"{BreakPointsPQ=}")
-        print(f"{BreakPointsVQ=}")
-        print(f"{D=}")
-        print(f"{Qnr=}")
-        print(f"{QMax=}")
-        print(f"{QtBP=}")
-        print(f"{PotBP=}")
-        print(f"{QmaxBP=}")
-        print(f"{VolBP=}")
-        print(f"{V0=}")
-        print(f"{VMax=}")
-        print(f"{VMin=}")
-        # print(f"{TMin=}")
-        print(f"{K=}")
-        print(f"{Price=}")
-        print(f"{IniLags=}")
-        print(f"{VolFinal=}")
-        print(f"{Q0=}")
-        print(f"{BonusVol=}")
-        print(f"{PenVol=}")
-        print(f"{PenZL=}")
-        print(f"{PenSU=}")
-        print(f"{shutdown_flows=}")
-        print(f"{startup_flows=}")
-        print(f"{ZonaLimitePQ=}")
-        print(f"{FranjasGrupos=}")
-        print(f"{D_1=}")
-
-    def solve(self, options: dict = None) -> dict:
-        
-        # LP Problem
-        lpproblem = lp.LpProblem("Problema_General_24h_resuelto_con_RF", lp.LpMaximize)
-
-        # Sets
-        """
-        Conjunto embalses: I
-        """
-        I = self.instance.get_ids_of_dams()
-        """
-        Conjunto franjas de tiempo: T
-        """
-        T = list(range(self.instance.get_largest_impact_horizon()))
-        """
-        Conjunto lags relevantes: L
-        """
-        L = {
-            dam_id: self.instance.get_verification_lags_of_dam(dam_id)
-            for dam_id in self.instance.get_ids_of_dams()
-        }
-        """
-        Conjunto breakpoints en curva Potencia - Caudal turbinado: BreakPointsPQ
-        """
-        BreakPointsPQ = {
-            dam_id: list(
-                range(
-                    len(
-                        self.instance.get_turbined_flow_obs_for_power_group(dam_id)[
-                            "observed_flows"
-                        ]
-                    )
-                )
-            )
-            for dam_id in self.instance.get_ids_of_dams()
-        }
-        # Ajustamos este conjunto para corregir indexación
-        for key in BreakPointsPQ:
-            for i in range(len(BreakPointsPQ[key])):
-                BreakPointsPQ[key][i] += 1
-        """
-        Conjunto breakpoints en curva Volumen - Caudal máximo: BreakPointsVQ
-        """
-        BreakPointsVQ = {}
-        for dam_id in self.instance.get_ids_of_dams():
-            if self.instance.get_flow_limit_obs_for_channel(dam_id) != None:
-                BreakPointsVQ[dam_id] = list(
-                    range(
-                        len(
-                            self.instance.get_flow_limit_obs_for_channel(dam_id)[
-                                "observed_vols"
-                            ]
-                        )
-                    )
-                )
-            else:
-                BreakPointsVQ[dam_id] = None
-        # Ajustamos este conjunto para corregir indexación
-        for key in BreakPointsVQ:
-            if BreakPointsVQ[key] != None:
-                for i in range(len(BreakPointsVQ[key])):
-                    BreakPointsVQ[key][i] += 1
-        # Parameters
-        """
-        Parámetro duración de cada franja (s): D
-        """
-        D = self.instance.get_time_step_seconds()
-        """
-        Parámetro franja donde se compara con volumen objetivo: D_1
-        """
-        D_1 = self.instance.get_decision_horizon()
-        """
-        Parámetro caudal no regulado (m3/s): Qnr
-        """
-        Qnr = {
-            dam_id: self.instance.get_all_unregulated_flows_of_dam(dam_id)
-            for dam_id in self.instance.get_ids_of_dams()
-        }
-        """
-        Parámetro caudal máximo permitido por canal (m3/s): QMax
-        """
-        QMax = {
-            dam_id: self.instance.get_max_flow_of_channel(dam_id)
-            for dam_id in self.instance.get_ids_of_dams()
-        }
-        """
-        Parámetro caudal turbinado en los breakpoints
-        de la curva Potencia - Caudal turbinado (m3/s): QtBP
-        """
-        QtBP = {
-            dam_id: self.instance.get_turbined_flow_obs_for_power_group(dam_id)[
-                "observed_flows"
-            ]
-            for dam_id in self.instance.get_ids_of_dams()
-        }
-        """
-        Parámetro potencia en los breakpoints
-        de la curva Potencia - Caudal turbinado (MWh): PotBP
-        """
-        PotBP = {
-            dam_id: self.instance.get_turbined_flow_obs_for_power_group(dam_id)[
-                "observed_powers"
-            ]
-            for dam_id in self.instance.get_ids_of_dams()
-        }
-        """
-        Parámetro caudal máximo en los breakpoints
-        de la curva Volumen - Caudal máximo (m3/s): QmaxBP
-        """
-        QmaxBP = {}
-        for dam_id in self.instance.get_ids_of_dams():
-            if self.instance.get_flow_limit_obs_for_channel(dam_id) != None:
-                QmaxBP[dam_id] = self.instance.get_flow_limit_obs_for_channel(dam_id)[
-                    "observed_flows"
-                ]
-            else:
-                QmaxBP[dam_id] = None
-        """
-        Parámetro volumen en los breakpoints
-        de la curva Volumen - Caudal máximo (m3): VolBP
-        """
-        VolBP = {}
-        for dam_id in self.instance.get_ids_of_dams():
-            if self.instance.get_flow_limit_obs_for_channel(dam_id) != None:
-                VolBP[dam_id] = self.instance.get_flow_limit_obs_for_channel(dam_id)[
-                    "observed_vols"
-                ]
-            else:
-                VolBP[dam_id] = None
-        """
-        Parámetro volumen inicial (m3): V0
-        """
-        V0 = {
-            dam_id: self.instance.get_initial_vol_of_dam(dam_id)
-            for dam_id in self.instance.get_ids_of_dams()
-        }
-        """
-        Parámetro volumen máximo (m3): VMax
-        """
-        VMax = {
-            dam_id: self.instance.get_max_vol_of_dam(dam_id)
-            for dam_id in self.instance.get_ids_of_dams()
-        }
-        """
-        Parámetro volumen mínimo (m3): VMin
-        """
-        VMin = {
-            dam_id: self.instance.get_min_vol_of_dam(dam_id)
-            for dam_id in self.instance.get_ids_of_dams()
-        }
-
-        #CON TMIN
-        """
-        Parámetro franjas sin cambio en el caudal de salida: TMin
-        """
-        #TMin = self.config.step_min
-
-        #CON K FORMA CARLOS Y ÁLVARO
-        """
-        Parámetro franjas sin cambio en el caudal de salida: K
-        """
-        K = self.config.flow_smoothing
-
-
-        """
-        Parámetro precio en cada franja (€/MWh): Price
-        """
-        Price = self.instance.get_all_prices()
-        """
-        Parámetro lags iniciales en el caudal de entrada
-        a cada embalse (m3/s): IniLags
-        """
-        IniLags = {
-            dam_id: self.instance.get_initial_lags_of_channel(dam_id)
-            for dam_id in self.instance.get_ids_of_dams()
-        }
-        """
-        Parámetro volumen final objetivo (m3): VolFinal
-        """
-        VolFinal = {
-            dam_id: self.config.volume_objectives[dam_id]
-            for dam_id in self.instance.get_ids_of_dams()
-        }
-        """
-        Parámetro caudal entrante al primer embalse (m3/s): Q0
-        """
-        Q0 = self.instance.get_all_incoming_flows()
-        """
-        Parámetro bonus por exceder volumen objetivo (€/m3): BonusVol
-        """
-        BonusVol = self.config.volume_exceedance_bonus
-        """
-        Parámetro penalización por no llegar a volumen objetivo (€/m3): PenVol
-        """
-        PenVol = self.config.volume_shortage_penalty
-        """
-        Parámetro penalización por franja en zona límite
-        (€/nºfranjas): PenZL
-        """
-        PenZL = self.config.limit_zones_penalty
-        """
-        Parámetro penalización por arranque de grupo de potencia
-        (€/nºarranques): PenSU
-        """
-        PenSU = self.config.startups_penalty
-        """
-        Parámetro caudal turbinado de apagado de turbina (m3/s): shutdown_flows
-        """
-        shutdown_flows = {
-            dam_id: self.instance.get_shutdown_flows_of_power_group(dam_id)
-            for dam_id in self.instance.get_ids_of_dams()
-        }
-        """
-        Parámetro caudal turbinado de arranque de turbina (m3/s): startup_flows
-        """
-        startup_flows = {
-            dam_id: self.instance.get_startup_flows_of_power_group(dam_id)
-            for dam_id in self.instance.get_ids_of_dams()
-        }
-
-        # Proceso para eliminar la desviación de decimales de startup_flows y shutdown_flows
-        for i in I:
-            for y in range(len(startup_flows[i])):
-                for w in range(len(QtBP[i])):
-                    if (startup_flows[i][y] - QtBP[i][w]) <= 0.1 and (
-                            startup_flows[i][y] - QtBP[i][w]
-                    ) >= -0.1:
-                        startup_flows[i][y] = QtBP[i][w]
-        for i in I:
-            for y in range(len(shutdown_flows[i])):
-                for w in range(len(QtBP[i])):
-                    if (shutdown_flows[i][y] - QtBP[i][w]) <= 0.1 and (
-                            shutdown_flows[i][y] - QtBP[i][w]
-                    ) >= -0.1:
-                        shutdown_flows[i][y] = QtBP[i][w]
-        """
-        Parámetro zonas límite de cada embalse
-        en la curva Potencia - Caudal turbinado: ZonaLimitePQ
-        """
-        ZonaLimitePQ = {}
-        for dam_id in self.instance.get_ids_of_dams():
-            ZonaLimitePQ[dam_id] = []
-        for i in I:
-            for bp in QtBP[i]:
-                if bp in shutdown_flows[i]:
-                    ZonaLimitePQ[i].append(QtBP[i].index(bp) + 1)
-        # Proceso para eliminar la primera franja
-        # (antes del primer arranque) de este parámetro
-        for i in I:
-            ZonaLimitePQ[i].pop(0)
-        """
-        Parámetro conjunto de franjas para cada powergroup
-        de cada embalse: FranjasGrupos
-        """
-        FranjasGrupos1 = {}
-        FranjasGrupos = {}
-        for i in I:
-            FranjasGrupos1[i] = {}
-            for gp in range(len(startup_flows[i])):
-                FranjasGrupos1[i]["Grupo_potencia" + str(gp + 1)] = []
-                for bp in QtBP[i]:
-                    if gp == (len(startup_flows[i]) - 1):
-                        if bp >= startup_flows[i][gp]:
-                            FranjasGrupos1[i]["Grupo_potencia" + str(gp + 1)].append(
-                                QtBP[i].index(bp) + 1
-                            )
-                            if bp == QtBP[i][-1]:
-                                FranjasGrupos1[i]["Grupo_potencia" + str(gp + 1)].pop(-1)
-                    else:
-                        if bp >= startup_flows[i][gp] and bp < startup_flows[i][gp + 1]:
-                            FranjasGrupos1[i]["Grupo_potencia" + str(gp + 1)].append(
-                                QtBP[i].index(bp) + 1
-                            )
-            FranjasGrupos[i] = {"Grupo_potencia0": [1]}
-            FranjasGrupos[i].update(FranjasGrupos1[i])
-        # Variables
-        """
-        Variable volumen en cada embalse en cada franja de tiempo
-        (m3): vol
-        """
-        vol = lp.LpVariable.dicts(
-            "Volumen ", [(i, t) for i in I for t in T], lowBound=0, cat=lp.LpContinuous
-        )
-        """
-        Variable caudal entrada en cada embalse
-        en cada franja de tiempo (m3/s): qe
-        """
-        qe = lp.LpVariable.dicts(
-            "Caudal entrada ",
-            [(i, t) for i in I for t in T],
-            lowBound=0,
-            cat=lp.LpContinuous,
-        )
-        """
-        Variable caudal salida en cada embalse
-        en cada franja de tiempo (m3/s): qe
-        """
-        qs = lp.LpVariable.dicts(
-            "Caudal salida ",
-            [(i, t) for i in I for t in T],
-            lowBound=0,
-            cat=lp.LpContinuous,
-        )
-        """
-        Variable potencia generada en cada embalse
-        en cada franja de tiempo (MWh): pot
-        """
-        pot = lp.LpVariable.dicts(
-            "Potencia ",
-            [(i, t) for i in I for t in T],
-            lowBound=0,
-            cat=lp.LpContinuous,
-        )
-        """
-        Variable caudal turbinado en cada embalse
-        en cada franja de tiempo (m3/s): qtb
-        """
-        qtb = lp.LpVariable.dicts(
-            "Caudal turbinado ",
-            [(i, t) for i in I for t in T],
-            lowBound=0,
-            cat=lp.LpContinuous,
-        )
-        """
-        Variable variación de caudal en cada embalse
-        en cada franja de tiempo (m3/s): qch
-        """
-        qch = lp.LpVariable.dicts(
-            "Cambio caudal ", [(i, t) for i in I for t in T], cat=lp.LpContinuous
-        )
-
-        #CON K FORMA CARLOS
-        """
-        Variable binaria: x+
-        1 si hay variación positiva de caudal en la franja
-        0 si no hay variación positiva de caudal en la franja
-        """
-        x_pos = {}
-        for i in I:
-            for t in T:
-                key = (i, t)
-                var_name = f"01VariacionPos_({i},{t})"
-                if ("x_pos", key) in self.fixed_values:
-                    val = self.fixed_values[("x_pos", key)]
-                    x_pos[key] = lp.LpVariable(var_name, lowBound=val, upBound=val, cat=lp.LpContinuous)
-                elif t in self.current_binary_t_range:
-                    x_pos[key] = lp.LpVariable(var_name, cat=lp.LpBinary)
-                else:
-                    x_pos[key] = lp.LpVariable(var_name, lowBound=0, upBound=1, cat=lp.LpContinuous)
-
-        """
-        Variable binaria: x-
-        1 si hay variación negativa de caudal en la franja
-        0 si no hay variación negativa de caudal en la franja
-        """
-        x_neg = {}
-        for i in I:
-            for t in T:
-                key = (i, t)
-                var_name = f"01VariacionNeg_({i},{t})"
-                if ("x_neg", key) in self.fixed_values:
-                    val = self.fixed_values[("x_neg", key)]
-                    x_neg[key] = lp.LpVariable(var_name, lowBound=val, upBound=val, cat=lp.LpContinuous)
-                elif t in self.current_binary_t_range:
-                    x_neg[key] = lp.LpVariable(var_name, cat=lp.LpBinary)
-                else:
-                    x_neg[key] = lp.LpVariable(var_name, lowBound=0, upBound=1, cat=lp.LpContinuous)
-
-
-        """
-        Variable asociada al IP with Piecewise Linear Functions
-        de Winston en relación a la curva Potencia - Caudal turbinado
-        """
-        w_pq = {}
-        for i in I:
-            for t in T:
-                for bp in range(0, BreakPointsPQ[i][-1] + 1):
-                    key = (i, t, bp)
-                    var_name = f"01Franja_PQ_({i},{t},{bp})"
-                    if ("w_pq", key) in self.fixed_values:
-                        val = self.fixed_values[("w_pq", key)]
-                        w_pq[key] = lp.LpVariable(var_name, lowBound=val, upBound=val, cat=lp.LpContinuous)
-                    elif t in self.current_binary_t_range:
-                        w_pq[key] = lp.LpVariable(var_name, cat=lp.LpBinary)
-                    else:
-                        w_pq[key] = lp.LpVariable(var_name, lowBound=0, upBound=1, cat=lp.LpContinuous)
-
-        """
-        Variable asociada al IP with Piecewise Linear Functions
-        de Winston en relación a la curva Potencia - Caudal turbinado
-        """
-        z_pq = lp.LpVariable.dicts(
-            "PropFranj_PQ ",
-            [(i, t, bp) for i in I for t in T for bp in BreakPointsPQ[i]],
-            lowBound=0,
-            cat=lp.LpContinuous,
-        )
-        """
-        Variable asociada al IP with Piecewise Linear Functions
-        de Winston en relación a la curva Volumen - Caudal máximo
-        """
-        w_vq = {}
-        for i in I:
-            if QmaxBP[i] != None:
-                for t in T:
-                    for bp in range(0, BreakPointsVQ[i][-1] + 1):
-                        key = (i, t, bp)
-                        var_name = f"01Franja_VQ_({i},{t},{bp})"
-                        if ("w_vq", key) in self.fixed_values:
-                            val = self.fixed_values[("w_vq", key)]
-                            w_vq[key] = lp.LpVariable(var_name, lowBound=val, upBound=val, cat=lp.LpContinuous)
-                        elif t in self.current_binary_t_range:
-                            w_vq[key] = lp.LpVariable(var_name, cat=lp.LpBinary)
-                        else:
-                            w_vq[key] = lp.LpVariable(var_name, lowBound=0, upBound=1, cat=lp.LpContinuous)
-
-        """
-        Variable asociada al IP with Piecewise Linear Functions
-        de Winston en relación a la curva Volumen - Caudal máximo
-        """
-        z_vq = lp.LpVariable.dicts(
-            "PropFranj_VQ ",
-            [(i, t, bp) for i in I if QmaxBP[i] != None for t in T for bp in BreakPointsVQ[i]],
-            lowBound=0,
-            cat=lp.LpContinuous,
-        )
-        """
-        Variable caudal máximo permitido por canal
-        en función del volumen del embalse en cada franja
-        (m3/s): q_max_vol
-        """
-        q_max_vol = lp.LpVariable.dicts(
-            "Caudal máximo volumen ",
-            [(i, t) for i in I if QmaxBP[i] != None for t in T],
-            lowBound=0,
-            cat=lp.LpContinuous,
-        )
-        """
-        Variable desviación positiva respecto a volumen objetivo
-        (m3): pos_desv
-        """
-        pos_desv = lp.LpVariable.dicts(
-            "Desviación positiva del ", [i for i in I], lowBound=0, cat=lp.LpContinuous
-        )
-        """
-        Variable desviación negativa respecto a volumen objetivo
-        (m3): pos_desv
-        """
-        neg_desv = lp.LpVariable.dicts(
-            "Desviación negativa del ",
-            [i for i in I],
-            lowBound=0,
-            cat=lp.LpContinuous,
-        )
-        """
-        Variable beneficio por falta o exceso respecto
-        al volumen objetivo (€): ben_desv
-        """
-        ben_desv = lp.LpVariable.dicts(
-            "Beneficio por desviación volumen del ",
-            [i for i in I],
-            cat=lp.LpContinuous,
-        )
-        """
-        Variable número total de franjas en zonas límite: zl_tot
-        """
-        zl_tot = lp.LpVariable.dicts(
-            "Zonas límites totales del ",
-            [i for i in I],
-            cat=lp.LpInteger,
-        )
-        """
-        Variable binaria: pwch
-        1 si se ha arrancado un powergroup en la franja
-        0 si no se ha arrancado un powergroup en la franja
-        """
-        pwch = {}
-        for i in I:
-            for t in T:
-                for pg in FranjasGrupos[i]:
-                    key = (i, t, pg)
-                    var_name = f"01Arranque PG_({i},{t},{pg})"
-                    if ("pwch", key) in self.fixed_values:
-                        val = self.fixed_values[("pwch", key)]
-                        pwch[key] = lp.LpVariable(var_name, lowBound=val, upBound=val, cat=lp.LpContinuous)
-                    elif t in self.current_binary_t_range:
-                        pwch[key] = lp.LpVariable(var_name, cat=lp.LpBinary)
-                    else:
-                        pwch[key] = lp.LpVariable(var_name, lowBound=0, upBound=1, cat=lp.LpContinuous)
-
-
-        """
-        Variable número total de arranques por embalse
-        """
-        pwch_tot = lp.LpVariable.dicts(
-            "Arranque totales del ",
-            [i for i in I],
-            cat=lp.LpInteger,
-        )
-        """
-        Variable potencia total generada en cada embalse
-        (MWh): pot_embalse
-        """
-        pot_embalse = lp.LpVariable.dicts(
-            "Potencia total del ",
-            [i for i in I],
-            cat=lp.LpContinuous,
-        )
-
-        # Constraints
-        """
-        Restricción balance de volumen
-        """
-        for i in I:
-            for t in T:
-                if t == T[0]:
-                    lpproblem += vol[(i, t)] <= V0[i] + D * (qe[(i, t)] - qs[(i, t)])
-                else:
-                    lpproblem += vol[(i, t)] <= vol[(i, t - 1)] + D * (qe[(i, t)] - qs[(i, t)])
-        """
-        Restricción caudal de entrada
-        """
-        for i in I:
-            for t in T:
-                if i == I[0]:
-                    lpproblem += qe[(i, t)] == Q0[t] + Qnr[i][t]
-                else:
-                    lpproblem += qe[(i, t)] == qtb[(I[I.index(i) - 1], t)] + Qnr[i][t]
-        """
-        Restricción caudal turbinado en base a lags relevantes
-        """
-        for i in I:
-            for t in T:
-                lpproblem += qtb[(i, t)] == lp.lpSum(
-                    IniLags[i][l - 1 - t] for l in L[i] if l - 1 - t >= 0
-                ) * (1 / len(L[i])) + lp.lpSum(qs[(i, t - l)] for l in L[i] if t - l >= 0) * (
-                                     1 / len(L[i])
-                             )
-        """
-        Restricción asociada al IP with Piecewise Linear Functions de Winston
-        en referencia a la curva Potencia - Caudal turbinado
-        """
-        for i in I:
-            for t in T:
-                lpproblem += pot[(i, t)] == lp.lpSum(
-                    z_pq[(i, t, bp)] * PotBP[i][bp - 1] for bp in BreakPointsPQ[i]
-                )
-        """
-        Restricción asociada al IP with Piecewise Linear Functions de Winston
-        en referencia a la curva Potencia - Caudal turbinado
-        """
-        for i in I:
-            for t in T:
-                lpproblem += qtb[(i, t)] == lp.lpSum(
-                    z_pq[(i, t, bp)] * QtBP[i][bp - 1] for bp in BreakPointsPQ[i]
-                )
-        """
-        Restricción asociada al IP with Piecewise Linear Functions de Winston
-        en referencia a la curva Potencia - Caudal turbinado
-        """
-        for i in I:
-            for t in T:
-                lpproblem += w_pq[(i, t, 0)] == 0
-                lpproblem += w_pq[(i, t, BreakPointsPQ[i][-1])] == 0
-        """
-        Restricción asociada al IP with Piecewise Linear Functions de Winston
-        en referencia a la curva Potencia - Caudal turbinado
-        """
-        for i in I:
-            for t in T:
-                for bp in BreakPointsPQ[i]:
-                    lpproblem += z_pq[(i, t, bp)] <= w_pq[(i, t, bp - 1)] + w_pq[(i, t, bp)]
-        """
-        Restricción asociada al IP with Piecewise Linear Functions de Winston
-        en referencia a la curva Potencia - Caudal turbinado
-        """
-        for i in I:
-            for t in T:
-                lpproblem += lp.lpSum(z_pq[(i, t, bp)] for bp in BreakPointsPQ[i]) == 1
-        """
-        Restricción asociada al IP with Piecewise Linear Functions de Winston
-        en referencia a la curva Potencia - Caudal turbinado
-        """
-        for i in I:
-            for t in T:
-                lpproblem += lp.lpSum(w_pq[(i, t, bp)] for bp in BreakPointsPQ[i]) == 1
-        """
-        Restricción asociada al IP with Piecewise Linear Functions de Winston
-        en referencia a la curva Volumen - Caudal máximo
-        """
-        for i in I:
-            for t in T:
-                if QmaxBP[i] != None:
-                    lpproblem += q_max_vol[(i, t)] == lp.lpSum(
-                        z_vq[(i, t, bp)] * QmaxBP[i][bp - 1] for bp in BreakPointsVQ[i]
-                    )
-        """
-        Restricción asociada al IP with Piecewise Linear Functions de Winston
-        en referencia a la curva Volumen - Caudal máximo
-        """
-        for i in I:
-            for t in T:
-                if QmaxBP[i] != None:
-                    if t == T[0]:
-                        lpproblem += V0[i] == lp.lpSum(
-                            z_vq[(i, t, bp)] * VolBP[i][bp - 1] for bp in BreakPointsVQ[i]
-                        )
-                    else:
-                        lpproblem += vol[(i, t - 1)] == lp.lpSum(
-                            z_vq[(i, t, bp)] * VolBP[i][bp - 1] for bp in BreakPointsVQ[i]
-                        )
-        """
-        Restricción asociada al IP with Piecewise Linear Functions de Winston
-        en referencia a la curva Volumen - Caudal máximo
-        """
-        for i in I:
-            for t in T:
-                if QmaxBP[i] != None:
-                    lpproblem += w_vq[(i, t, 0)] == 0
-                    lpproblem += w_vq[(i, t, BreakPointsVQ[i][-1])] == 0
-        """
-        Restricción asociada al IP with Piecewise Linear Functions de Winston
-        en referencia a la curva Volumen - Caudal máximo
-        """
-        for i in I:
-            for t in T:
-                if QmaxBP[i] != None:
-                    for bp in BreakPointsVQ[i]:
-                        lpproblem += z_vq[(i, t, bp)] <= lp.lpSum(
-                            w_vq[(i, t, tr)] for tr in range(bp - 1, bp + 1)
-                        )
-        """
-        Restricción asociada al IP with Piecewise Linear Functions de Winston
-        en referencia a la curva Volumen - Caudal máximo
-        """
-        for i in I:
-            for t in T:
-                if QmaxBP[i] != None:
-                    lpproblem += lp.lpSum(z_vq[(i, t, bp)] for bp in BreakPointsVQ[i]) == 1
-        """
-        Restricción asociada al IP with Piecewise Linear Functions de Winston
-        en referencia a la curva Volumen - Caudal máximo
-        """
-        for i in I:
-            for t in T:
-                if QmaxBP[i] != None:
-                    lpproblem += lp.lpSum(w_vq[(i, t, bp)] for bp in BreakPointsVQ[i]) == 1
-        """
-        Restricción cálculo variación caudal en cada franja
-        """
-        for i in I:
-            for t in T:
-                if t == T[0]:
-                    lpproblem += qch[(i, t)] == qs[(i, t)] - IniLags[i][0]
-                else:
-                    lpproblem += qch[(i, t)] == qs[(i, t)] - qs[(i, t - 1)]
-
-        #CON K FORMA CARLOS
-        """
-        Restricción para contabilizar variación positiva de caudal en cada franja
-        """
-        for i in I:
-            for t in T:
-                lpproblem += qch[(i, t)] <= x_pos[(i, t)] * QMax[i]
-        """
-        Restricción para contabilizar variación negativa de caudal en cada franja
-        """
-        for i in I:
-            for t in T:
-                lpproblem += -qch[(i, t)] <= x_neg[(i, t)] * QMax[i]
-        """
-        Restricción para que solo se cuenta la variación correcta
-        """
-        for i in I:
-            for t in T:
-                lpproblem += x_pos[(i, t)] + x_neg[(i, t)] <= 1
-
-        """
-        Restricción golpe de ariete
-        """
-        for i in I:
-            for t in T:
-                for k in range(1, K+1):
-                    if t - k >= 0:
-                        lpproblem += x_pos[(i, t)] + x_neg[(i, t - k)] <= 1
-                        lpproblem += x_neg[(i, t)] + x_pos[(i, t - k)] <= 1
 
-        """
-        Restricción volumen máximo
-        """
-        for i in I:
-            for t in T:
-                lpproblem += vol[(i, t)] <= VMax[i]
-        """
-        Restricción volumen mínimo
-        """
-        for i in I:
-            for t in T:
-                lpproblem += vol[(i, t)] >= VMin[i]
-        """
-        Restricción caudal máximo por canal
-        (restricción por sección)
-        """
-        for i in I:
-            for t in T:
-                lpproblem += qs[(i, t)] <= QMax[i]
-        """
-        Restricción caudal máximo por canal
-        (restricción por volumen)
-        """
-        for i in I:
-            for t in T:
-                if QmaxBP[i] != None:
-                    lpproblem += qs[(i, t)] <= q_max_vol[(i, t)]
-        """
-        Restricción ganancia (€) total de cada embalse
-        """
-        for i in I:
-            lpproblem += pot_embalse[i] == lp.lpSum(
-                pot[(i, t)] * Price[t] * (D / 3600) for t in T
-            )
-        """
-        Restricción cómputo desviación respecto a volumen objetivo
-        """
-        for i in I:
-            for t in T:
-                if t == T[D_1 - 1]:
-                    lpproblem += vol[(i, t)] == VolFinal[i] + pos_desv[i] - neg_desv[i]
-        """
-        Restricción cálculo beneficio por exceso/falta de volumen
-        respecto al objetivo
-        """
-        for i in I:
-            lpproblem += ben_desv[i] == pos_desv[i] * BonusVol - neg_desv[i] * PenVol
-        """
-        Restricción número total de franjas en zona límite para cada embalse
-        """
-        for i in I:
-            lpproblem += zl_tot[i] == lp.lpSum(
-                w_pq[(i, t, bp)] for t in T for bp in ZonaLimitePQ[i]
+# El modelo (variables, restricciones y función objetivo) es el mismo que el del MILP,
+# por lo que se reutiliza el de la carpeta MILP
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "MILP"))
+from lp_ana import LPConfiguration, LPSolution, LPModel
+from model_parameters import ModelParameters, _frozen
+from solvers import PersistentHighsModel, choose_backend, solve_problem
+
+# Familias de variables binarias que Relax&Fix relaja, declara binarias o fija en cada bloque
+BINARY_VARIABLES = ["x_pos", "x_neg", "w_pq", "y_pq", "g_pq", "w_vq", "pwch"]
+
+# Tolerancia para considerar que hay variación de caudal al construir el MIP start (m3/s)
+TOLERANCE = 1e-6
+
+# Tamaño adaptativo de la ventana (ver LPModel_RF.solve_relax_and_fix): la ventana crece si el bloque se resuelve
+# hasta el gap pedido en menos de esta fracción del time limit, y se reduce si agota el time limit (por encima de
+# la segunda fracción) o termina con un gap mayor que el indicado
+ADAPTIVE_GROW_TIME_FRACTION = 0.25
+ADAPTIVE_SHRINK_TIME_FRACTION = 0.95
+ADAPTIVE_SHRINK_GAP = 0.05
+
+# Reparto de un plazo global entre los bloques de Relax&Fix (ver LPModel_RF.block_budget): fracción del plazo que se
+# reserva como margen, time limit mínimo de un bloque (s), factor máximo sobre el reparto equitativo del time limit
+# de un bloque, y MIPGap máximo al que se relaja el gap cuando el tiempo por bloque cae por debajo del reparto inicial
+DEADLINE_SAFETY_FRACTION = 0.05
+DEADLINE_MIN_BLOCK_SECONDS = 1.0
+DEADLINE_HARD_BLOCK_FACTOR = 2.0
+DEADLINE_MAX_GAP = 0.05
+
+
+def choose_segment(z: dict, breakpoints: np.ndarray, i: str, t: int) -> int:
+    """
+    :return: Segment of the curve of dam i at time step t that contains the relaxed abscissa
+    sum(z * breakpoints), breaking ties (or if none contains it) with the largest weight z
+    of its two extreme breakpoints
+    """
+    num_bp = len(breakpoints)
+    x = sum((z[(i, t, bp)].value() or 0) * breakpoints[bp - 1] for bp in range(1, num_bp + 1))
+    return max(
+        range(1, num_bp),
+        key=lambda bp: (
+            breakpoints[bp - 1] - TOLERANCE <= x <= breakpoints[bp] + TOLERANCE,
+            (z[(i, t, bp)].value() or 0) + (z[(i, t, bp + 1)].value() or 0),
+        ),
+    )
+
+
+def round_segment(w: dict, z: dict, breakpoints: np.ndarray, i: str, t: int) -> int:
+    """
+    Rounds the Winston binaries w of dam i at time step t to the segment given by choose_segment.
+
+    :return: Chosen segment
+    """
+    franja = choose_segment(z, breakpoints, i, t)
+    for bp in range(0, len(breakpoints) + 1):
+        w[(i, t, bp)].setInitialValue(1 if bp == franja else 0)
+    return franja
+
+
+def remaining_iterations(inicio: int, num_ts: int, window_size: int, step_size: int) -> int:
+    """
+    :return: Number of Relax&Fix iterations left from time step inicio, the last window being fixed entirely
+    """
+    return 1 + max(0, math.ceil((num_ts - inicio - window_size) / step_size))
+
+
+def power_group_of(franja: int, franjas_grupos: dict) -> str | None:
+    """
+    :return: Power group that contains the given segment of the curve Potencia - Caudal turbinado
+    (None if the segment does not belong to any group)
+    """
+    for pg, franjas in franjas_grupos.items():
+        if franja in franjas:
+            return pg
+    return None
+
+
+class LPModel_RF(LPModel):
+    def __init__(
+        self,
+        instance,
+        config: LPConfiguration,
+        solution: LPSolution = None,
+        fixed_values: dict = None,
+        current_binary_t_range: list = None,
+        warm_start: bool = True,
+        lookahead: int = None,
+        current_fix_t_range: list = None,
+    ):
+        super().__init__(instance=instance, config=config, solution=solution)
+        self.fixed_values = fixed_values if fixed_values is not None else {}
+        self.current_binary_t_range = current_binary_t_range
+        # Franjas cuyas binarias se fijan tras resolver la iteración: las primeras de current_binary_t_range
+        # (None: todas), de modo que las demás se vuelven a decidir en la siguiente con más horizonte
+        self.current_fix_t_range = current_fix_t_range
+        # Si es True, cada bloque parte de la solución del bloque anterior (MIP start)
+        self.warm_start = warm_start
+        self.final_solution_values = {}
+        # Modelo de PuLP construido una única vez y reutilizado en todas las iteraciones de RF
+        self.lpproblem = None
+        # Modelo de HiGHS del lpproblem, cargado en la primera iteración y reutilizado en las siguientes (solo con
+        # el backend "highs", sin conjuntos SOS ni restricciones perezosas)
+        self.highs_model = None
+        # Si no es None, cada bloque se resuelve en una ventana con sus franjas y las lookahead siguientes
+        # (relajadas salvo las K primeras) en lugar de en todo el horizonte (ver solve_window)
+        self.lookahead = lookahead
+        # Valor del agua de cada embalse al final de cada franja (€/m3), estimado en la primera ventana
+        self.water_values = None
+        # Valores de todas las variables de las franjas de los bloques ya resueltos con ventanas
+        self.window_values = {}
+        # Si el MILP del último bloque tiene solución, su gap final (None si el backend no lo da) y tiempo del solver
+        self.block_solved = False
+        self.block_gap = None
+        self.block_solve_time = 0.0
+        # Registro por bloque de solve_relax_and_fix: franjas, tiempo, gap y decisión sobre la ventana siguiente
+        self.block_log = []
+
+    @property
+    def fix_t_range(self) -> list:
+        """
+        :return: Time steps whose binaries are fixed after the current iteration (see current_fix_t_range)
+        """
+        if self.current_fix_t_range is None:
+            return self.current_binary_t_range
+        return self.current_fix_t_range
+
+    @property
+    def binary_variables(self) -> list[str]:
+        """
+        :return: Families of BINARY_VARIABLES that are binary in the formulation of the model
+        (in the "log" formulation w_pq is continuous and the binaries are the bits g_pq)
+        """
+        if self.config.pwl_formulation == "log":
+            return [varname for varname in BINARY_VARIABLES if varname != "w_pq"]
+        return BINARY_VARIABLES
+
+    def update_binary_domains(self):
+        """
+        Updates the domain of the binary variables for the current iteration of Relax&Fix:
+        variables in fixed_values are fixed to their value, those in current_binary_t_range are binary
+        and the rest are relaxed to [0, 1]. Variables fixed by the presolve are left fixed to 0.
+        """
+        current_binary_t_range = set(self.current_binary_t_range)
+        # Los conjuntos SOS2 solo se imponen hasta el bloque actual: en las franjas relajadas
+        # el punto de la curva puede repartirse entre breakpoints no consecutivos, como con Winston
+        ultima_franja = max(current_binary_t_range)
+        self.lpproblem.sos2 = {
+            f"SOS2_{curva}_{i}_{t}": conjunto
+            for (curva, i, t), conjunto in self.sos2_sets.items()
+            if t <= ultima_franja
+        }
+        for varname in self.binary_variables:
+            for key, var in self.variables[varname].items():
+                t = key[1]
+                if (varname, key) in self.presolve_fixed:
+                    # Inalcanzable según el presolve: sigue fijada a 0
+                    continue
+                if (varname, key) in self.fixed_values:
+                    val = self.fixed_values[(varname, key)]
+                    var.cat = lp.LpContinuous
+                    var.lowBound = val
+                    var.upBound = val
+                elif t in current_binary_t_range:
+                    var.cat = lp.LpInteger
+                    var.lowBound = 0
+                    var.upBound = 1
+                else:
+                    var.cat = lp.LpContinuous
+                    var.lowBound = 0
+                    var.upBound = 1
+
+    def set_warm_start(self):
+        """
+        Sets the solution of the previous iteration as the initial solution (MIP start) of the current one.
+        The binaries of current_binary_t_range, relaxed in the previous iteration, are rounded and repaired
+        so that the start satisfies the constraints among binaries: one segment (or SOS2 region) per curve,
+        a single sense of flow change that respects the water hammer constraint
+        and power group startups consistent with the chosen segments.
+        Only binaries are passed to the solver (partial MIP start): the relaxed values of the continuous
+        variables are not consistent with the rounded binaries, so the solver completes them.
+        """
+        p = self.parameters
+        K = p.K
+        x_pos = self.variables["x_pos"]
+        x_neg = self.variables["x_neg"]
+        w_pq = self.variables["w_pq"]
+        y_pq = self.variables["y_pq"]
+        pwch = self.variables["pwch"]
+        current_binary_t_range = sorted(self.current_binary_t_range)
+
+        def segmento_fijado(i, t):
+            # Segmento de la curva Potencia - Caudal turbinado ya fijado en una iteración anterior
+            if w_pq:
+                return next(bp for bp in p.BreakPointsPQ[i] if w_pq[(i, t, bp)].value() > 0.5)
+            return next(
+                region[0] for r, region in enumerate(self.pq_regions[i]) if y_pq[(i, t, r)].value() > 0.5
             )
 
-        # Función que, dado el conjunto FranjasGrupos y un powergroup específico, te devuelve
-        # las franjas de la curva Potencia - Caudal turbinado que están en powergroups
-        # superiores al dado.
-        def obtener_franjas_pw_mayores(diccionario, clave):
-            pw_posteriores = list(diccionario.keys())[
-                             list(diccionario.keys()).index(clave) + 1:
-                             ]
-
-            franjas_posteriores = []
-            for pw_posterior in pw_posteriores:
-                franjas_posteriores += diccionario[pw_posterior]
-            return franjas_posteriores
+        for i in p.I:
+            lista_keys = list(p.FranjasGrupos[i].keys())
+            segmentos = {}
+            for t in current_binary_t_range:
+                # Segmentos: se elige el que contiene el punto de la solución relajada
+                if w_pq:
+                    segmentos[t] = round_segment(w_pq, self.variables["z_pq"], p.QtBP[i], i, t)
+                    if self.variables["g_pq"]:
+                        # Formulación logarítmica: bits del código Gray del segmento elegido
+                        for b, bit in enumerate(p.CodigosPQ[i][segmentos[t] - 1]):
+                            self.variables["g_pq"][(i, t, b)].setInitialValue(bit)
+                else:
+                    # Formulación SOS2 o piezas cóncavas: región que contiene el segmento elegido
+                    segmentos[t] = choose_segment(self.variables["z_pq"], p.QtBP[i], i, t)
+                    for r, region in enumerate(self.pq_regions[i]):
+                        y_pq[(i, t, r)].setInitialValue(int(segmentos[t] in region))
+                if (i, t, 0) in self.variables["w_vq"]:
+                    round_segment(self.variables["w_vq"], self.variables["z_vq"], p.VolBP[i], i, t)
+
+                # Variación de caudal: signo de qch, descartando el cambio de sentido dentro de K franjas
+                qch = self.variables["qch"][(i, t)].value()
+                pos = qch > TOLERANCE and all(
+                    x_neg[(i, t - k)].value() < 0.5 for k in range(1, K + 1) if t - k >= 0
+                )
+                neg = qch < -TOLERANCE and all(
+                    x_pos[(i, t - k)].value() < 0.5 for k in range(1, K + 1) if t - k >= 0
+                )
+                x_pos[(i, t)].setInitialValue(int(pos))
+                x_neg[(i, t)].setInitialValue(int(neg))
+
+                # Arranques: el grupo de potencia pasa del grupo pg en t-1 a uno superior en t
+                for pg in lista_keys:
+                    pwch[(i, t, pg)].setInitialValue(0)
+                if t != 0:
+                    segmento_anterior = segmentos[t - 1] if t - 1 in segmentos else segmento_fijado(i, t - 1)
+                    grupo_anterior = power_group_of(segmento_anterior, p.FranjasGrupos[i])
+                    grupo_actual = power_group_of(segmentos[t], p.FranjasGrupos[i])
+                    if grupo_anterior is not None and grupo_actual is not None:
+                        k_anterior = lista_keys.index(grupo_anterior)
+                        k_actual = lista_keys.index(grupo_actual)
+                        if k_actual > k_anterior:
+                            # Con la formulación "cumulative" arrancan todos los grupos intermedios
+                            if self.config.startup_formulation != "cumulative":
+                                k_actual = k_anterior + 1
+                            for k in range(k_anterior + 1, k_actual + 1):
+                                pwch[(i, t, lista_keys[k])].setInitialValue(1)
+
+        # Se descartan los valores que no forman parte del MIP start
+        for varname, variables in self.variables.items():
+            for key, var in variables.items():
+                if varname not in self.binary_variables or (
+                    key[1] not in current_binary_t_range and (varname, key) not in self.fixed_values
+                ):
+                    var.varValue = None
 
+    def solve(self, options: dict = None) -> dict:
         """
-        Restricción cómputo arranques de powergroups
-        """
-        # TODO: implementar que compute dos veces cuando hay dos arranques simultáneos de una franja a la siguiente
-        for i in I:
-            for t in T:
-                if t != T[0]:
-                    for pg in FranjasGrupos[i]:
-                        if pg != list(FranjasGrupos[i].keys())[-1]:
-                            lista_keys = list(FranjasGrupos[i].keys())
-                            franjassuperiores = obtener_franjas_pw_mayores(FranjasGrupos[i], pg)
-                            lpproblem += (
-                                    lp.lpSum(
-                                        w_pq[(i, t - 1, franja)] for franja in FranjasGrupos[i][pg]
-                                    )
-                                    + lp.lpSum(
-                                        w_pq[(i, t, franja_sup)] for franja_sup in franjassuperiores
-                                    )
-                                    - 1
-                                    <= pwch[(i, t, lista_keys[lista_keys.index(pg) + 1])]
-                            )
-                            lpproblem += (
-                                    lp.lpSum(
-                                        w_pq[(i, t - 1, franja)] for franja in FranjasGrupos[i][pg]
-                                    )
-                                    + lp.lpSum(
-                                        w_pq[(i, t, franja_sup)] for franja_sup in franjassuperiores
-                                    )
-                                    >= 2 * pwch[(i, t, lista_keys[lista_keys.index(pg) + 1])]
-                            )
-                        if t == 0:
-                            lpproblem += pwch[(i, t, pg)] == 0
-        """
-        Restricción cálculo número de arranques totales en cada embalse
+        Solves the current Relax&Fix iteration. The PuLP model is built in the first iteration and kept between
+        iterations, in which only the bounds and the integrality of the binaries change (see update_binary_domains).
+        With the HiGHS backend the model is also kept in the solver (see PersistentHighsModel): the following
+        iterations only change those columns. With SOS constraints, lazy rows or the CMD backends (CBC, Gurobi),
+        each iteration passes the whole problem to the solver again (LP/MPS file).
         """
-        for i in I:
-            lpproblem += pwch_tot[i] == lp.lpSum(
-                pwch[(i, t, pg)] for t in T for pg in FranjasGrupos[i]
-            )
-
-    
-        # Objective Function
-        lpproblem += lp.lpSum(
-            pot_embalse[i] + ben_desv[i] - zl_tot[i] * PenZL - pwch_tot[i] * PenSU for i in I
-        )
-
-        # Solve
-        # solver = lp.GUROBI(path=None, keepFiles=0, MIPGap=self.config.MIPGap)
-        solver = lp.GUROBI_CMD(gapRel=self.config.MIPGap, timeLimit=self.config.time_limit_seconds)
-        # solver = lp.PULP_CBC_CMD(gapRel=self.config.MIPGap)  # <-- caca
-        lpproblem.solve(solver)
-
-        #Se guardan los valores de las variables fijadas con RF
 
-        for key in x_pos:
-            i, t = key
-            if t in self.current_binary_t_range:
-                self.fixed_values[("x_pos", key)] = round(x_pos[key].value())
+        if self.lookahead is not None:
+            return self.solve_window()
 
-        for key in x_neg:
-            i, t = key
-            if t in self.current_binary_t_range:
-                self.fixed_values[("x_neg", key)] = round(x_neg[key].value())
+        # LP Problem
+        # Solo se construye en la primera iteración; en las siguientes cambian únicamente los dominios
+        if self.lpproblem is None:
+            self.lpproblem = self.build_model()
+            self.lpproblem.name = "Problema_General_24h_resuelto_con_RF"
+        lpproblem = self.lpproblem
+        self.update_binary_domains()
+        # En la primera iteración todavía no hay solución previa
+        warm_start = self.warm_start and self.variables["qch"][(self.instance.get_ids_of_dams()[0], 0)].value() is not None
+        if warm_start:
+            self.set_warm_start()
 
-        for key in w_pq:
-            i, t, bp = key
-            if t in self.current_binary_t_range:
-                self.fixed_values[("w_pq", key)] = round(w_pq[key].value())
+        # Solve
+        if self.config.lazy_constraints:
+            self.solve_with_lazy_rows(lpproblem, warm_start=warm_start)
+        else:
+            self.solve_kept_problem(lpproblem, warm_start=warm_start)
+        self.block_gap = getattr(lpproblem, "mip_gap", None)
+        self.block_solve_time = lpproblem.solutionTime
+        self.check_block_feasibility(lpproblem)
+        # Sin solución (p.ej. por el time limit) no se fija nada, de modo que el bloque se puede repetir
+        self.block_solved = lpproblem.sol_status in (lp.LpSolutionOptimal, lp.LpSolutionIntegerFeasible)
+        if not self.block_solved:
+            return dict()
 
-        for key in w_vq:
-            i, t, bp = key
-            if t in self.current_binary_t_range:
-                self.fixed_values[("w_vq", key)] = round(w_vq[key].value())
+        self.store_solution(lpproblem)
 
-        for key in pwch:
-            i, t, pg = key
-            if t in self.current_binary_t_range:
-                self.fixed_values[("pwch", key)] = round(pwch[key].value())
+        #Se guardan los valores de las variables fijadas con RF
+        fix_t_range = set(self.fix_t_range)
+        for varname in self.binary_variables:
+            for key, var in self.variables[varname].items():
+                if key[1] in fix_t_range:
+                    self.fixed_values[(varname, key)] = round(var.value())
 
         # Si es la última iteración de RF, se guarda el valor de todas las variables para validar la solución
-        if self.current_binary_t_range[-1] == self.instance.get_largest_impact_horizon() - 1:
+        if self.fix_t_range[-1] == self.instance.get_largest_impact_horizon() - 1:
             print("Guardando solución final completa desde solve()...")
             self.final_solution_values = {}
 
-            for key in vol:
-                self.final_solution_values[("vol", key)] = vol[key].value()
-
-            for key in qe:
-                self.final_solution_values[("qe", key)] = qe[key].value()
-
-            for key in qs:
-                self.final_solution_values[("qs", key)] = qs[key].value()
-
-            for key in pot:
-                self.final_solution_values[("pot", key)] = pot[key].value()
-
-            for key in qtb:
-                self.final_solution_values[("qtb", key)] = qtb[key].value()
-
-            for key in qch:
-                self.final_solution_values[("qch", key)] = qch[key].value()
-
-            for key in x_pos:
-                self.final_solution_values[("x_pos", key)] = x_pos[key].value()
-
-            for key in x_neg:
-                self.final_solution_values[("x_neg", key)] = x_neg[key].value()
-
-            for key in w_pq:
-                self.final_solution_values[("w_pq", key)] = w_pq[key].value()
-
-            for key in z_pq:
-                self.final_solution_values[("z_pq", key)] = z_pq[key].value()
-
-            for key in w_vq:
-                self.final_solution_values[("w_vq", key)] = w_vq[key].value()
-
-            for key in z_vq:
-                self.final_solution_values[("z_vq", key)] = z_vq[key].value()
-
-            for key in q_max_vol:
-                self.final_solution_values[("q_max_vol", key)] = q_max_vol[key].value()
-
-            for key in pos_desv:
-                self.final_solution_values[("pos_desv", key)] = pos_desv[key].value()
-
-            for key in neg_desv:
-                self.final_solution_values[("neg_desv", key)] = neg_desv[key].value()
-
-            for key in ben_desv:
-                self.final_solution_values[("ben_desv", key)] = ben_desv[key].value()
-
-            for key in zl_tot:
-                self.final_solution_values[("zl_tot", key)] = zl_tot[key].value()
-
-            for key in pwch:
-                self.final_solution_values[("pwch", key)] = pwch[key].value()
-
-            for key in pwch_tot:
-                self.final_solution_values[("pwch_tot", key)] = pwch_tot[key].value()
-
-            for key in pot_embalse:
-                self.final_solution_values[("pot_embalse", key)] = pot_embalse[key].value()
+            for varname, variables in self.variables.items():
+                for key, var in variables.items():
+                    self.final_solution_values[(varname, key)] = var.value()
 
             print("Solución final guardada en self.final_solution_values.")
 
-
-        # Caracterización de la solución
-        print("--------Función objetivo--------")
-        print("Estado de la solución: ", lp.LpStatus[lpproblem.status])
-        print("Valor de la función objetivo (€): ", lp.value(lpproblem.objective))
-        print("--------Potencia generada en cada embalse--------")
-        for var in pot_embalse.values():
-            print(f"{var.name} (€): {var.value()}")
-        print("--------Desviación en volumen--------")
-        for var in pos_desv.values():
-            print(f"{var.name} (m3): {var.value()}")
-        for var in neg_desv.values():
-            print(f"{var.name} (m3): {var.value()}")
-        for var in ben_desv.values():
-            print(f"{var.name} (€): {var.value()}")
-        print("--------Zonas límite--------")
-        for var in zl_tot.values():
-            print(f"{var.name}: {var.value()}")
-        print("--------Arranques grupos de potencia--------")
-        for var in pwch_tot.values():
-            print(f"{var.name}: {var.value()}")
-        for var in pwch.values():
-            if var.value() != 0:
-                print(f"{var.name}: {var.value()}")
-        for var in w_pq.values():
-            if var.value() != 0:
-                print(f"{var.name}: {var.value()}")
-        for var in qtb.values():
-            if var.value() != 0:
-                print(f"{var.name}: {var.value()}")
-        # solution.json
-        qsalida = {dam_id: [] for dam_id in I}
-        for var in qs.values():
-            for dam_id in I:
-                if dam_id in var.name:
-                    qsalida[dam_id].append(var.value())
-        potencia = {dam_id: [] for dam_id in I}
-        for var in pot.values():
-            for dam_id in I:
-                if dam_id in var.name:
-                    potencia[dam_id].append(var.value())
-        volumenes = {dam_id: [] for dam_id in I}
-        for var in vol.values():
-            for dam_id in I:
-                if dam_id in var.name:
-                    volumenes[dam_id].append(var.value())
-        sol_dict = {
-            "dams": [
-                {
-                    "flows": qsalida[dam_id],
-                    "id": dam_id,
-                    "power": potencia[dam_id],
-                    "volume": volumenes[dam_id],
-                }
-                for dam_id in I
-            ],
-            "price": Price,
-        }
-        self.solution = LPSolution.from_dict(sol_dict)
-
         return dict()
-    
-    def validate_solution(self, options: dict = None) -> dict:
-        
-        # LP Problem
-        lpproblem = lp.LpProblem("Validacion_RF_con_variables_fijas", lp.LpMaximize)
 
-        # Sets
-        """
-        Conjunto embalses: I
-        """
-        I = self.instance.get_ids_of_dams()
-        """
-        Conjunto franjas de tiempo: T
-        """
-        T = list(range(self.instance.get_largest_impact_horizon()))
-        """
-        Conjunto lags relevantes: L
-        """
-        L = {
-            dam_id: self.instance.get_verification_lags_of_dam(dam_id)
-            for dam_id in self.instance.get_ids_of_dams()
-        }
-        """
-        Conjunto breakpoints en curva Potencia - Caudal turbinado: BreakPointsPQ
-        """
-        BreakPointsPQ = {
-            dam_id: list(
-                range(
-                    len(
-                        self.instance.get_turbined_flow_obs_for_power_group(dam_id)[
-                            "observed_flows"
-                        ]
-                    )
-                )
-            )
-            for dam_id in self.instance.get_ids_of_dams()
-        }
-        # Ajustamos este conjunto para corregir indexación
-        for key in BreakPointsPQ:
-            for i in range(len(BreakPointsPQ[key])):
-                BreakPointsPQ[key][i] += 1
-        """
-        Conjunto breakpoints en curva Volumen - Caudal máximo: BreakPointsVQ
-        """
-        BreakPointsVQ = {}
-        for dam_id in self.instance.get_ids_of_dams():
-            if self.instance.get_flow_limit_obs_for_channel(dam_id) != None:
-                BreakPointsVQ[dam_id] = list(
-                    range(
-                        len(
-                            self.instance.get_flow_limit_obs_for_channel(dam_id)[
-                                "observed_vols"
-                            ]
-                        )
-                    )
-                )
-            else:
-                BreakPointsVQ[dam_id] = None
-        # Ajustamos este conjunto para corregir indexación
-        for key in BreakPointsVQ:
-            if BreakPointsVQ[key] != None:
-                for i in range(len(BreakPointsVQ[key])):
-                    BreakPointsVQ[key][i] += 1
-        # Parameters
-        """
-        Parámetro duración de cada franja (s): D
-        """
-        D = self.instance.get_time_step_seconds()
-        """
-        Parámetro franja donde se compara con volumen objetivo: D_1
-        """
-        D_1 = self.instance.get_decision_horizon()
-        """
-        Parámetro caudal no regulado (m3/s): Qnr
-        """
-        Qnr = {
-            dam_id: self.instance.get_all_unregulated_flows_of_dam(dam_id)
-            for dam_id in self.instance.get_ids_of_dams()
-        }
-        """
-        Parámetro caudal máximo permitido por canal (m3/s): QMax
-        """
-        QMax = {
-            dam_id: self.instance.get_max_flow_of_channel(dam_id)
-            for dam_id in self.instance.get_ids_of_dams()
-        }
-        """
-        Parámetro caudal turbinado en los breakpoints
-        de la curva Potencia - Caudal turbinado (m3/s): QtBP
-        """
-        QtBP = {
-            dam_id: self.instance.get_turbined_flow_obs_for_power_group(dam_id)[
-                "observed_flows"
-            ]
-            for dam_id in self.instance.get_ids_of_dams()
-        }
-        """
-        Parámetro potencia en los breakpoints
-        de la curva Potencia - Caudal turbinado (MWh): PotBP
-        """
-        PotBP = {
-            dam_id: self.instance.get_turbined_flow_obs_for_power_group(dam_id)[
-                "observed_powers"
-            ]
-            for dam_id in self.instance.get_ids_of_dams()
-        }
-        """
-        Parámetro caudal máximo en los breakpoints
-        de la curva Volumen - Caudal máximo (m3/s): QmaxBP
-        """
-        QmaxBP = {}
-        for dam_id in self.instance.get_ids_of_dams():
-            if self.instance.get_flow_limit_obs_for_channel(dam_id) != None:
-                QmaxBP[dam_id] = self.instance.get_flow_limit_obs_for_channel(dam_id)[
-                    "observed_flows"
-                ]
-            else:
-                QmaxBP[dam_id] = None
-        """
-        Parámetro volumen en los breakpoints
-        de la curva Volumen - Caudal máximo (m3): VolBP
-        """
-        VolBP = {}
-        for dam_id in self.instance.get_ids_of_dams():
-            if self.instance.get_flow_limit_obs_for_channel(dam_id) != None:
-                VolBP[dam_id] = self.instance.get_flow_limit_obs_for_channel(dam_id)[
-                    "observed_vols"
-                ]
-            else:
-                VolBP[dam_id] = None
-        """
-        Parámetro volumen inicial (m3): V0
-        """
-        V0 = {
-            dam_id: self.instance.get_initial_vol_of_dam(dam_id)
-            for dam_id in self.instance.get_ids_of_dams()
-        }
-        """
-        Parámetro volumen máximo (m3): VMax
+    def solve_kept_problem(self, lpproblem: lp.LpProblem, warm_start: bool = False, changed_variables: list = None):
         """
-        VMax = {
-            dam_id: self.instance.get_max_vol_of_dam(dam_id)
-            for dam_id in self.instance.get_ids_of_dams()
-        }
-        """
-        Parámetro volumen mínimo (m3): VMin
-        """
-        VMin = {
-            dam_id: self.instance.get_min_vol_of_dam(dam_id)
-            for dam_id in self.instance.get_ids_of_dams()
-        }
+        Solves the model kept between iterations, in which only the domains of the binaries change: with the HiGHS
+        backend and no SOS constraints, in the persistent HiGHS model (see PersistentHighsModel); otherwise the whole
+        problem is passed to the solver.
 
-        #CON K FORMA CARLOS Y ÁLVARO
+        :param changed_variables: Variables whose domain may have changed (None: the binaries)
         """
-        Parámetro franjas sin cambio en el caudal de salida: K
-        """
-        K = self.config.flow_smoothing
-
+        if choose_backend(self.config, sos=bool(lpproblem.sos2)) != "highs":
+            solve_problem(lpproblem, self.config, warm_start=warm_start)
+            return
+        if self.highs_model is None:
+            self.highs_model = PersistentHighsModel(lpproblem)
+        if changed_variables is None:
+            changed_variables = [var for varname in self.binary_variables for var in self.variables[varname].values()]
+        self.highs_model.solve(self.config, changed_variables, warm_start=warm_start)
 
+    def check_block_feasibility(self, lpproblem: lp.LpProblem):
         """
-        Parámetro precio en cada franja (€/MWh): Price
-        """
-        Price = self.instance.get_all_prices()
-        """
-        Parámetro lags iniciales en el caudal de entrada
-        a cada embalse (m3/s): IniLags
-        """
-        IniLags = {
-            dam_id: self.instance.get_initial_lags_of_channel(dam_id)
-            for dam_id in self.instance.get_ids_of_dams()
-        }
-        """
-        Parámetro volumen final objetivo (m3): VolFinal
-        """
-        VolFinal = {
-            dam_id: self.config.volume_objectives[dam_id]
-            for dam_id in self.instance.get_ids_of_dams()
-        }
-        """
-        Parámetro caudal entrante al primer embalse (m3/s): Q0
-        """
-        Q0 = self.instance.get_all_incoming_flows()
-        """
-        Parámetro bonus por exceder volumen objetivo (€/m3): BonusVol
-        """
-        BonusVol = self.config.volume_exceedance_bonus
-        """
-        Parámetro penalización por no llegar a volumen objetivo (€/m3): PenVol
-        """
-        PenVol = self.config.volume_shortage_penalty
-        """
-        Parámetro penalización por franja en zona límite
-        (€/nºfranjas): PenZL
-        """
-        PenZL = self.config.limit_zones_penalty
-        """
-        Parámetro penalización por arranque de grupo de potencia
-        (€/nºarranques): PenSU
-        """
-        PenSU = self.config.startups_penalty
-        """
-        Parámetro caudal turbinado de apagado de turbina (m3/s): shutdown_flows
+        Raises a RuntimeError if the model of the current iteration is infeasible: the binaries fixed in the previous
+        iterations (e.g. a flow change whose water hammer window forbids the change needed now) admit no solution,
+        and repeating the iteration does not help.
         """
-        shutdown_flows = {
-            dam_id: self.instance.get_shutdown_flows_of_power_group(dam_id)
-            for dam_id in self.instance.get_ids_of_dams()
-        }
-        """
-        Parámetro caudal turbinado de arranque de turbina (m3/s): startup_flows
-        """
-        startup_flows = {
-            dam_id: self.instance.get_startup_flows_of_power_group(dam_id)
-            for dam_id in self.instance.get_ids_of_dams()
-        }
+        if lpproblem.status == lp.LpStatusInfeasible:
+            raise RuntimeError(
+                f"The Relax&Fix iteration of the time steps {self.current_binary_t_range} is infeasible with the "
+                f"binaries fixed in the previous iterations"
+            )
 
-        # Proceso para eliminar la desviación de decimales de startup_flows y shutdown_flows
-        for i in I:
-            for y in range(len(startup_flows[i])):
-                for w in range(len(QtBP[i])):
-                    if (startup_flows[i][y] - QtBP[i][w]) <= 0.1 and (
-                            startup_flows[i][y] - QtBP[i][w]
-                    ) >= -0.1:
-                        startup_flows[i][y] = QtBP[i][w]
-        for i in I:
-            for y in range(len(shutdown_flows[i])):
-                for w in range(len(QtBP[i])):
-                    if (shutdown_flows[i][y] - QtBP[i][w]) <= 0.1 and (
-                            shutdown_flows[i][y] - QtBP[i][w]
-                    ) >= -0.1:
-                        shutdown_flows[i][y] = QtBP[i][w]
-        """
-        Parámetro zonas límite de cada embalse
-        en la curva Potencia - Caudal turbinado: ZonaLimitePQ
-        """
-        ZonaLimitePQ = {}
-        for dam_id in self.instance.get_ids_of_dams():
-            ZonaLimitePQ[dam_id] = []
-        for i in I:
-            for bp in QtBP[i]:
-                if bp in shutdown_flows[i]:
-                    ZonaLimitePQ[i].append(QtBP[i].index(bp) + 1)
-        # Proceso para eliminar la primera franja
-        # (antes del primer arranque) de este parámetro
-        for i in I:
-            ZonaLimitePQ[i].pop(0)
-        """
-        Parámetro conjunto de franjas para cada powergroup
-        de cada embalse: FranjasGrupos
-        """
-        FranjasGrupos1 = {}
-        FranjasGrupos = {}
-        for i in I:
-            FranjasGrupos1[i] = {}
-            for gp in range(len(startup_flows[i])):
-                FranjasGrupos1[i]["Grupo_potencia" + str(gp + 1)] = []
-                for bp in QtBP[i]:
-                    if gp == (len(startup_flows[i]) - 1):
-                        if bp >= startup_flows[i][gp]:
-                            FranjasGrupos1[i]["Grupo_potencia" + str(gp + 1)].append(
-                                QtBP[i].index(bp) + 1
-                            )
-                            if bp == QtBP[i][-1]:
-                                FranjasGrupos1[i]["Grupo_potencia" + str(gp + 1)].pop(-1)
-                    else:
-                        if bp >= startup_flows[i][gp] and bp < startup_flows[i][gp + 1]:
-                            FranjasGrupos1[i]["Grupo_potencia" + str(gp + 1)].append(
-                                QtBP[i].index(bp) + 1
-                            )
-            FranjasGrupos[i] = {"Grupo_potencia0": [1]}
-            FranjasGrupos[i].update(FranjasGrupos1[i])
-        
-        # Variables
-        # En este caso, se definen las variables de manera distinta ya que van a estar fijas (se optimizan los bucles)
-        vol = {}
-        qe = {}
-        qs = {}
-        pot = {}
-        qtb = {}
-        qch = {}
-        x_pos = {}
-        x_neg = {}
-        w_pq = {}
-        z_pq = {}
-        w_vq = {}
-        z_vq = {}
-        q_max_vol = {}
-        pwch = {}
-        pwch_tot = {}
-        pot_embalse = {}
-        pos_desv = {}
-        neg_desv = {}
-        ben_desv = {}
-        zl_tot = {}
-
-        for varname, key in self.final_solution_values:
-            val = self.final_solution_values[(varname, key)]
-
-            if varname == "vol":
-                i, t = key
-                vol[(i, t)] = lp.LpVariable(f"vol_({i},{t})", lowBound=val, upBound=val, cat=lp.LpContinuous)
-
-            elif varname == "pot":
-                i, t = key
-                pot[(i, t)] = lp.LpVariable(f"pot_({i},{t})", lowBound=val, upBound=val, cat=lp.LpContinuous)
-
-            elif varname == "qs":
-                i, t = key
-                qs[(i, t)] = lp.LpVariable(f"qs_({i},{t})", lowBound=val, upBound=val, cat=lp.LpContinuous)
-
-            elif varname == "qtb":
-                i, t = key
-                qtb[(i, t)] = lp.LpVariable(f"qtb_({i},{t})", lowBound=val, upBound=val, cat=lp.LpContinuous)
-
-            elif varname == "qch":
-                i, t = key
-                qch[(i, t)] = lp.LpVariable(f"qch_({i},{t})", lowBound=val, upBound=val, cat=lp.LpContinuous)
-
-            elif varname == "qe":
-                i, t = key
-                qe[(i, t)] = lp.LpVariable(f"qe_({i},{t})", lowBound=val, upBound=val, cat=lp.LpContinuous)
-
-            elif varname == "x_pos":
-                i, t = key
-                x_pos[(i, t)] = lp.LpVariable(f"x_pos_({i},{t})", lowBound=val, upBound=val, cat=lp.LpContinuous)
-
-            elif varname == "x_neg":
-                i, t = key
-                x_neg[(i, t)] = lp.LpVariable(f"x_neg_({i},{t})", lowBound=val, upBound=val, cat=lp.LpContinuous)
-
-            elif varname == "w_pq":
-                i, t, bp = key
-                w_pq[(i, t, bp)] = lp.LpVariable(f"w_pq_({i},{t},{bp})", lowBound=val, upBound=val, cat=lp.LpContinuous)
-
-            elif varname == "z_pq":
-                i, t, bp = key
-                z_pq[(i, t, bp)] = lp.LpVariable(f"z_pq_({i},{t},{bp})", lowBound=val, upBound=val, cat=lp.LpContinuous)
-
-            elif varname == "w_vq":
-                i, t, bp = key
-                w_vq[(i, t, bp)] = lp.LpVariable(f"w_vq_({i},{t},{bp})", lowBound=val, upBound=val, cat=lp.LpContinuous)
-
-            elif varname == "z_vq":
-                i, t, bp = key
-                z_vq[(i, t, bp)] = lp.LpVariable(f"z_vq_({i},{t},{bp})", lowBound=val, upBound=val, cat=lp.LpContinuous)
-
-            elif varname == "q_max_vol":
-                i, t = key
-                q_max_vol[(i, t)] = lp.LpVariable(f"q_max_vol_({i},{t})", lowBound=val, upBound=val, cat=lp.LpContinuous)
-
-            elif varname == "pwch":
-                i, t, pg = key
-                pwch[(i, t, pg)] = lp.LpVariable(f"pwch_({i},{t},{pg})", lowBound=val, upBound=val, cat=lp.LpContinuous)
-
-            elif varname == "pwch_tot":
-                i = key
-                pwch_tot[i] = lp.LpVariable(f"pwch_tot_({i})", lowBound=val, upBound=val, cat=lp.LpContinuous)
-
-            elif varname == "pot_embalse":
-                i = key
-                pot_embalse[i] = lp.LpVariable(f"pot_embalse_({i})", lowBound=val, upBound=val, cat=lp.LpContinuous)
-
-            elif varname == "pos_desv":
-                i = key
-                pos_desv[i] = lp.LpVariable(f"pos_desv_({i})", lowBound=val, upBound=val, cat=lp.LpContinuous)
-
-            elif varname == "neg_desv":
-                i = key
-                neg_desv[i] = lp.LpVariable(f"neg_desv_({i})", lowBound=val, upBound=val, cat=lp.LpContinuous)
-
-            elif varname == "ben_desv":
-                i = key
-                ben_desv[i] = lp.LpVariable(f"ben_desv_({i})", lowBound=val, upBound=val, cat=lp.LpContinuous)
-
-            elif varname == "zl_tot":
-                i = key
-                zl_tot[i] = lp.LpVariable(f"zl_tot_({i})", lowBound=val, upBound=val, cat=lp.LpInteger)
-
-
-        # Constraints
-        """
-        Restricción balance de volumen
-        """
-        for i in I:
-            for t in T:
-                if t == T[0]:
-                    lpproblem += vol[(i, t)] <= V0[i] + D * (qe[(i, t)] - qs[(i, t)])
-                else:
-                    lpproblem += vol[(i, t)] <= vol[(i, t - 1)] + D * (qe[(i, t)] - qs[(i, t)])
-        """
-        Restricción caudal de entrada
-        """
-        for i in I:
-            for t in T:
-                if i == I[0]:
-                    lpproblem += qe[(i, t)] == Q0[t] + Qnr[i][t]
-                else:
-                    lpproblem += qe[(i, t)] == qtb[(I[I.index(i) - 1], t)] + Qnr[i][t]
-        """
-        Restricción caudal turbinado en base a lags relevantes
-        """
-        for i in I:
-            for t in T:
-                lpproblem += qtb[(i, t)] == lp.lpSum(
-                    IniLags[i][l - 1 - t] for l in L[i] if l - 1 - t >= 0
-                ) * (1 / len(L[i])) + lp.lpSum(qs[(i, t - l)] for l in L[i] if t - l >= 0) * (
-                                     1 / len(L[i])
-                             )
-        """
-        Restricción asociada al IP with Piecewise Linear Functions de Winston
-        en referencia a la curva Potencia - Caudal turbinado
-        """
-        for i in I:
-            for t in T:
-                lpproblem += pot[(i, t)] == lp.lpSum(
-                    z_pq[(i, t, bp)] * PotBP[i][bp - 1] for bp in BreakPointsPQ[i]
-                )
-        """
-        Restricción asociada al IP with Piecewise Linear Functions de Winston
-        en referencia a la curva Potencia - Caudal turbinado
-        """
-        for i in I:
-            for t in T:
-                lpproblem += qtb[(i, t)] == lp.lpSum(
-                    z_pq[(i, t, bp)] * QtBP[i][bp - 1] for bp in BreakPointsPQ[i]
+    def solve_relax_and_fix(
+        self,
+        window_size: int,
+        step_size: int = None,
+        adaptive: bool = False,
+        min_window_size: int = 2,
+        max_window_size: int = None,
+        schedule: list[tuple[int, int]] = None,
+        deadline_seconds: float = None,
+    ) -> dict:
+        """
+        Solves the problem with Relax&Fix: each iteration makes binary the window_size time steps from the first
+        one not fixed yet and fixes the first step_size of them, so that consecutive windows overlap in
+        window_size - step_size time steps that are decided again with more horizon. The last window,
+        which reaches the end of the horizon, is fixed entirely.
+
+        With adaptive, the window size of each iteration is chosen from the difficulty of the previous one
+        (see adapt_window_size), keeping the ratio step_size / window_size. The time steps, time, gap and
+        decision of each iteration are stored in block_log, from which the same windows can be solved
+        again with schedule.
+
+        With deadline_seconds, the time limit and the MIPGap of each iteration are chosen from the time left until
+        the deadline, the iterations left and the difficulty of the previous ones (see block_budget), instead of
+        those of the configuration; time_limit_seconds, if given, is the largest time limit of an iteration.
+        When there is no time left for another iteration, the rest of the horizon is completed without solving its
+        MILP (see complete_by_rounding).
+
+        :param window_size: Number of time steps with binary variables in each iteration (the first one if adaptive)
+        :param step_size: Number of time steps fixed in each iteration (None: window_size, without overlap)
+        :param adaptive: Whether the window size changes with the difficulty of the iterations
+        :param min_window_size: Smallest window size if adaptive
+        :param max_window_size: Largest window size if adaptive (None: the whole horizon)
+        :param schedule: Window size and step size of each iteration (e.g. those of the block_log of a previous
+            run); the last one is repeated if there are more iterations
+        :param deadline_seconds: Time for the whole Relax&Fix, from the call to the end of the last iteration (s).
+            An iteration without solution within its time limit is repeated while there is time left
+        :raise RuntimeError: Without deadline_seconds, if an iteration finds no solution within its time limit and
+            it cannot be repeated with a smaller window (adaptive)
+        """
+        step_size = window_size if step_size is None else step_size
+        if not 1 <= step_size <= window_size:
+            raise ValueError(f"The step size ({step_size}) must be between 1 and the window size ({window_size})")
+        num_ts = self.instance.get_largest_impact_horizon()
+        max_window_size = num_ts if max_window_size is None else max_window_size
+        if deadline_seconds is not None and deadline_seconds <= 0:
+            raise ValueError(f"The deadline ({deadline_seconds} s) must be positive")
+        if adaptive:
+            if self.config.time_limit_seconds is None and deadline_seconds is None:
+                raise ValueError("The adaptive window size needs a time limit (time_limit_seconds or deadline_seconds)")
+            if not 1 <= min_window_size <= window_size <= max_window_size:
+                raise ValueError(
+                    f"The window size ({window_size}) must be between min_window_size ({min_window_size}) "
+                    f"and max_window_size ({max_window_size})"
                 )
-        """
-        Restricción asociada al IP with Piecewise Linear Functions de Winston
-        en referencia a la curva Potencia - Caudal turbinado
-        """
-        for i in I:
-            for t in T:
-                lpproblem += w_pq[(i, t, 0)] == 0
-                lpproblem += w_pq[(i, t, BreakPointsPQ[i][-1])] == 0
-        """
-        Restricción asociada al IP with Piecewise Linear Functions de Winston
-        en referencia a la curva Potencia - Caudal turbinado
-        """
-        for i in I:
-            for t in T:
-                for bp in BreakPointsPQ[i]:
-                    lpproblem += z_pq[(i, t, bp)] <= w_pq[(i, t, bp - 1)] + w_pq[(i, t, bp)]
-        """
-        Restricción asociada al IP with Piecewise Linear Functions de Winston
-        en referencia a la curva Potencia - Caudal turbinado
-        """
-        for i in I:
-            for t in T:
-                lpproblem += lp.lpSum(z_pq[(i, t, bp)] for bp in BreakPointsPQ[i]) == 1
-        """
-        Restricción asociada al IP with Piecewise Linear Functions de Winston
-        en referencia a la curva Potencia - Caudal turbinado
-        """
-        for i in I:
-            for t in T:
-                lpproblem += lp.lpSum(w_pq[(i, t, bp)] for bp in BreakPointsPQ[i]) == 1
-        """
-        Restricción asociada al IP with Piecewise Linear Functions de Winston
-        en referencia a la curva Volumen - Caudal máximo
-        """
-        for i in I:
-            for t in T:
-                if QmaxBP[i] != None:
-                    lpproblem += q_max_vol[(i, t)] == lp.lpSum(
-                        z_vq[(i, t, bp)] * QmaxBP[i][bp - 1] for bp in BreakPointsVQ[i]
+        # Fracción de la ventana que se fija, que se mantiene al cambiar su tamaño
+        proporcion = step_size / window_size
+        config = self.config
+        comienzo = time.perf_counter()
+        # Tiempo de cada iteración fuera del solver (construcción del modelo, MIP start...) y bloques que agotaron
+        # su time limit, para el reparto del plazo
+        sobrecoste = 0.0
+        reparto_inicial = None
+        agotados = 0
+        intentos = 0
+        tiempos_faciles = []
+        # Time limit del último intento sin solución del bloque actual (None si no lo hay)
+        limite_fallido = None
+        self.block_log = []
+        inicio = 0
+        iteracion = 0
+        try:
+            while inicio < num_ts:
+                if schedule:
+                    window_size, step_size = schedule[min(iteracion, len(schedule) - 1)]
+                fin = min(inicio + window_size, num_ts)
+                self.current_binary_t_range = list(range(inicio, fin))
+                # La última ventana llega al final del horizonte y se fija entera
+                self.current_fix_t_range = list(range(inicio, fin if fin == num_ts else inicio + step_size))
+                if deadline_seconds is not None:
+                    # El margen se reserva sobre el plazo completo, para lo que queda tras el último bloque
+                    # (p.ej. el modelo completo con las binarias de las ventanas)
+                    restante = deadline_seconds * (1 - DEADLINE_SAFETY_FRACTION) - (time.perf_counter() - comienzo)
+                    if restante - sobrecoste < DEADLINE_MIN_BLOCK_SECONDS:
+                        # Sin tiempo para otro bloque: el resto del horizonte se completa con el margen
+                        break
+                    bloques = remaining_iterations(inicio, num_ts, window_size, step_size)
+                    limite, gap, reparto = self.block_budget(
+                        restante,
+                        bloques,
+                        sobrecoste,
+                        reparto_inicial,
+                        agotados / max(intentos, 1),
+                        float(np.mean(tiempos_faciles)) if tiempos_faciles else None,
+                        config,
+                        failed_limit=limite_fallido,
                     )
-        """
-        Restricción asociada al IP with Piecewise Linear Functions de Winston
-        en referencia a la curva Volumen - Caudal máximo
-        """
-        for i in I:
-            for t in T:
-                if QmaxBP[i] != None:
-                    if t == T[0]:
-                        lpproblem += V0[i] == lp.lpSum(
-                            z_vq[(i, t, bp)] * VolBP[i][bp - 1] for bp in BreakPointsVQ[i]
-                        )
-                    else:
-                        lpproblem += vol[(i, t - 1)] == lp.lpSum(
-                            z_vq[(i, t, bp)] * VolBP[i][bp - 1] for bp in BreakPointsVQ[i]
-                        )
-        """
-        Restricción asociada al IP with Piecewise Linear Functions de Winston
-        en referencia a la curva Volumen - Caudal máximo
-        """
-        for i in I:
-            for t in T:
-                if QmaxBP[i] != None:
-                    lpproblem += w_vq[(i, t, 0)] == 0
-                    lpproblem += w_vq[(i, t, BreakPointsVQ[i][-1])] == 0
-        """
-        Restricción asociada al IP with Piecewise Linear Functions de Winston
-        en referencia a la curva Volumen - Caudal máximo
-        """
-        for i in I:
-            for t in T:
-                if QmaxBP[i] != None:
-                    for bp in BreakPointsVQ[i]:
-                        lpproblem += z_vq[(i, t, bp)] <= lp.lpSum(
-                            w_vq[(i, t, tr)] for tr in range(bp - 1, bp + 1)
-                        )
-        """
-        Restricción asociada al IP with Piecewise Linear Functions de Winston
-        en referencia a la curva Volumen - Caudal máximo
-        """
-        for i in I:
-            for t in T:
-                if QmaxBP[i] != None:
-                    lpproblem += lp.lpSum(z_vq[(i, t, bp)] for bp in BreakPointsVQ[i]) == 1
-        """
-        Restricción asociada al IP with Piecewise Linear Functions de Winston
-        en referencia a la curva Volumen - Caudal máximo
-        """
-        for i in I:
-            for t in T:
-                if QmaxBP[i] != None:
-                    lpproblem += lp.lpSum(w_vq[(i, t, bp)] for bp in BreakPointsVQ[i]) == 1
-        """
-        Restricción cálculo variación caudal en cada franja
-        """
-        for i in I:
-            for t in T:
-                if t == T[0]:
-                    lpproblem += qch[(i, t)] == qs[(i, t)] - IniLags[i][0]
+                    reparto_inicial = reparto if reparto_inicial is None else reparto_inicial
+                    self.config = replace(config, time_limit_seconds=limite, MIPGap=gap)
+                print(f"--------Resolviendo subproblema {iteracion}--------")
+                print(f"Franjas de tiempo binarias: {self.current_binary_t_range}")
+                print(f"Franjas de tiempo fijadas: {self.current_fix_t_range}")
+                tiempo = time.perf_counter()
+                self.solve()
+                tiempo = time.perf_counter() - tiempo
+                intentos += 1
+                if intentos > 1:
+                    # La primera iteración incluye la construcción del modelo (y, con ventanas, la estimación de los
+                    # valores del agua), que no se repite en las siguientes
+                    sobrecoste = max(0.0, tiempo - self.block_solve_time)
+                limite = self.config.time_limit_seconds
+                if not self.block_solved or (
+                    limite is not None and self.block_solve_time >= ADAPTIVE_SHRINK_TIME_FRACTION * limite
+                ):
+                    agotados += 1
                 else:
-                    lpproblem += qch[(i, t)] == qs[(i, t)] - qs[(i, t - 1)]
-
-        #CON K FORMA CARLOS
-        """
-        Restricción para contabilizar variación positiva de caudal en cada franja
-        """
-        for i in I:
-            for t in T:
-                lpproblem += qch[(i, t)] <= x_pos[(i, t)] * QMax[i]
-        """
-        Restricción para contabilizar variación negativa de caudal en cada franja
-        """
-        for i in I:
-            for t in T:
-                lpproblem += -qch[(i, t)] <= x_neg[(i, t)] * QMax[i]
-        """
-        Restricción para que solo se cuenta la variación correcta
-        """
-        for i in I:
-            for t in T:
-                lpproblem += x_pos[(i, t)] + x_neg[(i, t)] <= 1
+                    tiempos_faciles.append(self.block_solve_time)
+                # Con ventana adaptativa, un bloque sin solución se repite con una ventana menor hasta la mínima
+                reducible = adaptive and not schedule and window_size > min_window_size
+                if not self.block_solved and not reducible and deadline_seconds is None:
+                    raise RuntimeError(
+                        f"No solution found for the time steps {self.current_binary_t_range} within their time limit "
+                        f"({limite} s)"
+                    )
 
-        """
-        Restricción golpe de ariete
-        """
-        for i in I:
-            for t in T:
-                for k in range(1, K+1):
-                    if t - k >= 0:
-                        lpproblem += x_pos[(i, t)] + x_neg[(i, t - k)] <= 1
-                        lpproblem += x_neg[(i, t)] + x_pos[(i, t - k)] <= 1
+                decision = "keep"
+                if adaptive and not schedule:
+                    nuevo_tamano, decision = self.adapt_window_size(
+                        window_size, self.block_solve_time, min_window_size, max_window_size
+                    )
+                    if nuevo_tamano != window_size:
+                        window_size = nuevo_tamano
+                        step_size = max(1, round(window_size * proporcion))
+                self.block_log.append(
+                    dict(
+                        iteration=iteracion,
+                        binary_t_range=(self.current_binary_t_range[0], self.current_binary_t_range[-1]),
+                        fix_t_range=(self.current_fix_t_range[0], self.current_fix_t_range[-1]),
+                        window_size=len(self.current_binary_t_range),
+                        step_size=len(self.current_fix_t_range),
+                        time_limit=limite,
+                        mip_gap=self.config.MIPGap,
+                        time=tiempo,
+                        solved=self.block_solved,
+                        gap=self.block_gap,
+                        decision=decision,
+                    )
+                )
+                print(
+                    f"Subproblema {iteracion}: {tiempo:.1f} s (time limit {limite}), gap {self.block_gap}, "
+                    f"decisión '{decision}' (siguiente ventana {window_size}, paso {step_size})"
+                )
+                if not self.block_solved:
+                    # Sin solución dentro del plazo, el bloque se repite con al menos el doble de time limit (con
+                    # plazo global) o con una ventana menor (adaptativa)
+                    print(f"Subproblema {iteracion} sin solución: se repite")
+                    limite_fallido = limite
+                    continue
+                limite_fallido = None
+                inicio = self.current_fix_t_range[-1] + 1
+                iteracion += 1
+        finally:
+            self.config = config
+        if inicio < num_ts:
+            print(f"Plazo agotado: las franjas {inicio}-{num_ts - 1} se completan redondeando la relajación lineal")
+            tiempo = time.perf_counter()
+            self.complete_by_rounding(inicio, deadline_seconds - (tiempo - comienzo))
+            self.block_log.append(
+                dict(
+                    iteration=iteracion,
+                    binary_t_range=(inicio, num_ts - 1),
+                    fix_t_range=(inicio, num_ts - 1),
+                    window_size=num_ts - inicio,
+                    step_size=num_ts - inicio,
+                    time_limit=None,
+                    mip_gap=None,
+                    time=time.perf_counter() - tiempo,
+                    solved=self.block_solved,
+                    gap=None,
+                    decision="round",
+                )
+            )
+        if deadline_seconds is not None:
+            print(f"Relax&Fix: {time.perf_counter() - comienzo:.1f} s de un plazo de {deadline_seconds} s")
+        return dict()
 
-        """
-        Restricción volumen máximo
-        """
-        for i in I:
-            for t in T:
-                lpproblem += vol[(i, t)] <= VMax[i]
-        """
-        Restricción volumen mínimo
-        """
-        for i in I:
-            for t in T:
-                lpproblem += vol[(i, t)] >= VMin[i]
-        """
-        Restricción caudal máximo por canal
-        (restricción por sección)
-        """
-        for i in I:
-            for t in T:
-                lpproblem += qs[(i, t)] <= QMax[i]
-        """
-        Restricción caudal máximo por canal
-        (restricción por volumen)
-        """
-        for i in I:
-            for t in T:
-                if QmaxBP[i] != None:
-                    lpproblem += qs[(i, t)] <= q_max_vol[(i, t)]
-        """
-        Restricción ganancia (€) total de cada embalse
-        """
-        for i in I:
-            lpproblem += pot_embalse[i] == lp.lpSum(
-                pot[(i, t)] * Price[t] * (D / 3600) for t in T
+    def block_budget(
+        self,
+        time_left: float,
+        blocks_left: int,
+        overhead: float,
+        initial_share: float | None,
+        hard_fraction: float,
+        easy_time: float | None,
+        config: LPConfiguration,
+        failed_limit: float = None,
+    ) -> tuple[float, float, float]:
+        """
+        Time limit and MIPGap of the next Relax&Fix iteration within a global deadline. The time left (minus the
+        overhead of each iteration outside the solver) is shared among the iterations left assuming that they are as
+        difficult as the previous ones: a fraction hard_fraction of them uses up its time limit and the rest take
+        easy_time, so that the time limit is the one that spends the share on average, up to
+        DEADLINE_HARD_BLOCK_FACTOR times the share (the time that easy iterations do not use goes to the hard ones).
+        An iteration repeated because it found no solution gets at least twice the time limit of its
+        last attempt, and every iteration left keeps at least DEADLINE_MIN_BLOCK_SECONDS; none gets more than the
+        time left (minus its overhead). When the share falls below the initial one, the MIPGap of the configuration
+        is relaxed towards DEADLINE_MAX_GAP.
+
+        :param time_left: Time until the deadline, without the DEADLINE_SAFETY_FRACTION margin (s)
+        :param blocks_left: Number of iterations left, including the next one
+        :param overhead: Time outside the solver of the last iteration (s)
+        :param initial_share: Share of the first iteration (None in the first iteration)
+        :param hard_fraction: Fraction of the previous iterations that used up their time limit (or found no solution)
+        :param easy_time: Mean solver time of the other previous iterations (None if there are none) (s)
+        :param config: Configuration of the model, with the largest time limit and the smallest MIPGap
+        :param failed_limit: Time limit of the last attempt of the iteration, if it found no solution (s)
+        :return: Time limit (s) and MIPGap of the next iteration, and share of the time left per iteration (s)
+        """
+        disponible = time_left - blocks_left * overhead
+        reparto = max(disponible / blocks_left, DEADLINE_MIN_BLOCK_SECONDS)
+        limite = DEADLINE_HARD_BLOCK_FACTOR * reparto
+        if hard_fraction > 0:
+            # Time limit de los difíciles para que el tiempo medio de las iteraciones sea el reparto
+            limite = min(limite, (reparto - (1 - hard_fraction) * (easy_time or 0.0)) / hard_fraction)
+        if failed_limit is not None:
+            limite = max(limite, 2 * failed_limit)
+        # Los bloques siguientes conservan el time limit mínimo
+        limite = min(limite, disponible - (blocks_left - 1) * DEADLINE_MIN_BLOCK_SECONDS)
+        if config.time_limit_seconds is not None:
+            limite = min(limite, config.time_limit_seconds)
+        limite = min(max(limite, DEADLINE_MIN_BLOCK_SECONDS), time_left - overhead)
+
+        gap = config.MIPGap
+        if initial_share is not None and reparto < initial_share and gap < DEADLINE_MAX_GAP:
+            gap += (DEADLINE_MAX_GAP - gap) * (1 - reparto / initial_share)
+        return limite, gap, reparto
+
+    def complete_by_rounding(self, inicio: int, time_limit: float):
+        """
+        Completes the Relax&Fix solution from time step inicio to the end of the horizon within time_limit, when the
+        deadline of solve_relax_and_fix leaves no time for the MILP of their blocks: their binaries are taken from the
+        linear relaxation of the full model (with those of the previous blocks fixed), rounded and repaired as for a
+        MIP start (see set_warm_start) and fixed, and the full model, now linear, is solved. If the rounded binaries
+        admit no solution, they are the MIP start of the full model with them binary instead, for the time left.
+        The solution is stored as that of the last iteration; block_solved is False if there is none in time.
+
+        :param time_limit: Time for the whole completion (s)
+        """
+        fin = time.perf_counter() + time_limit
+        config = self.config
+        num_ts = self.instance.get_largest_impact_horizon()
+        self.current_binary_t_range = list(range(inicio, num_ts))
+        self.current_fix_t_range = None
+        if self.lpproblem is None or self.lookahead is not None:
+            # Con ventanas, el modelo completo solo se construye tras la última
+            self.lpproblem = self.build_model()
+            self.lpproblem.name = "Problema_General_24h_resuelto_con_RF"
+            self.highs_model = None
+        lpproblem = self.lpproblem
+        binarias = [var for varname in self.binary_variables for var in self.variables[varname].values()]
+        # Las demás variables enteras (p.ej. los totales de arranques) también se relajan en la relajación lineal
+        enteras = [var for var in set(lpproblem.variables()) - set(binarias) if var.cat == lp.LpInteger]
+
+        def resolver(relajado: bool, warm_start: bool = False) -> bool:
+            restante = fin - time.perf_counter()
+            if restante <= 0:
+                return False
+            self.config = replace(config, time_limit_seconds=restante)
+            self.update_binary_domains()
+            if relajado:
+                lpproblem.sos2 = {}
+                for var in binarias + enteras:
+                    var.cat = lp.LpContinuous
+            else:
+                for var in enteras:
+                    var.cat = lp.LpInteger
+            self.solve_kept_problem(lpproblem, warm_start=warm_start, changed_variables=binarias + enteras)
+            return lpproblem.sol_status in (lp.LpSolutionOptimal, lp.LpSolutionIntegerFeasible)
+
+        try:
+            self.block_solved = resolver(relajado=True)
+            if self.block_solved:
+                self.set_warm_start()
+                redondeadas = {
+                    (varname, key): round(var.varValue or 0.0)
+                    for varname in self.binary_variables
+                    for key, var in self.variables[varname].items()
+                    if key[1] >= inicio and (varname, key) not in self.presolve_fixed
+                }
+                self.fixed_values.update(redondeadas)
+                self.block_solved = resolver(relajado=True)
+                if not self.block_solved:
+                    # Las binarias redondeadas no admiten solución: son el MIP start del modelo con ellas binarias
+                    for clave in redondeadas:
+                        del self.fixed_values[clave]
+                    for var in lpproblem.variables():
+                        var.varValue = None
+                    for (varname, key), valor in redondeadas.items():
+                        self.variables[varname][key].varValue = valor
+                    self.block_solved = resolver(relajado=False, warm_start=True)
+        finally:
+            self.config = config
+        if not self.block_solved:
+            print(f"Sin solución de las franjas {inicio}-{num_ts - 1} dentro del plazo")
+            return
+
+        for varname in self.binary_variables:
+            for key, var in self.variables[varname].items():
+                if key[1] >= inicio and (varname, key) not in self.presolve_fixed:
+                    self.fixed_values[(varname, key)] = round(var.value())
+        self.block_gap = getattr(lpproblem, "mip_gap", None)
+        self.block_solve_time = lpproblem.solutionTime
+        self.store_solution(lpproblem)
+        self.final_solution_values = {
+            (varname, key): var.value() for varname, variables in self.variables.items()
+            for key, var in variables.items()
+        }
+
+    def adapt_window_size(
+        self, window_size: int, elapsed: float, min_window_size: int, max_window_size: int
+    ) -> tuple[int, str]:
+        """
+        Chooses the window size of the next Relax&Fix iteration from the difficulty of the last one: the window
+        is halved if the iteration found no solution, used up the time limit or ended with a gap above
+        ADAPTIVE_SHRINK_GAP, and grows
+        by half if it was solved in less than ADAPTIVE_GROW_TIME_FRACTION of the time limit.
+
+        :param window_size: Window size of the last iteration
+        :param elapsed: Solver time of the last iteration (s), without the model build
+        :return: Window size of the next iteration and decision taken ("grow", "shrink" or "keep")
+        """
+        time_limit = self.config.time_limit_seconds
+        if (
+            not self.block_solved
+            or elapsed >= ADAPTIVE_SHRINK_TIME_FRACTION * time_limit
+            or (self.block_gap is not None and self.block_gap > ADAPTIVE_SHRINK_GAP)
+        ):
+            nuevo_tamano, decision = max(min_window_size, window_size // 2), "shrink"
+        elif elapsed <= ADAPTIVE_GROW_TIME_FRACTION * time_limit:
+            nuevo_tamano, decision = min(max_window_size, window_size + max(1, window_size // 2)), "grow"
+        else:
+            return window_size, "keep"
+        # En los extremos el tamaño no cambia
+        return nuevo_tamano, decision if nuevo_tamano != window_size else "keep"
+
+    def estimate_water_values(self) -> np.ndarray:
+        """
+        Estimates the marginal value of the water of each dam at the end of each time step as the dual of its
+        volume balance row in the linear relaxation of the full model, solved with a backend that returns duals
+        (see DUAL_BACKENDS).
+
+        :return: Water values (€/m3), shape (num_dams, num_time_steps)
+        :raise RuntimeError: If the relaxation has no optimal solution with duals
+        """
+        relajado = LPModel(instance=self.instance, config=replace(self.config, lazy_constraints=False))
+        lpproblem = relajado.build_model()
+        lpproblem.sos2 = {}
+        for var in lpproblem.variables():
+            var.cat = lp.LpContinuous
+        estado = solve_problem(lpproblem, self.config, duals=True)
+        p = self.parameters
+        duales = [[relajado.balance_rows[(i, t)].pi for t in range(p.num_time_steps)] for i in p.I]
+        if estado != lp.LpStatusOptimal or any(d is None for fila in duales for d in fila):
+            raise RuntimeError(
+                f"The linear relaxation gave no water values (status {lp.LpStatus[estado]}, no duals of its "
+                f"volume balance rows)"
             )
-        """
-        Restricción cómputo desviación respecto a volumen objetivo
-        """
-        for i in I:
-            for t in T:
-                if t == T[D_1 - 1]:
-                    lpproblem += vol[(i, t)] == VolFinal[i] + pos_desv[i] - neg_desv[i]
-        """
-        Restricción cálculo beneficio por exceso/falta de volumen
-        respecto al objetivo
-        """
-        for i in I:
-            lpproblem += ben_desv[i] == pos_desv[i] * BonusVol - neg_desv[i] * PenVol
-        """
-        Restricción número total de franjas en zona límite para cada embalse
-        """
-        for i in I:
-            lpproblem += zl_tot[i] == lp.lpSum(
-                w_pq[(i, t, bp)] for t in T for bp in ZonaLimitePQ[i]
+        duales = np.array(duales, dtype=float)
+        # Los duales son por unidad de volumen del modelo (ver scale_units)
+        return duales / relajado.volume_scale
+
+    def window_parameters(self, inicio: int, fin: int) -> ModelParameters:
+        """
+        Parameters of the window of time steps [inicio, fin) of the horizon (see solve_window): prices and flows of
+        its time steps and, as initial state, the volumes, the exiting flows reached by the lags, the flow change
+        indicators and the segment of the Power - Turbined flow curve fixed in the previous blocks. Unless the
+        window contains the end of the decision horizon, its final volumes are valued at water_values, and the
+        shortage of the volume objectives that they no longer allow to avoid is penalized.
+
+        :return: Parameters of a model of fin - inicio time steps
+        """
+        p = self.parameters
+        valores = self.window_values
+        ultima_decision = p.D_1 - 1
+        cambios = dict(
+            num_time_steps=fin - inicio,
+            Price=_frozen(p.Price[inicio:fin]),
+            Q0=_frozen(p.Q0[inicio:fin]),
+            Qnr=_frozen(p.Qnr[:, inicio:fin]),
+        )
+        if inicio <= ultima_decision < fin:
+            cambios["D_1"] = p.D_1 - inicio
+        else:
+            cambios["ValorAgua"] = _frozen(self.water_values[:, fin - 1])
+            # Con el caudal de entrada máximo desde el final de la ventana hasta el horizonte de decisión
+            entrada_maxima = p.D * self.bounds.qe_ub[:, fin:ultima_decision + 1].sum(axis=1)
+            cambios["VolFinalAlcanzable"] = _frozen(p.VolFinal - entrada_maxima)
+        if inicio == 0:
+            return replace(p, **cambios)
+
+        def segmento(i, t):
+            if ("w_pq", (i, t, 1)) in valores:
+                return next(bp for bp in p.BreakPointsPQ[i] if valores[("w_pq", (i, t, bp))] > 0.5)
+            return next(
+                region[0] for r, region in enumerate(self.pq_regions[i]) if valores[("y_pq", (i, t, r))] > 0.5
             )
 
-        # Función que, dado el conjunto FranjasGrupos y un powergroup específico, te devuelve
-        # las franjas de la curva Potencia - Caudal turbinado que están en powergroups
-        # superiores al dado.
-        def obtener_franjas_pw_mayores(diccionario, clave):
-            pw_posteriores = list(diccionario.keys())[
-                             list(diccionario.keys()).index(clave) + 1:
-                             ]
+        ini_lags = {}
+        for i in p.I:
+            # Lag j: caudal de salida de la franja inicio - 1 - j o, antes del horizonte, lag inicial
+            anteriores = [valores[("qs", (i, inicio - 1 - j))] for j in range(min(inicio, len(p.IniLags[i])))]
+            ini_lags[i] = _frozen(anteriores + list(p.IniLags[i][:len(p.IniLags[i]) - len(anteriores)]))
+        return replace(
+            p,
+            V0=_frozen([valores[("vol", (i, inicio - 1))] * self.volume_scale for i in p.I]),
+            IniLags=MappingProxyType(ini_lags),
+            VariacionesIniciales=MappingProxyType({
+                i: tuple(
+                    (round(valores[("x_pos", (i, t))]), round(valores[("x_neg", (i, t))]))
+                    for t in range(inicio - 1, max(inicio - 1 - p.K, -1), -1)
+                )
+                for i in p.I
+            }),
+            SegmentoInicial=MappingProxyType({i: segmento(i, inicio - 1) for i in p.I}),
+            **cambios,
+        )
 
-            franjas_posteriores = []
-            for pw_posterior in pw_posteriores:
-                franjas_posteriores += diccionario[pw_posterior]
-            return franjas_posteriores
+    def solve_window(self) -> dict:
+        """
+        Solves the current block in a window with its time steps and the lookahead following ones, instead of the
+        whole horizon: the previous blocks enter as the initial state of the window (see window_parameters), the
+        binaries of the lookahead time steps are relaxed, except in the first K ones (the water hammer window), and
+        the water left at the end of the window is valued at its estimated marginal value (see
+        estimate_water_values). The size of the model of each block is constant.
+        The values of the time steps of fix_t_range are fixed and, after the last block, the full model is solved
+        with all the binaries fixed.
+        """
+        p = self.parameters
+        bloque = sorted(self.current_binary_t_range)
+        fijadas = sorted(self.fix_t_range)
+        inicio = bloque[0]
+        fin = min(bloque[-1] + 1 + self.lookahead, p.num_time_steps)
+        if self.water_values is None:
+            self.water_values = self.estimate_water_values()
+
+        ventana = LPModel(instance=self.instance, config=self.config)
+        ventana.derived_parameters = self.window_parameters(inicio, fin)
+        lpproblem = ventana.build_model()
+        lpproblem.name = f"Ventana_RF_{inicio}_{fin}"
+        self.pq_regions = ventana.pq_regions
+        # Las binarias de las franjas posteriores al bloque se relajan (ver update_binary_domains), salvo en las K
+        # primeras: una variación de caudal fijada al final del bloque impide la de sentido contrario durante K
+        # franjas, y con las curvas relajadas en ellas el caudal fijado podría no admitir ninguna solución entera en
+        # la ventana siguiente (p.ej. por encima del máximo de la curva Volumen - Caudal)
+        num_enteras = len(bloque) + p.K
+        lpproblem.sos2 = {
+            f"SOS2_{curva}_{i}_{t}": conjunto
+            for (curva, i, t), conjunto in ventana.sos2_sets.items()
+            if t < num_enteras
+        }
+        for varname in self.binary_variables:
+            for key, var in ventana.variables[varname].items():
+                if key[1] >= num_enteras and (varname, key) not in ventana.presolve_fixed:
+                    var.cat = lp.LpContinuous
+        ventana.solve_built_model(lpproblem)
+        self.block_gap = getattr(lpproblem, "mip_gap", None)
+        self.block_solve_time = lpproblem.solutionTime
+        self.check_block_feasibility(lpproblem)
+        self.block_solved = lpproblem.sol_status in (lp.LpSolutionOptimal, lp.LpSolutionIntegerFeasible)
+        if not self.block_solved:
+            return dict()
+        ventana.store_solution(lpproblem)
+        # Los indicadores de variación que se fijan pasan al estado inicial de las ventanas siguientes: sin
+        # variación quedan a 0 para no prohibir en ellas variaciones de sentido contrario
+        ventana.reset_flow_change_indicators()
+
+        # Se guardan los valores de las franjas fijadas, en las franjas del horizonte completo
+        for varname, variables in ventana.variables.items():
+            for key, var in variables.items():
+                if not isinstance(key, tuple) or key[1] >= len(fijadas):
+                    continue
+                clave = (key[0], key[1] + inicio) + key[2:]
+                self.window_values[(varname, clave)] = var.value()
+                if varname in self.binary_variables:
+                    self.fixed_values[(varname, clave)] = round(var.value())
+
+        if fijadas[-1] == p.num_time_steps - 1:
+            # Modelo completo con todas las binarias fijadas: valores de las variables continuas y objetivo
+            print("--------Modelo completo con las binarias de las ventanas--------")
+            self.lpproblem = self.build_model()
+            self.lpproblem.name = "Problema_General_24h_resuelto_con_RF"
+            self.lpproblem.sos2 = {}
+            for varname in self.binary_variables:
+                for key, var in self.variables[varname].items():
+                    if (varname, key) in self.fixed_values and (varname, key) not in self.presolve_fixed:
+                        var.cat = lp.LpContinuous
+                        var.lowBound = var.upBound = self.fixed_values[(varname, key)]
+            solve_problem(self.lpproblem, self.config)
+            self.store_solution(self.lpproblem)
+            self.final_solution_values = {
+                (varname, key): var.value() for varname, variables in self.variables.items()
+                for key, var in variables.items()
+            }
+        return dict()
 
-        """
-        Restricción cómputo arranques de powergroups
-        """
-        # TODO: implementar que compute dos veces cuando hay dos arranques simultáneos de una franja a la siguiente
-        for i in I:
-            for t in T:
-                if t != T[0]:
-                    for pg in FranjasGrupos[i]:
-                        if pg != list(FranjasGrupos[i].keys())[-1]:
-                            lista_keys = list(FranjasGrupos[i].keys())
-                            franjassuperiores = obtener_franjas_pw_mayores(FranjasGrupos[i], pg)
-                            lpproblem += (
-                                    lp.lpSum(
-                                        w_pq[(i, t - 1, franja)] for franja in FranjasGrupos[i][pg]
-                                    )
-                                    + lp.lpSum(
-                                        w_pq[(i, t, franja_sup)] for franja_sup in franjassuperiores
-                                    )
-                                    - 1
-                                    <= pwch[(i, t, lista_keys[lista_keys.index(pg) + 1])]
-                            )
-                            lpproblem += (
-                                    lp.lpSum(
-                                        w_pq[(i, t - 1, franja)] for franja in FranjasGrupos[i][pg]
-                                    )
-                                    + lp.lpSum(
-                                        w_pq[(i, t, franja_sup)] for franja_sup in franjassuperiores
-                                    )
-                                    >= 2 * pwch[(i, t, lista_keys[lista_keys.index(pg) + 1])]
-                            )
-                        if t == 0:
-                            lpproblem += pwch[(i, t, pg)] == 0
-        """
-        Restricción cálculo número de arranques totales en cada embalse
-        """
-        for i in I:
-            lpproblem += pwch_tot[i] == lp.lpSum(
-                pwch[(i, t, pg)] for t in T for pg in FranjasGrupos[i]
-            )
+    def validate_solution(self, options: dict = None) -> dict:
 
-    
-        # Objective Function
-        lpproblem += lp.lpSum(
-            pot_embalse[i] + ben_desv[i] - zl_tot[i] * PenZL - pwch_tot[i] * PenSU for i in I
-        )
+        # LP Problem
+        # Se construye un modelo nuevo con todas las variables fijadas al valor de la solución final de RF
+        # y con todas las filas, también las que lazy_constraints genera de forma perezosa
+        validation = LPModel(instance=self.instance, config=replace(self.config, lazy_constraints=False))
+        lpproblem = validation.build_model()
+        lpproblem.name = "Validacion_RF_con_variables_fijas"
+
+        for varname, variables in validation.variables.items():
+            for key, var in variables.items():
+                val = self.final_solution_values[(varname, key)]
+                var.cat = lp.LpContinuous
+                var.lowBound = val
+                var.upBound = val
 
         # Solve
-        # solver = lp.GUROBI(path=None, keepFiles=0, MIPGap=self.config.MIPGap)
-        solver = lp.GUROBI_CMD(gapRel=self.config.MIPGap, timeLimit=self.config.time_limit_seconds)
-        # solver = lp.PULP_CBC_CMD(gapRel=self.config.MIPGap)  # <-- caca
-        lpproblem.solve(solver)
+        solve_problem(lpproblem, self.config)
 
         if lp.LpStatus[lpproblem.status] == "Optimal":
             print("La solución obtenida con RF es factible: se cumplen todas las restricciones.")
@@ -2023,4 +876,3 @@ class LPModel_RF:
             print("La solución NO es factible.")
 
         return dict()
-        
\ No newline at end of file
@@ -0,0 +1,94 @@
+import contextlib
+import csv
+import glob
+import io
+import os
+import time
+import matplotlib.pyplot as plt
+import pulp
+from instance_ana import InstanceData
+from lp_RF import LPConfiguration, LPModel_RF
+
+# Barrido de los tamaños de ventana (franjas binarias) y de paso (franjas fijadas) de Relax&Fix
+# (ver LPModel_RF.solve_relax_and_fix): objetivo y tiempo de cada combinación, guardados en un CSV
+# y en un gráfico de calidad frente a tiempo por instancia
+
+NUM_DAMS = [2, 4]
+PERCENTILES = ["00", "50", "100"]
+# (window_size, step_size)
+WINDOWS = [(4, 4), (6, 3), (8, 4), (8, 2), (12, 4), (12, 6)]
+TIME_LIMIT = 60
+RF_PATH = os.path.dirname(os.path.abspath(__file__))
+INSTANCES_PATH = os.path.join(RF_PATH, "..", "percentiles")
+CHARTS_PATH = os.path.join(RF_PATH, "charts")
+
+config = LPConfiguration(
+    volume_shortage_penalty=3,
+    volume_exceedance_bonus=0,
+    startups_penalty=50,
+    limit_zones_penalty=1000,
+    volume_objectives={
+        "dam1": 59627.42324,
+        "dam2": 31010.43613642857,
+        "dam3": 31010.43613642857,
+        "dam4": 31010.43613642857,
+        "dam5": 59627.42324,
+        "dam6": 59627.42324,
+        "dam7": 31010.43613642857,
+        "dam8": 59627.42324,
+        "dam9": 59627.42324,
+        "dam10": 31010.43613642857,
+        "dam11": 59627.42324,
+        "dam12": 31010.43613642857,
+    },
+    MIPGap=0.0,
+    time_limit_seconds=TIME_LIMIT,
+    flow_smoothing=2,
+    solver="highs",
+)
+
+
+def run_relax_and_fix(instance: InstanceData, window_size: int, step_size: int) -> tuple[float | None, float]:
+    """
+    :return: Objective value of the Relax&Fix solution (None if there is none, e.g. if a block
+        has no solution within its time limit) and total time (s)
+    """
+    model = LPModel_RF(config=config, instance=instance)
+    start = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            model.solve_relax_and_fix(window_size=window_size, step_size=step_size)
+    except RuntimeError as error:
+        elapsed = time.perf_counter() - start
+        print(f"Window {window_size} step {step_size}: {error}", flush=True)
+        return None, elapsed
+    elapsed = time.perf_counter() - start
+    return pulp.value(model.lpproblem.objective), elapsed
+
+
+os.makedirs(CHARTS_PATH, exist_ok=True)
+with open(os.path.join(CHARTS_PATH, "sweep_RF_windows.csv"), "w", newline="") as f:
+    writer = csv.writer(f, delimiter=";")
+    writer.writerow(["percentile", "dams", "window_size", "step_size", "rf_obj", "rf_time"])
+    for num_dams in NUM_DAMS:
+        for percentile in PERCENTILES:
+            instance = InstanceData.from_json(
+                glob.glob(os.path.join(INSTANCES_PATH, percentile, f"instance_{num_dams}dams_*.json"))[0]
+            )
+            fig, ax = plt.subplots(figsize=(8, 6))
+            for window_size, step_size in WINDOWS:
+                objective, elapsed = run_relax_and_fix(instance, window_size, step_size)
+                writer.writerow([f"P{percentile}", f"{num_dams} DAM", window_size, step_size, objective, f"{elapsed:.2f}"])
+                f.flush()
+                print(f"P{percentile} {num_dams} DAM window {window_size} step {step_size}: "
+                      f"{objective} € en {elapsed:.1f} s", flush=True)
+                if objective is not None:
+                    ax.scatter(elapsed, objective, color="b")
+                    ax.annotate(f"{window_size}/{step_size}", (elapsed, objective),
+                                textcoords="offset points", xytext=(5, 5))
+            ax.set_title(f"Relax&Fix P{percentile} {num_dams} DAM (ventana/paso)")
+            ax.set_xlabel("Tiempo (s)")
+            ax.set_ylabel("Valor de la función objetivo (€)")
+            ax.grid(linestyle="--", alpha=0.5)
+            fig.savefig(os.path.join(CHARTS_PATH, f"sweep_RF_P{percentile}_{num_dams}dams.png"), bbox_inches="tight")
+            plt.close(fig)
@@ -0,0 +1,44 @@
+import glob
+import json
+import os
+import numpy as np
+import pulp as lp
+from instance_ana import InstanceData
+from lp_RF import LPSolution
+from lp_ana import variable_values
+
+# Los valores de cada embalse de la solución se extraen por su clave (dam_id, t) en la instancia de 12 embalses:
+# los de "dam1" no se mezclan con los de "dam10", "dam11" ni "dam12", cuyo ID empieza igual
+
+INSTANCES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "percentiles")
+
+
+def test_solution_keeps_dams_with_shared_id_prefix_apart():
+    instance = InstanceData.from_json(glob.glob(os.path.join(INSTANCES_PATH, "100", "instance_12dams_*.json"))[0])
+    dam_ids = instance.get_ids_of_dams()
+    dam_index = {dam_id: d for d, dam_id in enumerate(dam_ids)}
+    num_time_steps = instance.get_largest_impact_horizon()
+    # Valor distinto en cada embalse y franja: 1000 * fila + franja
+    familias = {}
+    for nombre in ("qs", "pot", "vol"):
+        familias[nombre] = lp.LpVariable.dicts(nombre, [(i, t) for i in dam_ids for t in range(num_time_steps)])
+        for (i, t), var in familias[nombre].items():
+            var.varValue = 1000 * dam_index[i] + t
+
+    solution = LPSolution(
+        dam_ids=dam_ids,
+        flows=variable_values(familias["qs"], dam_index, num_time_steps),
+        powers=variable_values(familias["pot"], dam_index, num_time_steps),
+        volumes=variable_values(familias["vol"], dam_index, num_time_steps),
+        price=instance.get_all_prices(),
+    )
+    # La solución guardada en JSON y leída de nuevo mantiene cada embalse en su fila
+    reloaded = LPSolution.from_dict(json.loads(solution.to_json()))
+
+    assert len(dam_ids) >= 10
+    for sol in (solution, reloaded):
+        for dam_id in ("dam1", "dam10"):
+            expected = 1000 * dam_index[dam_id] + np.arange(num_time_steps)
+            np.testing.assert_array_equal(sol.get_exiting_flows_of_dam(dam_id), expected)
+            np.testing.assert_array_equal(sol.get_volumes_of_dam(dam_id), expected)
+        assert not np.array_equal(sol.get_exiting_flows_of_dam("dam1"), sol.get_exiting_flows_of_dam("dam10"))
@@ -0,0 +1,68 @@
+import glob
+import os
+import re
+import pytest
+from dataclasses import replace
+from instance_ana import InstanceData
+from lp_RF import LPConfiguration
+from lp_ana import LPModel
+from solvers import backend_available
+
+# Cada opción del MILP (constructor del modelo, formulaciones, reducciones, cortes...) resuelve la instancia de
+# 2 embalses del percentil 100 con HiGHS y el presolve y alcanza el óptimo del MILP completo
+
+INSTANCES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "percentiles")
+# Óptimo del MILP completo de la instancia (€)
+MILP_OBJECTIVE = 9001.97
+
+config = LPConfiguration(
+    volume_shortage_penalty=3,
+    volume_exceedance_bonus=0,
+    startups_penalty=50,
+    limit_zones_penalty=1000,
+    volume_objectives={
+        "dam1": 59627.42324,
+        "dam2": 31010.43613642857,
+    },
+    MIPGap=0.0,
+    time_limit_seconds=120,
+    flow_smoothing=2,
+    solver="highs",
+    presolve=True,
+)
+
+OPTIONS = [
+    pytest.param(dict(model_builder="matrix"), id="matrix_builder"),
+    # Con CBC, "sos2" no encuentra solución entera a partir de 2 embalses (ver LPConfiguration.pwl_formulation)
+    pytest.param(
+        dict(pwl_formulation="sos2", solver="gurobi_cmd"),
+        id="sos2",
+        marks=pytest.mark.skipif(not backend_available("gurobi_cmd"), reason="Gurobi no disponible"),
+    ),
+    pytest.param(dict(pwl_formulation="log"), id="pwl_log"),
+    pytest.param(dict(simplify_pq_curves=True), id="simplify_pq_curves"),
+    pytest.param(dict(), id="presolve"),
+    pytest.param(dict(substitute_defined_variables=True), id="substitute_defined_variables"),
+    pytest.param(dict(water_hammer_formulation="aggregated"), id="water_hammer_aggregated"),
+    pytest.param(dict(water_hammer_formulation="window_max"), id="water_hammer_window_max"),
+    pytest.param(dict(startup_formulation="cumulative"), id="cumulative_startups"),
+    pytest.param(dict(detect_concave_curves=True), id="detect_concave_curves"),
+    pytest.param(dict(scale_units=True), id="scale_units"),
+    pytest.param(dict(tight_big_m=True), id="tight_big_m"),
+    pytest.param(dict(startup_cuts=True, volume_reachability_cuts=True, pq_segment_cuts=True), id="valid_inequalities"),
+    pytest.param(dict(lazy_constraints=True), id="lazy_constraints"),
+    pytest.param(dict(model_builder="matrix", build_workers=2), id="matrix_builder_workers"),
+    pytest.param(dict(compress_time_steps=True, compression_tolerance=0.5), id="compress_time_steps"),
+]
+
+
+@pytest.mark.parametrize("options", OPTIONS)
+def test_option_reaches_milp_objective(capsys, options):
+    instance = InstanceData.from_json(glob.glob(os.path.join(INSTANCES_PATH, "100", "instance_2dams_*.json"))[0])
+    model = LPModel(config=replace(config, **options), instance=instance)
+
+    model.solve()
+
+    objectives = re.findall(r"Valor de la función objetivo \(€\):\s+(\S+)", capsys.readouterr().out)
+    assert model.solution is not None
+    assert float(objectives[-1]) == pytest.approx(MILP_OBJECTIVE, rel=1e-3)
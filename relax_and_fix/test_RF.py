@@ -13,6 +13,8 @@ DATE = 20200908
 TIME_LIMIT_MINUTES = 15
 SAVE_SOLUTION = False
 SAVE_GRAPH = False
+# Franjas posteriores a cada bloque que ve su ventana (None: todo el horizonte, ver LPModel_RF.solve_window)
+LOOKAHEAD = None
 
 
 config = LPConfiguration(
@@ -36,24 +38,17 @@ config = LPConfiguration(
 )
 
 instance = InstanceData.from_json(f"/home/admin/tfm_ana/new/percentiles/00/instance_{NUM_DAMS}dams_{DATE}.json")
-lp = LPModel_RF(config=config, instance=instance)
-
-
-# Definir el tamaño de bloque y los rangos de tiempo para los subproblemas
-block_size = 4
-num_ts = instance.get_largest_impact_horizon()
-num_blocks = (num_ts + block_size - 1) // block_size
-
-# Resolver iterativamente el modelo para cada bloque de franjas de tiempo
-for current_block in range(num_blocks):
-    start_t = current_block * block_size
-    end_t = min((current_block + 1) * block_size, num_ts)
-    current_binary_t_range = list(range(start_t, end_t))
-    lp.current_binary_t_range = current_binary_t_range
-    # Llamar a solve con el nuevo rango
-    print(f"--------Resolviendo subproblema {current_block}--------")
-    print(f"Franjas de tiempo binarias: {current_binary_t_range}")
-    lp.solve()
+lp = LPModel_RF(config=config, instance=instance, lookahead=LOOKAHEAD)
+
+
+# Tamaño de la ventana de franjas binarias y número de franjas que se fijan en cada subproblema
+# (con step_size < window_size las ventanas se solapan, ver LPModel_RF.solve_relax_and_fix)
+window_size = 4
+step_size = 4
+# Si es True, el tamaño de la ventana cambia según la dificultad de cada subproblema (ver lp.block_log)
+adaptive = False
+
+lp.solve_relax_and_fix(window_size=window_size, step_size=step_size, adaptive=adaptive)
 
 lp.validate_solution()
 
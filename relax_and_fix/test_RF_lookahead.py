@@ -0,0 +1,69 @@
+import glob
+import os
+import pulp
+import pytest
+from instance_ana import InstanceData
+from lp_RF import LPConfiguration, LPModel_RF
+
+# Relax&Fix con ventanas de lookahead (ver LPModel_RF.solve_window) de principio a fin, con el presolve, en la
+# instancia de 2 embalses del percentil 100: todos los bloques tienen solución, la solución final es factible en el
+# modelo completo y su objetivo está cerca del óptimo del MILP
+
+INSTANCES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "percentiles")
+LOOKAHEAD = 8
+# Óptimo del MILP completo de la instancia (€)
+MILP_OBJECTIVE = 9001.97
+
+config = LPConfiguration(
+    volume_shortage_penalty=3,
+    volume_exceedance_bonus=0,
+    startups_penalty=50,
+    limit_zones_penalty=1000,
+    volume_objectives={
+        "dam1": 59627.42324,
+        "dam2": 31010.43613642857,
+    },
+    MIPGap=0.0,
+    time_limit_seconds=60,
+    flow_smoothing=2,
+    solver="highs",
+    presolve=True,
+)
+
+
+@pytest.mark.parametrize("window_size, step_size", [(4, 4), (8, 4)])
+def test_lookahead_relax_and_fix_with_presolve(capsys, window_size, step_size):
+    instance = InstanceData.from_json(glob.glob(os.path.join(INSTANCES_PATH, "100", "instance_2dams_*.json"))[0])
+    model = LPModel_RF(config=config, instance=instance, lookahead=LOOKAHEAD)
+
+    model.solve_relax_and_fix(window_size=window_size, step_size=step_size)
+    model.validate_solution()
+
+    assert all(block["solved"] for block in model.block_log)
+    assert "La solución obtenida con RF es factible" in capsys.readouterr().out
+    assert pulp.value(model.lpproblem.objective) >= 0.99 * MILP_OBJECTIVE
+
+
+def test_water_values_with_default_solver():
+    # El backend por defecto (gurobi_cmd) no devuelve duales: los valores del agua se obtienen con otro backend
+    instance = InstanceData.from_json(glob.glob(os.path.join(INSTANCES_PATH, "00", "instance_2dams_*.json"))[0])
+    model = LPModel_RF(
+        config=LPConfiguration(
+            volume_shortage_penalty=config.volume_shortage_penalty,
+            volume_exceedance_bonus=config.volume_exceedance_bonus,
+            startups_penalty=config.startups_penalty,
+            limit_zones_penalty=config.limit_zones_penalty,
+            volume_objectives=config.volume_objectives,
+            MIPGap=config.MIPGap,
+            time_limit_seconds=config.time_limit_seconds,
+            flow_smoothing=config.flow_smoothing,
+        ),
+        instance=instance,
+        lookahead=LOOKAHEAD,
+    )
+
+    water_values = model.estimate_water_values()
+
+    assert water_values.shape == (2, instance.get_largest_impact_horizon())
+    # Con poca agua (percentil 0), el agua tiene valor en casi todas las franjas
+    assert (water_values > 0).mean() > 0.9
@@ -13,6 +13,8 @@ DATE = 20200618
 TIME_LIMIT_MINUTES = 2
 SAVE_SOLUTION = False
 SAVE_GRAPH = False
+# Franjas posteriores a cada bloque que ve su ventana (None: todo el horizonte, ver LPModel_RF.solve_window)
+LOOKAHEAD = None
 
 
 config = LPConfiguration(
@@ -40,33 +42,16 @@ config = LPConfiguration(
 )
 
 instance = InstanceData.from_json(f"/home/admin/tfm_ana/new/percentiles/20/instance_{NUM_DAMS}dams_{DATE}.json")
-lp = LPModel_RF(config=config, instance=instance)
+lp = LPModel_RF(config=config, instance=instance, lookahead=LOOKAHEAD)
 
 
-# Definir el tamaño de bloque y los rangos de tiempo para los subproblemas
+# Tamaño de bloque y plazo total: el time limit y el MIPGap de cada bloque se reparten según el tiempo que queda,
+# los bloques que faltan y la dificultad de los anteriores, sin superar time_limit_seconds por bloque
+# (ver LPModel_RF.block_budget)
 block_size = 4
-num_ts = instance.get_largest_impact_horizon()
-num_blocks = (num_ts + block_size - 1) // block_size
-
-# Se definen dos time limits distintos para que RF no sobrepase los 900 segundos en instancias largas
-first_half_limit = (900/24)*2
-second_half_limit = (900/24)*0.5
-
-# Resolver iterativamente el modelo para cada bloque de franjas de tiempo
-for current_block in range(num_blocks):
-    if current_block < num_blocks // 2:
-        lp.config.time_limit_seconds = first_half_limit
-    else:
-        lp.config.time_limit_seconds = second_half_limit
-    
-    start_t = current_block * block_size
-    end_t = min((current_block + 1) * block_size, num_ts)
-    current_binary_t_range = list(range(start_t, end_t))
-    lp.current_binary_t_range = current_binary_t_range
-    # Llamar a solve con el nuevo rango
-    print(f"--------Resolviendo subproblema {current_block}--------")
-    print(f"Franjas de tiempo binarias: {current_binary_t_range}")
-    lp.solve()
+deadline_seconds = 900
+
+lp.solve_relax_and_fix(window_size=block_size, deadline_seconds=deadline_seconds)
 
 lp.validate_solution()
 